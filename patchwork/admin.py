@@ -23,6 +23,8 @@ from patchwork.models import SeriesReference
 from patchwork.models import State
 from patchwork.models import Tag
 from patchwork.models import UserProfile
+from patchwork.models import Webhook
+from patchwork.models import WebhookDelivery
 
 
 class UserProfileInline(admin.StackedInline):
@@ -190,3 +192,25 @@ class PatchRelationAdmin(admin.ModelAdmin):
 
 
 admin.site.register(PatchRelation, PatchRelationAdmin)
+
+
+class WebhookAdmin(admin.ModelAdmin):
+    list_display = ('url', 'project', 'categories', 'active',
+                    'last_event_id', 'failures', 'next_attempt')
+    list_filter = ('project', 'active')
+    list_select_related = ('project', )
+    readonly_fields = ('last_event_id', 'failures', 'next_attempt')
+
+
+admin.site.register(Webhook, WebhookAdmin)
+
+
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('webhook', 'date', 'first_event_id', 'last_event_id',
+                    'event_count', 'success', 'status')
+    list_filter = ('success', 'webhook')
+    list_select_related = ('webhook', )
+    date_hierarchy = 'date'
+
+
+admin.site.register(WebhookDelivery, WebhookDeliveryAdmin)
@@ -3,14 +3,23 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+import binascii
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
 from rest_framework import permissions
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.serializers import HyperlinkedIdentityField
 from rest_framework.serializers import HyperlinkedModelSerializer
+from rest_framework.utils.urls import remove_query_param
+from rest_framework.utils.urls import replace_query_param
 
 from patchwork.api import utils
 
@@ -22,10 +31,115 @@ class LinkHeaderPagination(PageNumberPagination):
 
        https://tools.ietf.org/html/rfc5988#section-5
        https://developer.github.com/guides/traversing-with-pagination
+
+    Pages are numbered by default. From API v1.3, if the ``cursor`` query
+    parameter is given, even if empty, resources with a date are instead
+    paginated using their position in the (date, id) order, or the reverse
+    if the requested order is descending. This avoids counting resources and
+    skipping those on earlier pages, so every page is as quick to retrieve
+    as the first.
     """
     page_size = settings.REST_RESULTS_PER_PAGE
     max_page_size = settings.MAX_REST_RESULTS_PER_PAGE
     page_size_query_param = 'per_page'
+    cursor_query_param = 'cursor'
+
+    cursor = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param not in request.query_params or
+                not utils.has_version(request, '1.3')):
+            return super(LinkHeaderPagination, self).paginate_queryset(
+                queryset, request, view)
+
+        try:
+            queryset.model._meta.get_field('date')
+        except FieldDoesNotExist:
+            return super(LinkHeaderPagination, self).paginate_queryset(
+                queryset, request, view)
+
+        self.request = request
+        self.cursor = self._decode_cursor(
+            request.query_params[self.cursor_query_param])
+        reverse, position = self.cursor
+
+        # the order requested is only used for its direction
+        order_by = queryset.query.order_by or queryset.model._meta.ordering
+        descending = bool(order_by) and order_by[0].startswith('-')
+
+        # when going back, we retrieve the previous page in reverse order
+        if reverse:
+            descending = not descending
+
+        if position:
+            date, pk = position
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{'date__' + lookup: date}) |
+                Q(date=date, **{'pk__' + lookup: pk}))
+
+        if descending:
+            queryset = queryset.order_by('-date', '-pk')
+        else:
+            queryset = queryset.order_by('date', 'pk')
+
+        page_size = self.get_page_size(request)
+        results = list(queryset[:page_size + 1])
+        more = len(results) > page_size
+        results = results[:page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = more
+        else:
+            self.has_next = more
+            self.has_previous = position is not None
+
+        self.results = results
+        return results
+
+    def _encode_cursor(self, reverse, obj):
+        value = '%d|%s|%d' % (reverse, obj.date.isoformat(), obj.pk)
+        return urlsafe_b64encode(value.encode('ascii')).decode('ascii')
+
+    def _decode_cursor(self, value):
+        if not value:
+            return False, None
+
+        try:
+            reverse, date, pk = urlsafe_b64decode(
+                value.encode('ascii')).decode('ascii').split('|')
+            date = parse_datetime(date)
+            if reverse not in ('0', '1') or date is None:
+                raise ValueError
+            return reverse == '1', (date, int(pk))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    def _get_cursor_link(self, reverse, obj):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self._encode_cursor(reverse, obj))
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return super(LinkHeaderPagination, self).get_next_link()
+
+        if not self.has_next or not self.results:
+            return None
+
+        return self._get_cursor_link(False, self.results[-1])
+
+    def get_previous_link(self):
+        if self.cursor is None:
+            return super(LinkHeaderPagination, self).get_previous_link()
+
+        if not self.has_previous or not self.results:
+            return None
+
+        return self._get_cursor_link(True, self.results[0])
 
     def get_paginated_response(self, data):
         next_url = self.get_next_link()
@@ -7,12 +7,19 @@ from django.http import Http404
 from django.http.request import QueryDict
 from django.shortcuts import get_object_or_404
 import rest_framework
+from rest_framework import status
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.generics import GenericAPIView
 from rest_framework.generics import ListCreateAPIView
 from rest_framework.generics import RetrieveAPIView
+from rest_framework.response import Response
+from rest_framework.serializers import ChoiceField
 from rest_framework.serializers import CurrentUserDefault
 from rest_framework.serializers import HiddenField
 from rest_framework.serializers import HyperlinkedModelSerializer
+from rest_framework.serializers import IntegerField
+from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import Serializer
 from rest_framework.serializers import ValidationError
 
 from patchwork.api.base import CheckHyperlinkedIdentityField
@@ -87,6 +94,24 @@ class CheckSerializer(HyperlinkedModelSerializer):
         }
 
 
+class CheckCreateSerializer(ModelSerializer):
+
+    patch = IntegerField(min_value=1)
+    state = ChoiceField(choices=[name for _, name in Check.STATE_CHOICES])
+
+    def validate_state(self, value):
+        return {name: state for state, name in Check.STATE_CHOICES}[value]
+
+    class Meta:
+        model = Check
+        fields = ('patch', 'state', 'target_url', 'context', 'description')
+
+
+class CheckListSerializer(Serializer):
+
+    checks = CheckCreateSerializer(many=True, allow_empty=False)
+
+
 class CheckMixin(object):
 
     serializer_class = CheckSerializer
@@ -126,3 +151,46 @@ class CheckDetail(CheckMixin, MultipleFieldLookupMixin, RetrieveAPIView):
 
     lookup_url_kwargs = ('patch_id', 'check_id')
     lookup_fields = ('patch_id', 'id')
+
+
+class CheckBulkCreate(GenericAPIView):
+    """
+    post:
+    Create checks for many patches at once.
+    """
+
+    serializer_class = CheckListSerializer
+
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise PermissionDenied()
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        checks = serializer.validated_data['checks']
+
+        patches = Patch.objects.select_related('project').in_bulk(
+            {check['patch'] for check in checks})
+        missing = {check['patch'] for check in checks} - set(patches)
+        if missing:
+            raise ValidationError({'checks': [
+                'Patch %d not found' % patch_id
+                for patch_id in sorted(missing)]})
+
+        # maintainers can add checks to any patch in their projects, so we
+        # only need to check individual patches for everyone else
+        maintained = set(request.user.profile.maintainer_projects.values_list(
+            'id', flat=True))
+        for patch in patches.values():
+            if patch.project_id not in maintained and not patch.is_editable(
+                    request.user):
+                raise PermissionDenied()
+
+        checks = Check.objects.create_checks([
+            Check(user=request.user, **dict(
+                check, patch=patches[check['patch']]))
+            for check in checks])
+
+        return Response(CheckSerializer(
+            checks, many=True, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED)
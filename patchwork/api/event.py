@@ -4,12 +4,38 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 from collections import OrderedDict
+import hashlib
+import logging
+import queue
+import threading
+import time
 
+from django.conf import settings
+from django.db import DatabaseError
+from django.db import close_old_connections
+from django.db import connection
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+from django.db.models import Sum
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import GenericAPIView
 from rest_framework.generics import ListAPIView
+from rest_framework.renderers import BaseRenderer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
 from rest_framework.serializers import SerializerMethodField
 from rest_framework.serializers import SlugRelatedField
 
+from patchwork.api import utils
 from patchwork.api.embedded import CheckSerializer
 from patchwork.api.embedded import CoverSerializer
 from patchwork.api.embedded import PatchSerializer
@@ -18,8 +44,18 @@ from patchwork.api.embedded import ProjectSerializer
 from patchwork.api.embedded import SeriesSerializer
 from patchwork.api.embedded import UserSerializer
 from patchwork.api.filters import EventFilterSet
+from patchwork.api.filters import EventStreamFilterSet
 from patchwork.models import Event
 
+logger = logging.getLogger(__name__)
+
+# How many seconds to wait before sending a comment to an idle stream, so
+# that proxies don't close the connection?
+KEEPALIVE_INTERVAL = 15
+
+# How many events can be waiting to be sent to a stream before it's closed?
+MAX_PENDING_EVENTS = 1000
+
 
 class EventSerializer(ModelSerializer):
 
@@ -87,12 +123,343 @@ class EventList(ListAPIView):
     serializer_class = EventSerializer
     filter_class = filterset_class = EventFilterSet
     page_size_query_param = None  # fixed page size
-    ordering_fields = ('date',)
+    ordering_fields = ('date', 'id')
     ordering = '-date'
 
+    def get_etag(self, queryset):
+        """Return an ETag for a list of events.
+
+        Events are never changed once created, so a list only changes when
+        events matching it are created or deleted. New events usually have a
+        greater ID than any existing event, but can become visible out of
+        order of ID, though only while they're unsettled. Old events are
+        deleted by pruning, oldest first. The response is therefore
+        identified by the greatest and lowest IDs of the events matching the
+        request, along with the number, greatest ID and sum of the IDs of
+        those that are unsettled. The sum changes when an event becomes
+        visible late, even if another settles at the same time. These are
+        all retrieved by a single aggregate query. Pruning events of one
+        category before others isn't noticed by lists of all categories,
+        until they change otherwise.
+        """
+        request = self.request
+        unsettled = Q(date__gte=Event.get_settled_date())
+        ids = queryset.order_by().aggregate(
+            Min('id'), Max('id'),
+            unsettled_count=Count('id', filter=unsettled),
+            unsettled_max=Max('id', filter=unsettled),
+            unsettled_sum=Sum('id', filter=unsettled))
+
+        value = '%s\n%s\n%s\n%s\n%s\n%s\n%s\n%s' % (
+            request.version, request.accepted_media_type,
+            request.get_full_path(), ids['id__min'], ids['id__max'],
+            ids['unsettled_count'], ids['unsettled_max'],
+            ids['unsettled_sum'])
+        return quote_etag(hashlib.sha1(value.encode('utf-8')).hexdigest())
+
+    def list(self, request, *args, **kwargs):
+        if not utils.has_version(request, '1.3'):
+            return super(EventList, self).list(request, *args, **kwargs)
+
+        etag = self.get_etag(self.filter_queryset(self.get_queryset()))
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+
+        response = super(EventList, self).list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
     def get_queryset(self):
         return Event.objects.all()\
             .prefetch_related('project', 'patch__project', 'series__project',
                               'cover', 'previous_state', 'current_state',
                               'previous_delegate', 'current_delegate',
                               'created_check')
+
+
+def load_events(queryset):
+    """Retrieve events, with everything needed to serialize them.
+
+    This is for when events are serialized outside of the event list, such
+    as when streaming them.
+    """
+    events = list(queryset.select_related(
+        'project', 'patch__project', 'series__project', 'cover__project',
+        'previous_state', 'current_state', 'previous_delegate',
+        'current_delegate', 'created_check__patch', 'actor'))
+
+    # relations are rarely changed, so we avoid prefetching their patches
+    # for every other event
+    prefetch_related_objects(
+        [event for event in events
+         if event.category == Event.CATEGORY_PATCH_RELATION_CHANGED],
+        'previous_relation__patches__project',
+        'current_relation__patches__project')
+
+    return events
+
+
+class EventSubscriber(object):
+    """A stream waiting for events from an 'EventBroadcaster'."""
+
+    def __init__(self, projects=None, category=None):
+        self.projects = projects
+        self.category = category
+        self.events = queue.Queue(MAX_PENDING_EVENTS)
+        self.overflowed = False
+
+    def matches(self, event):
+        if self.projects and event.project_id not in self.projects:
+            return False
+
+        if self.category and event.category != self.category:
+            return False
+
+        return True
+
+    def publish(self, events):
+        for event in events:
+            if not self.matches(event):
+                continue
+
+            try:
+                self.events.put_nowait(event)
+            except queue.Full:
+                # the client isn't keeping up, so we end the stream. The
+                # client can resume from the last event it received
+                self.overflowed = True
+                return
+
+    def get(self, timeout):
+        return self.events.get(timeout=timeout)
+
+
+class EventBroadcaster(object):
+    """Poll for new events and publish them to subscribed streams.
+
+    Events can be created by any process, such as those parsing mail, so
+    rather than relying on signals, a thread polls for events. Events can
+    become visible out of order of ID, so rather than polling for events
+    after the last one published, each poll re-checks the unsettled events
+    for any that haven't been published yet. There is one thread per
+    process, so each poll costs the same queries however many streams are
+    open. The thread is started when a stream first waits for events and
+    stops once no streams remain.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.thread = None
+        # the IDs of the unsettled events that have been published
+        self.published = set()
+
+    def subscribe(self, subscriber):
+        """Subscribe a stream to new events.
+
+        Returns:
+            False if the process is already serving the maximum number of
+            streams, else True.
+        """
+        with self.lock:
+            if len(self.subscribers) >= settings.EVENT_STREAM_MAX_STREAMS:
+                return False
+
+            if not self.subscribers and self.thread is None:
+                # only events created from now on are published
+                self.published = set(
+                    Event.objects.unsettled().order_by().values_list(
+                        'id', flat=True))
+
+            self.subscribers.add(subscriber)
+
+        return True
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+
+            self.thread = threading.Thread(
+                target=self.run, name='patchwork-events', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(settings.EVENT_STREAM_INTERVAL)
+
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    break
+
+            close_old_connections()
+            try:
+                self.poll()
+            except DatabaseError:
+                logger.exception('Failed to poll for events')
+
+        connection.close()
+
+    def poll(self):
+        """Publish any events that have become visible since the last poll.
+        """
+        ids = set(Event.objects.unsettled().order_by().values_list(
+            'id', flat=True))
+        new_ids = ids - self.published
+        # settled events won't be seen again, so needn't be remembered
+        self.published = ids
+        if not new_ids:
+            return
+
+        events = load_events(Event.objects.filter(
+            id__in=new_ids).order_by('id'))
+
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            subscriber.publish(events)
+
+
+broadcaster = EventBroadcaster()
+
+
+class EventStreamUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        'Too many event streams are open. Try again later or poll the event '
+        'list instead.'
+    )
+
+
+class EventStreamRenderer(BaseRenderer):
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # this is only used for errors, as events are streamed by the view
+        return b'event: error\ndata: %s\n\n' % JSONRenderer().render(data)
+
+
+class EventStream(GenericAPIView):
+    """Stream events as they are created.
+
+    Events are sent as server-sent events, using the same format as the
+    event list. Streams are closed after 'EVENT_STREAM_TIMEOUT' seconds and
+    clients should then reconnect, giving the ID of the last event received
+    in the 'Last-Event-ID' header or 'after_id' parameter to resume. Events
+    before this that are unsettled are sent again, in case any became
+    visible after the previous stream ended, so clients should ignore events
+    they have already received.
+
+    Each stream occupies a thread of the WSGI server until it's closed, so
+    each process serves at most 'EVENT_STREAM_MAX_STREAMS' streams at once.
+    The database connection is released once older events have been sent.
+    """
+
+    serializer_class = EventSerializer
+    renderer_classes = (EventStreamRenderer, JSONRenderer)
+    pagination_class = None
+
+    def get_queryset(self):
+        return Event.objects.all()
+
+    def get(self, request, *args, **kwargs):
+        data = request.query_params.copy()
+        if 'HTTP_LAST_EVENT_ID' in request.META:
+            data['after_id'] = request.META['HTTP_LAST_EVENT_ID']
+
+        filterset = EventStreamFilterSet(
+            data, self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        projects = filterset.form.cleaned_data.get('project')
+        subscriber = EventSubscriber(
+            projects={project.id for project in projects or []},
+            category=filterset.form.cleaned_data.get('category'))
+
+        # we subscribe before retrieving older events so nothing is missed
+        if not broadcaster.subscribe(subscriber):
+            raise EventStreamUnavailable()
+
+        response = StreamingHttpResponse(
+            self.stream(subscriber, filterset),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # prevent nginx buffering events
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def render_event(self, event):
+        data = JSONRenderer().render(self.get_serializer(event).data)
+        return b'id: %d\nevent: %s\ndata: %s\n\n' % (
+            event.id, event.category.encode('utf-8'), data)
+
+    def stream(self, subscriber, filterset):
+        deadline = time.monotonic() + settings.EVENT_STREAM_TIMEOUT
+        last_id = filterset.form.cleaned_data.get('after_id')
+        settled_date = Event.get_settled_date()
+        # the IDs of the unsettled events sent, which may also be published
+        sent = set()
+
+        try:
+            if last_id is not None:
+                # unsettled events before the last one received may have
+                # become visible since
+                for event in load_events(filterset.qs.filter(
+                        id__lte=last_id, date__gte=settled_date).order_by(
+                            'id')):
+                    sent.add(event.id)
+                    yield self.render_event(event)
+
+            # older events are retrieved in chunks, as there may be many
+            chunk_size = settings.MAX_REST_RESULTS_PER_PAGE
+            while last_id is not None:
+                events = load_events(filterset.qs.filter(
+                    id__gt=last_id).order_by('id')[:chunk_size])
+
+                for event in events:
+                    last_id = event.id
+                    if event.date >= settled_date:
+                        sent.add(event.id)
+                    yield self.render_event(event)
+
+                if len(events) < chunk_size:
+                    break
+
+            # new events are retrieved by the broadcaster, so release the
+            # connection rather than holding it while the stream is open. It
+            # can't be released in a transaction, as when testing
+            if not connection.in_atomic_block:
+                connection.close()
+
+            while not subscriber.overflowed:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                broadcaster.start()
+
+                try:
+                    event = subscriber.get(min(timeout, KEEPALIVE_INTERVAL))
+                except queue.Empty:
+                    yield b': keepalive\n\n'
+                    continue
+
+                # we may have already sent this with the older events
+                if event.id in sent:
+                    continue
+
+                yield self.render_event(event)
+        finally:
+            broadcaster.unsubscribe(subscriber)
@@ -11,6 +11,8 @@ from django_filters.rest_framework import FilterSet
 from django_filters import CharFilter
 from django_filters import IsoDateTimeFilter
 from django_filters import ModelMultipleChoiceFilter
+from django_filters import MultipleChoiceFilter
+from django_filters import NumberFilter
 from django.forms import ModelMultipleChoiceField as BaseMultipleChoiceField
 from django.forms.widgets import MultipleHiddenInput
 from rest_framework import exceptions
@@ -174,20 +176,44 @@ class TimestampMixin(BaseFilterSet):
     since = IsoDateTimeFilter(lookup_expr='gte', field_name='date')
 
 
+def check_filter(queryset, name, value):
+    if not value:
+        return queryset
+
+    states = {name: state for state, name in Check.STATE_CHOICES}
+    return queryset.filter(check_state__in=[states[x] for x in value])
+
+
 class SeriesFilterSet(TimestampMixin, BaseFilterSet):
 
     submitter = PersonFilter(queryset=Person.objects.all(), distinct=False)
     project = ProjectFilter(queryset=Project.objects.all(), distinct=False)
+    check = MultipleChoiceFilter(
+        choices=[(name, name) for _, name in Check.STATE_CHOICES],
+        method=check_filter)
 
     class Meta:
         model = Series
-        fields = ('submitter', 'project')
+        fields = ('submitter', 'project', 'check')
+        versioned_fields = {
+            '1.3': ('check',),
+        }
 
 
 def msgid_filter(queryset, name, value):
     return queryset.filter(**{name: '<' + value + '>'})
 
 
+def hash_filter(queryset, name, value):
+    # hashes are stored in lowercase, so an exact match can use the index
+    # where a case-insensitive one can't
+    return queryset.filter(**{name: value.lower()})
+
+
+def path_filter(queryset, name, value):
+    return queryset.touching(value)
+
+
 class CoverFilterSet(TimestampMixin, BaseFilterSet):
 
     project = ProjectFilter(queryset=Project.objects.all(), distinct=False)
@@ -213,8 +239,12 @@ class PatchFilterSet(TimestampMixin, BaseFilterSet):
     submitter = PersonFilter(queryset=Person.objects.all(), distinct=False)
     delegate = UserFilter(queryset=User.objects.all(), distinct=False)
     state = StateFilter(queryset=State.objects.all(), distinct=False)
-    hash = CharFilter(lookup_expr='iexact')
+    hash = CharFilter(method=hash_filter)
     msgid = CharFilter(method=msgid_filter)
+    path = CharFilter(method=path_filter)
+    check = MultipleChoiceFilter(
+        choices=[(name, name) for _, name in Check.STATE_CHOICES],
+        method=check_filter)
 
     class Meta:
         model = Patch
@@ -223,9 +253,10 @@ class PatchFilterSet(TimestampMixin, BaseFilterSet):
         # The best I can come up with is manually working with request.GET
         # which seems to rather defeat the point of using django-filters.
         fields = ('project', 'series', 'submitter', 'delegate',
-                  'state', 'archived', 'hash', 'msgid')
+                  'state', 'archived', 'hash', 'msgid', 'path', 'check')
         versioned_fields = {
             '1.2': ('hash', 'msgid'),
+            '1.3': ('path', 'check'),
         }
 
 
@@ -238,6 +269,20 @@ class CheckFilterSet(TimestampMixin, BaseFilterSet):
         fields = ('user', 'state', 'context')
 
 
+def after_id_filter(queryset, name, value):
+    # events can become visible out of order of ID, as this is assigned when
+    # they're inserted rather than when they're committed, so we only return
+    # settled events. Clients can then poll using the greatest ID seen
+    # without missing events that are committed late
+    return queryset.settled().filter(**{'%s__gt' % name: value})
+
+
+def after_id_stream_filter(queryset, name, value):
+    # the stream retrieves events after this itself, as it must also check
+    # for unsettled events before it
+    return queryset
+
+
 class EventFilterSet(TimestampMixin, BaseFilterSet):
 
     # NOTE(stephenfin): We disable the select-based HTML widgets for these
@@ -255,15 +300,32 @@ class EventFilterSet(TimestampMixin, BaseFilterSet):
     cover = BaseFilter(queryset=Cover.objects.all(),
                        widget=MultipleHiddenInput,
                        distinct=False)
+    after_id = NumberFilter(field_name='id', method=after_id_filter)
 
     class Meta:
         model = Event
-        fields = ('project', 'category', 'series', 'patch', 'cover', 'actor')
+        fields = ('project', 'category', 'series', 'patch', 'cover', 'actor',
+                  'after_id')
         versioned_fields = {
             '1.2': ('actor', ),
+            '1.3': ('after_id', ),
         }
 
 
+class EventStreamFilterSet(BaseFilterSet):
+
+    # NOTE(stephenfin): We disable the select-based HTML widgets for these
+    # filters as the resulting query is _huge_
+    project = ProjectFilter(queryset=Project.objects.all(),
+                            widget=MultipleHiddenInput,
+                            distinct=False)
+    after_id = NumberFilter(field_name='id', method=after_id_stream_filter)
+
+    class Meta:
+        model = Event
+        fields = ('project', 'category', 'after_id')
+
+
 class BundleFilterSet(BaseFilterSet):
 
     project = ProjectFilter(queryset=Project.objects.all(), distinct=False)
@@ -19,6 +19,7 @@ from rest_framework.relations import RelatedField
 from rest_framework.reverse import reverse
 from rest_framework.serializers import SerializerMethodField
 
+from patchwork.api import utils
 from patchwork.api.base import BaseHyperlinkedModelSerializer
 from patchwork.api.base import PatchworkPermission
 from patchwork.api.filters import PatchFilterSet
@@ -27,6 +28,7 @@ from patchwork.api.embedded import PersonSerializer
 from patchwork.api.embedded import ProjectSerializer
 from patchwork.api.embedded import SeriesSerializer
 from patchwork.api.embedded import UserSerializer
+from patchwork.models import defer_events
 from patchwork.models import Patch
 from patchwork.models import PatchRelation
 from patchwork.models import State
@@ -105,9 +107,16 @@ class PatchListSerializer(BaseHyperlinkedModelSerializer):
             reverse('api-check-list', kwargs={'patch_id': instance.id}))
 
     def get_tags(self, instance):
-        # TODO(stephenfin): Make tags performant, possibly by reworking the
-        # model
-        return {}
+        if not utils.has_version(self.context.get('request'), '1.3'):
+            return {}
+
+        # avoid loading the project's tags if there's nothing to count
+        if not instance.tag_counts:
+            return {}
+
+        counts = {tag.name: instance.get_tag_count(tag)
+                  for tag in instance.project.tags}
+        return {name: count for name, count in counts.items() if count}
 
     def validate_delegate(self, value):
         """Check that the delgate is a maintainer of the patch's project."""
@@ -243,14 +252,15 @@ class PatchDetailSerializer(PatchListSerializer):
                 raise PatchConflict()
 
         # apply
-        if relation is None:
-            relation = PatchRelation()
-            relation.save()
-        for patch in patches:
-            patch.related = relation
-            patch.save()
-        instance.related = relation
-        instance.save()
+        with defer_events():
+            if relation is None:
+                relation = PatchRelation()
+                relation.save()
+            for patch in patches:
+                patch.related = relation
+                patch.save()
+            instance.related = relation
+            instance.save()
 
         return super(PatchDetailSerializer, self).update(
             instance, validated_data)
@@ -292,7 +302,7 @@ class PatchList(ListAPIView):
         # particular attention to cases with filtering
         return Patch.objects.all()\
             .prefetch_related(
-                'check_set', 'delegate', 'project', 'series__project',
+                'delegate', 'project', 'series__project',
                 'related__patches__project')\
             .select_related('state', 'submitter', 'series')\
             .defer('content', 'diff', 'headers')
@@ -314,6 +324,6 @@ class PatchDetail(RetrieveUpdateAPIView):
 
     def get_queryset(self):
         return Patch.objects.all()\
-            .prefetch_related('check_set', 'related__patches__project')\
+            .prefetch_related('related__patches__project')\
             .select_related('project', 'state', 'submitter', 'delegate',
                             'series')
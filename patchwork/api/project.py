@@ -4,14 +4,22 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 from django.shortcuts import get_object_or_404
+from rest_framework.generics import GenericAPIView
 from rest_framework.generics import ListAPIView
 from rest_framework.generics import RetrieveUpdateAPIView
+from rest_framework.response import Response
 from rest_framework.serializers import CharField
+from rest_framework.serializers import RegexField
+from rest_framework.serializers import Serializer
+from rest_framework.serializers import ValidationError
 
 from patchwork.api.base import BaseHyperlinkedModelSerializer
 from patchwork.api.base import PatchworkPermission
+from patchwork.api.embedded import PatchSerializer
 from patchwork.api.embedded import UserProfileSerializer
+from patchwork.api.patch import StateField
 from patchwork.models import Project
+from patchwork.models import State
 
 
 class ProjectSerializer(BaseHyperlinkedModelSerializer):
@@ -40,6 +48,29 @@ class ProjectSerializer(BaseHyperlinkedModelSerializer):
         }
 
 
+class CommitSerializer(Serializer):
+
+    commit = CharField(max_length=255)
+    hash = RegexField(r'^[0-9a-fA-F]{40}$', max_length=40)
+    patches = PatchSerializer(many=True, read_only=True)
+
+
+class CommitListSerializer(Serializer):
+
+    state = StateField(required=False)
+    commits = CommitSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        if 'state' not in data:
+            try:
+                data['state'] = State.objects.get(slug='accepted')
+            except State.DoesNotExist:
+                raise ValidationError({'state': [
+                    "There is no 'accepted' state, so a state is required."]})
+
+        return data
+
+
 class ProjectMixin(object):
 
     permission_classes = (PatchworkPermission,)
@@ -90,3 +121,28 @@ class ProjectDetail(ProjectMixin, RetrieveUpdateAPIView):
     """
 
     pass
+
+
+class ProjectCommits(ProjectMixin, GenericAPIView):
+    """
+    post:
+    Mark the patches matching a list of commits as committed.
+    """
+
+    serializer_class = CommitListSerializer
+
+    def post(self, request, *args, **kwargs):
+        project = self.get_object()
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = project.patch_set.set_commits(
+            [(commit['commit'], commit['hash'])
+             for commit in serializer.validated_data['commits']],
+            serializer.validated_data['state'], request.user)
+
+        return Response(CommitSerializer(
+            [{'commit': commit, 'hash': hash, 'patches': patches}
+             for commit, hash, patches in results],
+            many=True, context=self.get_serializer_context()).data)
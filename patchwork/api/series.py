@@ -5,8 +5,10 @@
 
 from rest_framework.generics import ListAPIView
 from rest_framework.generics import RetrieveAPIView
+from rest_framework.serializers import HyperlinkedIdentityField
 from rest_framework.serializers import SerializerMethodField
 
+from patchwork.api import utils
 from patchwork.api.base import BaseHyperlinkedModelSerializer
 from patchwork.api.base import PatchworkPermission
 from patchwork.api.filters import SeriesFilterSet
@@ -14,6 +16,7 @@ from patchwork.api.embedded import CoverSerializer
 from patchwork.api.embedded import PatchSerializer
 from patchwork.api.embedded import PersonSerializer
 from patchwork.api.embedded import ProjectSerializer
+from patchwork.models import Check
 from patchwork.models import Series
 
 
@@ -25,6 +28,7 @@ class SeriesSerializer(BaseHyperlinkedModelSerializer):
     mbox = SerializerMethodField()
     cover_letter = CoverSerializer(read_only=True)
     patches = PatchSerializer(read_only=True, many=True)
+    check = SerializerMethodField()
 
     def get_web_url(self, instance):
         request = self.context.get('request')
@@ -34,31 +38,71 @@ class SeriesSerializer(BaseHyperlinkedModelSerializer):
         request = self.context.get('request')
         return request.build_absolute_uri(instance.get_mbox_url())
 
+    def get_check(self, instance):
+        # series are only annotated with this for API v1.3, as the field is
+        # dropped for older versions
+        if not hasattr(instance, 'check_state'):
+            return None
+
+        return dict(Check.STATE_CHOICES)[instance.check_state]
+
     class Meta:
         model = Series
         fields = ('id', 'url', 'web_url', 'project', 'name', 'date',
                   'submitter', 'version', 'total', 'received_total',
-                  'received_all', 'mbox', 'cover_letter', 'patches')
+                  'received_all', 'mbox', 'cover_letter', 'patches', 'check')
         read_only_fields = ('date', 'submitter', 'total', 'received_total',
-                            'received_all', 'mbox', 'cover_letter', 'patches')
+                            'received_all', 'mbox', 'cover_letter', 'patches',
+                            'check')
         versioned_fields = {
             '1.1': ('web_url', ),
+            '1.3': ('check', ),
         }
         extra_kwargs = {
             'url': {'view_name': 'api-series-detail'},
         }
 
 
+class SeriesCheckSerializer(BaseHyperlinkedModelSerializer):
+
+    url = HyperlinkedIdentityField('api-series-checks')
+    series = HyperlinkedIdentityField('api-series-detail')
+    state = SerializerMethodField()
+    total = SerializerMethodField()
+    counts = SerializerMethodField()
+
+    def get_state(self, instance):
+        return dict(Check.STATE_CHOICES)[instance.check_state]
+
+    def get_total(self, instance):
+        return sum(self.get_counts(instance).values())
+
+    def get_counts(self, instance):
+        return {name: getattr(instance, 'patches_%s' % name)
+                for _, name in Check.STATE_CHOICES}
+
+    class Meta:
+        model = Series
+        fields = ('id', 'url', 'series', 'state', 'total', 'counts')
+        read_only_fields = fields
+
+
 class SeriesMixin(object):
 
     permission_classes = (PatchworkPermission,)
     serializer_class = SeriesSerializer
 
     def get_queryset(self):
-        return Series.objects.all()\
+        queryset = Series.objects.all()\
             .prefetch_related('patches__project', 'cover_letter__project')\
             .select_related('submitter', 'project')
 
+        # only needed for the 'check' field and filter
+        if utils.has_version(self.request, '1.3'):
+            queryset = queryset.with_check_state()
+
+        return queryset
+
 
 class SeriesList(SeriesMixin, ListAPIView):
     """List series."""
@@ -73,3 +117,13 @@ class SeriesDetail(SeriesMixin, RetrieveAPIView):
     """Show a series."""
 
     pass
+
+
+class SeriesChecks(RetrieveAPIView):
+    """Show the combined state of the checks of a series' patches."""
+
+    permission_classes = (PatchworkPermission,)
+    serializer_class = SeriesCheckSerializer
+
+    def get_queryset(self):
+        return Series.objects.with_check_state().only('id')
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Send a mail read from stdin to the 'parsemaild' daemon.
+
+This is a replacement for 'parsemail.sh' that avoids starting Django for
+every mail. It deliberately depends on nothing but the standard library
+so it starts quickly. The exit code is the one 'parsemail' would have
+used or, if the daemon can't be reached, EX_TEMPFAIL so the mail server
+will try to deliver the mail again later.
+"""
+
+import argparse
+import os
+import socket
+import sys
+
+# This must match the default used by the 'parsemaild' command
+DEFAULT_SOCKET = '/run/patchwork/parsemail.sock'
+
+# Mail servers will retry delivery for this exit code. Refer to sysexits.h
+EX_TEMPFAIL = 75
+
+# How many seconds to wait for the daemon to parse the mail?
+TIMEOUT = 300
+
+
+def send_mail(path, data, list_id=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+
+    with sock:
+        sock.connect(path)
+        sock.sendall((list_id or '').encode('utf-8') + b'\n')
+        sock.sendall(data)
+        sock.shutdown(socket.SHUT_WR)
+
+        with sock.makefile('rb') as rfile:
+            return int(rfile.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--socket',
+        default=os.environ.get('PW_PARSEMAIL_SOCKET', DEFAULT_SOCKET),
+        help='path of the UNIX socket the daemon is listening on. Defaults '
+        'to $PW_PARSEMAIL_SOCKET or %s.' % DEFAULT_SOCKET)
+    parser.add_argument(
+        '--list-id',
+        help='mailing list ID. If not supplied, this will be extracted from '
+        'the mail headers.')
+    args = parser.parse_args()
+
+    data = sys.stdin.buffer.read()
+
+    try:
+        return send_mail(args.socket, data, args.list_id)
+    except (OSError, ValueError) as exc:
+        sys.stderr.write('Failed to send mail to parsemaild: %s\n' % exc)
+        return EX_TEMPFAIL
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,7 @@ from django.contrib.auth.models import User
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 
+from patchwork.models import PatchFile
 from patchwork.models import Person
 from patchwork.models import Series
 from patchwork.models import State
@@ -304,6 +305,46 @@ class SearchFilter(Filter):
                          (self.param, value))
 
 
+class PathFilter(Filter):
+    name = 'Path'
+    param = 'path'
+
+    def __init__(self, filters):
+        super(PathFilter, self).__init__(filters)
+        self.path = None
+
+    @property
+    def condition(self):
+        return self.path
+
+    @property
+    def key(self):
+        return self.path
+
+    @key.setter
+    def key(self, key):
+        key = key.strip()
+        if not key:
+            return
+
+        self.path = key
+        self.applied = True
+
+    @property
+    def kwargs(self):
+        return {'id__in': PatchFile.objects.matching(self.path).values(
+            'patch_id')}
+
+    @property
+    def form(self):
+        value = ''
+        if self.path:
+            value = escape(self.path)
+        return mark_safe('<input name="%s" class="form-control" '
+                         'placeholder="e.g. drivers/net/*" value="%s">' %
+                         (self.param, value))
+
+
 class ArchiveFilter(Filter):
     name = 'Archived'
     param = 'archive'
@@ -496,6 +537,7 @@ FILTERS = [
     SubmitterFilter,
     StateFilter,
     SearchFilter,
+    PathFilter,
     ArchiveFilter,
     DelegateFilter
 ]
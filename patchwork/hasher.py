@@ -7,58 +7,424 @@
 
 """Hash generation for diffs."""
 
+import argparse
+import collections
 import hashlib
+import io
+import json
+import multiprocessing
 import re
 import sys
 
 HUNK_RE = re.compile(r'^\@\@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? \@\@')
 FILENAME_RE = re.compile(r'^(---|\+\+\+) (\S+)')
+GIT_HEADER_RE = re.compile(r'^diff --git \S+ (\S+)')
+PREFIXES = ('-', '+', ' ')
+
+# The lines starting each commit in the output of 'git log' and 'git
+# format-patch', respectively
+COMMIT_RES = (
+    re.compile(r'^commit ([0-9a-f]{40})'),
+    re.compile(r'^From ([0-9a-f]{40}) '),
+)
+
+# The number of commits handed to a worker process at a time when hashing in
+# parallel
+HASH_CHUNK_SIZE = 32
+
+# The number of commits in each request body printed by '--json'
+REQUEST_BATCH_SIZE = 500
+
+
+class DiffConsumer(object):
+    """Consume a diff in chunks of lines.
+
+    Whitespace is normalised as if the entire diff had been stripped
+    before being split into lines, so that subclasses see the same lines
+    whether a diff is provided all at once or in chunks. Subclasses
+    should implement ``consume``, which is called with lists of
+    non-empty, normalised lines, without their trailing newlines.
+    """
+
+    def __init__(self):
+        self._started = False
+        # the last line with content and any whitespace-only lines that
+        # follow it. These are held back until we know whether they're
+        # trailing whitespace
+        self._held = []
+
+    def consume(self, lines):
+        raise NotImplementedError
+
+    def update(self, lines):
+        """Add lines of the diff, with or without their trailing newlines.
+        """
+        started = self._started
+        normalised = self._held
+
+        for line in lines:
+            if '\r' in line:
+                line = line.replace('\r', '')
+            if line.endswith('\n'):
+                line = line[:-1]
+
+            if not line:
+                continue
+
+            if not started:  # leading whitespace
+                line = line.lstrip()
+                if not line:
+                    continue
+                started = True
+
+            normalised.append(line)
+
+        self._started = started
+
+        last = len(normalised) - 1
+        while last > 0 and normalised[last].isspace():
+            last -= 1
+
+        self._held = normalised[last:]
+        if last > 0:
+            self.consume(normalised[:last])
+
+    def finish(self):
+        """Flush any remaining lines.
+
+        This must be called once the entire diff has been added.
+        """
+        if self._held:
+            self.consume([self._held[0].rstrip()])
+            self._held = []
+
+
+def _normalise_filename(match):
+    """Normalise a ---/+++ line, dropping -p1 top-directories."""
+    if match.group(1) == '---':
+        filename = 'a/'
+    else:
+        filename = 'b/'
+    filename += '/'.join(match.group(2).split('/')[1:])
+
+    return match.group(1) + ' ' + filename
+
+
+def _hunk_counts(match):
+    """Return the old and new line counts from a hunk header."""
+    def fn(x):
+        if not x:
+            return 1
+        return int(x)
+
+    return [fn(x) for x in match.groups()]
+
+
+class DiffHasher(DiffConsumer):
+    """Generate a hash from a diff, in chunks of lines."""
+
+    def __init__(self):
+        super(DiffHasher, self).__init__()
+        self._hash = hashlib.sha1()
+
+    def consume(self, lines):
+        hashed = []
+
+        for line in lines:
+            # avoid matching every line against the regexes as this is slow
+            if line.startswith(('--- ', '+++ ')):
+                filename_match = FILENAME_RE.match(line)
+                if filename_match:
+                    line = _normalise_filename(filename_match)
+            elif line[0] == '@':
+                hunk_match = HUNK_RE.match(line)
+                if not hunk_match:
+                    # other lines are ignored
+                    continue
+
+                # remove line numbers, but leave line counts
+                line = '@@ -%d +%d @@' % tuple(_hunk_counts(hunk_match))
+            elif line[0] not in PREFIXES:
+                # other lines are ignored. +, - and context lines are left
+                # as-is
+                continue
+
+            hashed.append(line + '\n')
+
+        self._hash.update(''.join(hashed).encode('utf-8'))
+
+    def hexdigest(self):
+        self.finish()
+        return self._hash.hexdigest()
+
+
+class DiffAnalyser(DiffHasher):
+    """Analyse a diff, in chunks of lines.
+
+    This generates the same hash as ``DiffHasher`` while also finding
+    the files changed by the diff and the number of lines added to and
+    removed from each, so that a diff only needs to be scanned once.
+    """
+
+    def __init__(self):
+        super(DiffAnalyser, self).__init__()
+        self._filenames = set()
+        # a mapping of filename to a list of [insertions, deletions], in
+        # the order the files appear in the diff. Unlike 'filenames', this
+        # includes files with no content changes
+        self.files = collections.OrderedDict()
+        self._old_filename = None
+        self._counts = None
+        # the old and new lines remaining in the current hunk
+        self._remaining = [0, 0]
+
+    def consume(self, lines):
+        hashed = []
+        counts = self._counts
+        remaining = self._remaining
+
+        for line in lines:
+            first = line[0]
+
+            # hunk content. Unlike the hash and filenames, which must
+            # remain stable, this is tracked using the hunk line counts so
+            # removed lines like '-- foo' aren't mistaken for headers
+            if remaining[0] > 0 or remaining[1] > 0:
+                if first == '-':
+                    remaining[0] -= 1
+                    counts[1] += 1
+                elif first == '+':
+                    remaining[1] -= 1
+                    counts[0] += 1
+                elif first == ' ':
+                    remaining[0] -= 1
+                    remaining[1] -= 1
+                elif first != '\\':
+                    # the hunk was truncated, e.g. by a mail client
+                    # stripping empty context lines
+                    remaining = [0, 0]
+
+                in_hunk = remaining[0] > 0 or remaining[1] > 0 or \
+                    first in PREFIXES
+            else:
+                in_hunk = False
+
+            if line.startswith(('--- ', '+++ ')):
+                filename_match = FILENAME_RE.match(line)
+                if filename_match:
+                    filename = filename_match.group(2)
+                    if filename.startswith('/dev/null'):
+                        filename = None
+                    else:
+                        filename = '/'.join(filename.split('/')[1:])
+                        self._filenames.add(filename)
+
+                    if in_hunk:
+                        pass
+                    elif filename_match.group(1) == '---':
+                        self._old_filename = filename
+                    else:
+                        if filename is None:
+                            filename = self._old_filename
+                        if filename is not None:
+                            counts = self.files.setdefault(filename, [0, 0])
+                        else:
+                            counts = None
+
+                    line = _normalise_filename(filename_match)
+            elif first == '@':
+                hunk_match = HUNK_RE.match(line)
+                if not hunk_match:
+                    continue
+
+                line_nos = _hunk_counts(hunk_match)
+                if counts is not None:
+                    remaining = list(line_nos)
+                line = '@@ -%d +%d @@' % tuple(line_nos)
+            elif first not in PREFIXES:
+                # files with no content changes, such as empty new files
+                # and mode changes, only have a git header
+                if first == 'd':
+                    header_match = GIT_HEADER_RE.match(line)
+                    if header_match:
+                        filename = '/'.join(
+                            header_match.group(1).split('/')[1:])
+                        counts = self.files.setdefault(filename, [0, 0])
+                continue
+
+            hashed.append(line + '\n')
+
+        self._counts = counts
+        self._remaining = remaining
+        self._hash.update(''.join(hashed).encode('utf-8'))
+
+    @property
+    def filenames(self):
+        """The files changed by the diff, sorted by name."""
+        self.finish()
+        return sorted(self._filenames)
+
+    @property
+    def insertions(self):
+        self.finish()
+        return sum(counts[0] for counts in self.files.values())
+
+    @property
+    def deletions(self):
+        self.finish()
+        return sum(counts[1] for counts in self.files.values())
 
 
 def hash_diff(diff):
     """Generate a hash from a diff."""
+    hasher = DiffHasher()
+    hasher.update(diff.split('\n'))
 
-    # normalise spaces
-    diff = diff.replace('\r', '')
-    diff = diff.strip() + '\n'
+    return hasher.hexdigest()
 
-    prefixes = ['-', '+', ' ']
-    hashed = hashlib.sha1()
 
-    for line in diff.split('\n'):
-        if len(line) <= 0:
-            continue
+def analyse_diff(diff):
+    """Generate a hash, list of files and diffstat from a diff.
+
+    Returns:
+        A ``DiffAnalyser`` that the entire diff has been fed to.
+    """
+    analyser = DiffAnalyser()
+    analyser.update(diff.split('\n'))
+    analyser.finish()
 
-        hunk_match = HUNK_RE.match(line)
-        filename_match = FILENAME_RE.match(line)
+    return analyser
 
-        if filename_match:
-            # normalise -p1 top-directories
-            if filename_match.group(1) == '---':
-                filename = 'a/'
-            else:
-                filename = 'b/'
-            filename += '/'.join(filename_match.group(2).split('/')[1:])
-
-            line = filename_match.group(1) + ' ' + filename
-        elif hunk_match:
-            # remove line numbers, but leave line counts
-            def fn(x):
-                if not x:
-                    return 1
-                return int(x)
-            line_nos = list(map(fn, hunk_match.groups()))
-            line = '@@ -%d +%d @@' % tuple(line_nos)
-        elif line[0] in prefixes:
-            # if we have a +, - or context line, leave as-is
-            pass
+
+def split_commits(lines):
+    """Split the output of 'git log -p' or 'git format-patch' into commits.
+
+    Only the lines used when hashing are kept: anything before the first
+    diff of each commit, such as the commit message, is dropped, as is
+    anything found between hunks other than '---', '+++' and '@@' lines,
+    such as the signature added by 'git format-patch'.
+
+    Args:
+        lines: An iterable of lines, such as a file.
+
+    Yields:
+        (commit, lines) tuples, where lines are the lines of the commit's
+        diff. Commits without a diff, such as merges, are skipped.
+    """
+    commit_res = COMMIT_RES
+    commit = None
+    diff = []
+    in_diff = False
+    # the number of old and new lines left in the current hunk
+    old = new = 0
+
+    for line in lines:
+        if old > 0 or new > 0:
+            diff.append(line)
+            if line.startswith('-'):
+                old -= 1
+            elif line.startswith('+'):
+                new -= 1
+            elif not line.startswith('\\'):
+                # context lines, including those stripped of their space
+                old -= 1
+                new -= 1
+            continue
+
+        for commit_re in commit_res:
+            match = commit_re.match(line)
+            if match:
+                break
         else:
-            # other lines are ignored
+            match = None
+
+        if match:
+            if diff:
+                yield commit, diff
+
+            # once we know the format, we only need to look for that
+            commit_res = (commit_re,)
+            commit = match.group(1)
+            diff = []
+            in_diff = False
             continue
 
-        hashed.update((line + '\n').encode('utf-8'))
+        if not in_diff:
+            if commit is None or not line.startswith('diff '):
+                continue
+            in_diff = True
+
+        # other lines are ignored when hashing, but keeping those found
+        # after the final hunk would stop trailing whitespace being stripped
+        if line.startswith('@@'):
+            hunk_match = HUNK_RE.match(line)
+            if hunk_match:
+                old, new = _hunk_counts(hunk_match)
+                diff.append(line)
+        elif line.startswith(('--- ', '+++ ')):
+            diff.append(line)
+
+    if diff:
+        yield commit, diff
 
-    return hashed.hexdigest()
+
+def _hash_commit(item):
+    commit, lines = item
+
+    hasher = DiffHasher()
+    hasher.update(lines)
+
+    return commit, hasher.hexdigest()
+
+
+def hash_commits(lines, jobs=1):
+    """Generate a hash for each commit in the output of 'git log -p'.
+
+    Refer to ``split_commits`` for the formats supported.
+
+    Args:
+        lines: An iterable of lines, such as a file.
+        jobs: The number of worker processes used to hash commits.
+
+    Yields:
+        (commit, hash) tuples, in the order the commits were found.
+    """
+    commits = split_commits(lines)
+
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            yield from pool.imap(_hash_commit, commits, HASH_CHUNK_SIZE)
+    else:
+        for item in commits:
+            yield _hash_commit(item)
+
+
+def commit_requests(commits, batch_size=REQUEST_BATCH_SIZE, state=None):
+    """Generate request bodies to mark commits' patches as committed.
+
+    The bodies are for the REST API's '/projects/{id}/commits/' endpoint.
+
+    Args:
+        commits: An iterable of (commit, hash) tuples.
+        batch_size: The maximum number of commits in each request body.
+        state: The slug of the state to set, if not 'accepted'.
+
+    Yields:
+        JSON request bodies, each on a single line.
+    """
+    data = {}
+    if state:
+        data['state'] = state
+
+    batch = []
+    for commit, hash in commits:
+        batch.append({'commit': commit, 'hash': hash})
+        if len(batch) >= batch_size:
+            yield json.dumps(dict(data, commits=batch))
+            batch = []
+
+    if batch:
+        yield json.dumps(dict(data, commits=batch))
 
 
 def main(args):
@@ -66,7 +432,54 @@ def main(args):
 
     This is required by scripts found in /tools
     """
-    print(hash_diff('\n'.join(sys.stdin.readlines())))
+    parser = argparse.ArgumentParser(
+        description='Generate the hash of a diff read from stdin.')
+    parser.add_argument(
+        '--log', action='store_true',
+        help="read the output of 'git log -p' or 'git format-patch --stdout' "
+        'and print the commit and the hash of its diff, separated by a tab, '
+        'for each commit')
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='number of worker processes used to hash commits when using '
+        '--log')
+    parser.add_argument(
+        '--json', action='store_true',
+        help='when using --log, print the commits as JSON request bodies for '
+        "the REST API's '/projects/{id}/commits/' endpoint instead, one per "
+        'line')
+    parser.add_argument(
+        '--batch-size', type=int, default=REQUEST_BATCH_SIZE,
+        help='maximum number of commits in each request body when using '
+        '--json')
+    parser.add_argument(
+        '--state',
+        help="state to set in each request body when using --json, if not "
+        "'accepted'")
+    args = parser.parse_args(args[1:])
+
+    if args.json and not args.log:
+        parser.error('--json can only be used with --log')
+
+    if not args.log:
+        print(hash_diff('\n'.join(sys.stdin.readlines())))
+        return
+
+    # a single undecodable line shouldn't prevent everything else being
+    # hashed
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                             errors='replace')
+    commits = hash_commits(stdin, args.jobs)
+
+    if args.json:
+        for body in commit_requests(commits, args.batch_size, args.state):
+            sys.stdout.write(body + '\n')
+            sys.stdout.flush()
+        return
+
+    for commit, hash in commits:
+        sys.stdout.write('%s\t%s\n' % (commit, hash))
+        sys.stdout.flush()
 
 
 if __name__ == '__main__':
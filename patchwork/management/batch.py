@@ -0,0 +1,177 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_datetime
+
+from patchwork.models import Patch
+from patchwork.models import Project
+
+
+def _parse_since(value):
+    since = parse_datetime(value) or parse_date(value)
+    if since is None:
+        raise argparse.ArgumentTypeError(
+            'invalid date: %s. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS' % value)
+
+    return since
+
+
+class BatchCommand(BaseCommand):
+    """A command that updates patches in batches.
+
+    Patches are processed in order of their IDs, a batch at a time, so
+    that a run can be resumed from the last batch completed. The work for
+    each batch can be spread across a pool of worker processes.
+
+    Subclasses must implement ``update``, which should use ``map`` to do
+    any CPU-heavy work.
+    """
+
+    # The number of patches updated at a time, by default
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'patch_ids', metavar='patch_id', nargs='*', type=int,
+            help='a patch ID number. If not supplied, all patches will be '
+            'updated.')
+        parser.add_argument(
+            '--project',
+            help='only update patches of the project with this link name.')
+        parser.add_argument(
+            '--since', type=_parse_since,
+            help='only update patches received on or after this date, given '
+            'as YYYY-MM-DD or YYYY-MM-DD HH:MM:SS.')
+        parser.add_argument(
+            '--batch-size', type=int, default=self.batch_size,
+            help='number of patches updated at a time. Defaults to %d.'
+            % self.batch_size)
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='number of worker processes used to process patches. '
+            'Patches are always stored by a single process.')
+        parser.add_argument(
+            '--checkpoint',
+            help='path of a file used to record progress. If the file '
+            'exists, patches up to the one recorded are skipped, so an '
+            'interrupted run can be resumed. It is removed once all patches '
+            'have been updated.')
+
+    def get_queryset(self):
+        """Return the patches that can be updated."""
+        return Patch.objects.all()
+
+    def update(self, ids):
+        """Update a batch of patches.
+
+        Args:
+            ids: The IDs of the patches to update, in ascending order.
+        """
+        raise NotImplementedError
+
+    def map(self, func, items):
+        """Apply a function to each item, using worker processes if any.
+
+        The function must be picklable and must not touch the database.
+
+        Returns:
+            A list of results, in the same order as the items.
+        """
+        if self.pool is None:
+            return [func(item) for item in items]
+
+        chunksize = max(1, len(items) // (self.jobs * 4))
+        return self.pool.map(func, items, chunksize)
+
+    def _read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+
+        with open(path) as checkpoint:
+            try:
+                return int(checkpoint.read().strip() or 0)
+            except ValueError:
+                raise CommandError('Invalid checkpoint file: %s' % path)
+
+    def _write_checkpoint(self, path, last_id):
+        # write then rename, so the checkpoint is never left half-written
+        with open(path + '.tmp', 'w') as checkpoint:
+            checkpoint.write('%d\n' % last_id)
+        os.replace(path + '.tmp', path)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be at least 1')
+        if options['jobs'] < 1:
+            raise CommandError('At least one job is required')
+
+        query = self.get_queryset()
+
+        if options['patch_ids']:
+            query = query.filter(id__in=options['patch_ids'])
+
+        if options['project']:
+            try:
+                project = Project.objects.get(linkname=options['project'])
+            except Project.DoesNotExist:
+                raise CommandError('Project not found: %s'
+                                   % options['project'])
+            query = query.filter(project=project)
+
+        if options['since']:
+            query = query.filter(date__gte=options['since'])
+
+        checkpoint = options['checkpoint']
+        last_id = self._read_checkpoint(checkpoint)
+        if last_id:
+            self.stdout.write('Resuming after patch %d' % last_id)
+
+        count = query.filter(id__gt=last_id).count()
+        done = 0
+        start = time.time()
+
+        self.jobs = options['jobs']
+        self.pool = None
+        if self.jobs > 1:
+            self.pool = multiprocessing.Pool(self.jobs)
+
+        try:
+            while True:
+                ids = list(query.filter(id__gt=last_id).order_by(
+                    'id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+
+                self.update(ids)
+
+                last_id = ids[-1]
+                done += len(ids)
+                if checkpoint:
+                    self._write_checkpoint(checkpoint, last_id)
+
+                elapsed = time.time() - start
+                self.stdout.write('%06d/%06d (%.0f patches/s)\r' % (
+                    done, count, done / elapsed if elapsed else 0), ending='')
+                self.stdout.flush()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.unlink(checkpoint)
+
+        elapsed = time.time() - start
+        self.stdout.write('\ndone: updated %d patches in %.1fs '
+                          '(%.0f patches/s)' % (
+                              done, elapsed, done / elapsed if elapsed else 0))
@@ -0,0 +1,33 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+from patchwork.management.commands import rehash
+
+
+class Command(rehash.Command):
+    help = 'Update the diffstats and changed files of existing patches'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='update all patches, including those that already have a '
+            'diffstat. By default, only patches without a diffstat are '
+            'updated, unless patch IDs are given.')
+
+    def handle(self, *args, **options):
+        self.all = options['all'] or bool(options['patch_ids'])
+
+        super(Command, self).handle(*args, **options)
+
+    def get_queryset(self):
+        query = super(Command, self).get_queryset()
+
+        # the hash is updated too, as it's derived from the same analysis,
+        # but it will only differ if the hashing algorithm has changed
+        if not self.all:
+            query = query.filter(insertions__isnull=True)
+
+        return query
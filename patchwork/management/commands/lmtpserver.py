@@ -0,0 +1,265 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import asyncio
+from concurrent import futures
+import email
+import logging
+import os
+import signal
+import socket
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import close_old_connections
+
+from patchwork.parser import get_project_routes
+from patchwork.parser import parse_mail
+from patchwork.parser import DuplicateMailError
+
+logger = logging.getLogger(__name__)
+
+# The longest command or mail line accepted, in bytes
+MAX_LINE_LENGTH = 64 * 1024
+
+# The largest mail accepted, in bytes
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+
+class LMTPServer(object):
+    """An LMTP (RFC 2033) server that stores any patches/comments found.
+
+    Each connection is handled by the event loop, while mails are parsed in
+    a pool of worker threads. Only as many mails as there are workers are
+    parsed at any time: further mails are only acknowledged once a worker
+    is free, which causes the mail server to slow down deliveries.
+    """
+
+    def __init__(self, list_id=None, workers=4):
+        self.list_id = list_id
+        self.workers = workers
+        self.hostname = socket.getfqdn()
+        self.executor = futures.ThreadPoolExecutor(workers)
+        self.slots = None
+
+    def deliver(self, data):
+        """Parse a mail and store any patch/comment found.
+
+        This runs in a worker thread.
+
+        Returns:
+            The reply to send for each recipient of the mail.
+        """
+        close_old_connections()
+        try:
+            mail = email.message_from_bytes(data)
+            result = parse_mail(mail, self.list_id)
+            if result is None:
+                logger.warning('Nothing added to database')
+        except DuplicateMailError as exc:
+            logger.warning('Duplicate mail for message ID %s', exc.msgid)
+        except ValueError as exc:
+            # the mail is broken, so trying again won't help
+            logger.warning('Invalid mail: %s', repr(exc))
+            return '554 5.6.0 Invalid mail'
+        except Exception as exc:
+            # most likely a database error or a bug, so the mail server
+            # should try again later rather than the mail being lost
+            logger.exception('Error when parsing incoming email: %s',
+                             repr(exc),
+                             extra={'mail': data.decode('utf-8', 'replace')})
+            return '451 4.3.0 Error when parsing mail'
+        finally:
+            close_old_connections()
+
+        return '250 2.0.0 OK'
+
+    async def _read_data(self, reader):
+        lines = []
+        size = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError('Connection closed during DATA')
+
+            if line in (b'.\r\n', b'.\n'):
+                break
+
+            if line.startswith(b'.'):
+                line = line[1:]
+
+            size += len(line)
+            if size <= MAX_MESSAGE_SIZE:
+                # mails are stored with Unix line endings
+                if line.endswith(b'\r\n'):
+                    line = line[:-2] + b'\n'
+                lines.append(line)
+
+        if size > MAX_MESSAGE_SIZE:
+            return None
+
+        return b''.join(lines)
+
+    async def handle(self, reader, writer):
+        """Handle an LMTP session."""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.workers)
+
+        def reply(*lines):
+            writer.write(''.join(line + '\r\n' for line in lines).encode())
+
+        reply('220 %s LMTP Patchwork ready' % self.hostname)
+
+        greeted = False
+        sender = None
+        recipients = []
+
+        try:
+            while True:
+                await writer.drain()
+
+                line = await reader.readline()
+                if not line:
+                    break
+
+                line = line.decode('utf-8', 'replace').rstrip('\r\n')
+                verb, _, arg = line.partition(' ')
+                verb = verb.upper()
+
+                if verb == 'LHLO':
+                    greeted = True
+                    sender = None
+                    recipients = []
+                    reply('250-%s' % self.hostname,
+                          '250-PIPELINING',
+                          '250-8BITMIME',
+                          '250-ENHANCEDSTATUSCODES',
+                          '250 SIZE %d' % MAX_MESSAGE_SIZE)
+                elif verb == 'MAIL':
+                    if not greeted:
+                        reply('503 5.5.1 Send LHLO first')
+                    elif sender is not None:
+                        reply('503 5.5.1 Nested MAIL command')
+                    elif not arg.upper().startswith('FROM:'):
+                        reply('501 5.5.4 Syntax: MAIL FROM:<address>')
+                    else:
+                        sender = arg[5:].strip()
+                        reply('250 2.1.0 OK')
+                elif verb == 'RCPT':
+                    if sender is None:
+                        reply('503 5.5.1 Send MAIL first')
+                    elif not arg.upper().startswith('TO:'):
+                        reply('501 5.5.4 Syntax: RCPT TO:<address>')
+                    else:
+                        recipients.append(arg[3:].strip())
+                        reply('250 2.1.5 OK')
+                elif verb == 'DATA':
+                    if not recipients:
+                        reply('503 5.5.1 Send RCPT first')
+                        continue
+
+                    reply('354 Start mail input; end with <CRLF>.<CRLF>')
+                    await writer.drain()
+
+                    data = await self._read_data(reader)
+                    if data is None:
+                        status = '552 5.3.4 Mail too large'
+                    else:
+                        status = await self._deliver(data)
+
+                    # LMTP requires a reply for each recipient, but mails are
+                    # only parsed once and the outcome is the same for all
+                    reply(*[status] * len(recipients))
+
+                    sender = None
+                    recipients = []
+                elif verb == 'RSET':
+                    sender = None
+                    recipients = []
+                    reply('250 2.0.0 OK')
+                elif verb == 'NOOP':
+                    reply('250 2.0.0 OK')
+                elif verb == 'QUIT':
+                    reply('221 2.0.0 Bye')
+                    await writer.drain()
+                    break
+                elif verb in ('HELO', 'EHLO'):
+                    reply('500 5.5.1 This is an LMTP server, use LHLO')
+                else:
+                    reply('500 5.5.2 Command not recognized')
+        except (ConnectionError, ValueError) as exc:
+            # the connection was closed or a line was too long
+            logger.warning('LMTP session aborted: %s', repr(exc))
+        finally:
+            writer.close()
+
+    async def _deliver(self, data):
+        async with self.slots:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, self.deliver,
+                                              data)
+
+    def start(self, loop, host=None, port=None, path=None):
+        """Start listening on a TCP port or UNIX socket."""
+        if path:
+            return loop.run_until_complete(asyncio.start_unix_server(
+                self.handle, path, limit=MAX_LINE_LENGTH))
+
+        return loop.run_until_complete(asyncio.start_server(
+            self.handle, host, port, limit=MAX_LINE_LENGTH))
+
+
+class Command(BaseCommand):
+    help = ('Run an LMTP server that parses mails delivered by a mail server '
+            'and stores any patches/comments found.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host', default='localhost',
+            help='address to listen on. Defaults to localhost.')
+        parser.add_argument(
+            '--port', type=int, default=8024,
+            help='port to listen on. Defaults to 8024.')
+        parser.add_argument(
+            '--socket', default=None,
+            help='path of a UNIX socket to listen on instead of a TCP port.')
+        parser.add_argument(
+            '--list-id',
+            help='mailing list ID. If not supplied, this will be '
+            'extracted from the mail headers.')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='number of mails that are parsed at the same time.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('At least one worker is required')
+
+        # load the project routing table up front, rather than on the first
+        # mail, so start-up problems are reported straight away
+        get_project_routes()
+
+        path = options['socket']
+        if path and os.path.exists(path):
+            os.unlink(path)
+
+        loop = asyncio.get_event_loop()
+        lmtp = LMTPServer(options['list_id'], options['workers'])
+        server = lmtp.start(loop, options['host'], options['port'], path)
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, loop.stop)
+
+        logger.info('Listening on %s', path or '%s:%d' % (
+            options['host'], options['port']))
+
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            lmtp.executor.shutdown()
+            if path:
+                os.unlink(path)
@@ -3,19 +3,63 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import collections
+import email
 import logging
 import mailbox
+import multiprocessing
 import os
 import sys
 
 from django.core.management.base import BaseCommand
 
 from patchwork import models
+from patchwork.parser import find_mail_content
 from patchwork.parser import parse_mail
+from patchwork.parser import parse_mails
 from patchwork.parser import DuplicateMailError
 
 logger = logging.getLogger(__name__)
 
+# The number of mails handed to a worker process at a time when parsing in
+# parallel
+SHARD_SIZE = 100
+
+
+def _parse_shard(shard):
+    """Parse a shard of raw mails.
+
+    This runs in a worker process and must not touch the database. It
+    does the CPU-heavy part of the work - MIME decoding and diff
+    extraction - leaving the coordinator to store the results.
+
+    Returns:
+        A list of (mail, content, error) tuples, in the same order as the
+        shard, where error is the exception raised if the mail couldn't be
+        parsed at all, in which case mail and content are None.
+    """
+    results = []
+
+    for data in shard:
+        try:
+            mail = email.message_from_bytes(data)
+        except Exception as exc:
+            results.append((None, None, exc))
+            continue
+
+        content = None
+        try:
+            # missing headers are reported by 'parse_mail'
+            if 'Subject' in mail:
+                content = find_mail_content(mail)
+        except Exception:
+            # leave it to the coordinator to report when it tries again
+            pass
+
+        results.append((mail, content, None))
+
+    return results
+
 
 class Command(BaseCommand):
     help = 'Parse an mbox archive file and store any patches/comments found.'
@@ -28,6 +72,62 @@ class Command(BaseCommand):
             '--list-id',
             help='mailing list ID. If not supplied, this will be '
             'extracted from the mail headers.')
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='number of worker processes used to parse mails. Mails are '
+            'always stored in archive order by a single process.')
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help='store mails in batches using bulk inserts. This is '
+            'significantly faster for large archives.')
+
+    def _iter_shards(self, mbox):
+        shard = []
+        for key in mbox.iterkeys():
+            shard.append(mbox.get_bytes(key))
+            if len(shard) == SHARD_SIZE:
+                yield shard
+                shard = []
+
+        if shard:
+            yield shard
+
+    def _parse_parallel(self, mbox, jobs):
+        """Parse mails using a pool of worker processes.
+
+        Shards of raw mails are parsed by the workers while results are
+        consumed in archive order, so threads are stored exactly as they
+        would be when parsing serially. Only a bounded number of shards
+        are in flight at any time to keep memory usage down.
+        """
+        with multiprocessing.Pool(jobs) as pool:
+            pending = collections.deque()
+
+            for shard in self._iter_shards(mbox):
+                pending.append(pool.apply_async(_parse_shard, (shard,)))
+                if len(pending) >= jobs * 2:
+                    yield from self._unpack_shard(pending.popleft().get())
+
+            while pending:
+                yield from self._unpack_shard(pending.popleft().get())
+
+    def _unpack_shard(self, results):
+        # mails that couldn't be parsed at all are reported here, as they
+        # can't be stored
+        for mail, content, exc in results:
+            if exc:
+                self.errors += 1
+                logger.warning('Invalid mail: %s', repr(exc))
+                continue
+
+            yield mail, content
+
+    def _store(self, mails, list_id):
+        for mail, content in mails:
+            try:
+                yield parse_mail(mail, list_id, content), None
+            except Exception as exc:
+                yield None, exc
 
     def handle(self, *args, **options):
         results = {
@@ -38,7 +138,7 @@ class Command(BaseCommand):
         }
         duplicates = 0
         dropped = 0
-        errors = 0
+        self.errors = 0
 
         verbosity = int(options['verbosity'])
         if not verbosity:
@@ -68,37 +168,48 @@ class Command(BaseCommand):
 
         count = len(mbox)
 
-        # Iterate through the mbox. This will pick up exceptions that are only
-        # thrown when a broken email is found part way through. Without this
-        # block, we'd get the exception thrown in enumerate(mbox) below, which
-        # is harder to catch. This is due to a bug in the Python 'email'
-        # library, as described here:
-        #
-        #   https://lists.ozlabs.org/pipermail/patchwork/2017-July/004486.html
-        #
-        # The alternative is converting the mbox to a list of messages, but
-        # that requires holding the entire thing in memory, which is wateful.
-        try:
-            for m in mbox:
-                pass
-        except AttributeError:
-            logger.error('Broken mbox/Maildir, aborting')
-            return
+        if options['jobs'] > 1:
+            # Each mail is parsed on its own in the workers, so a broken mail
+            # doesn't break the iteration
+            mails = self._parse_parallel(mbox, options['jobs'])
+        else:
+            # Iterate through the mbox. This will pick up exceptions that are
+            # only thrown when a broken email is found part way through.
+            # Without this block, we'd get the exception thrown in
+            # enumerate(mbox) below, which is harder to catch. This is due to
+            # a bug in the Python 'email' library, as described here:
+            #
+            #   https://lists.ozlabs.org/pipermail/patchwork/2017-July/004486.html
+            #
+            # The alternative is converting the mbox to a list of messages,
+            # but that requires holding the entire thing in memory, which is
+            # wateful.
+            try:
+                for m in mbox:
+                    pass
+            except AttributeError:
+                logger.error('Broken mbox/Maildir, aborting')
+                return
+
+            mails = ((msg, None) for msg in mbox)
+
+        if options['bulk']:
+            outcomes = parse_mails(mails, options['list_id'])
+        else:
+            outcomes = self._store(mails, options['list_id'])
 
         logger.info('Parsing %d mails', count)
-        for i, msg in enumerate(mbox):
-            try:
-                obj = parse_mail(msg, options['list_id'])
-                if obj:
-                    results[type(obj)] += 1
-                else:
-                    dropped += 1
-            except DuplicateMailError as exc:
+        for i, (obj, exc) in enumerate(outcomes):
+            if isinstance(exc, DuplicateMailError):
                 duplicates += 1
                 logger.warning('Duplicate mail for message ID %s', exc.msgid)
-            except (ValueError, Exception) as exc:
-                errors += 1
+            elif exc:
+                self.errors += 1
                 logger.warning('Invalid mail: %s', repr(exc))
+            elif obj:
+                results[type(obj)] += 1
+            else:
+                dropped += 1
 
             if verbosity < 3 and (i % 10) == 0:
                 self.stdout.write('%06d/%06d\r' % (i, count), ending='')
@@ -126,6 +237,6 @@ class Command(BaseCommand):
                 ),
                 'duplicates': duplicates,
                 'dropped': dropped,
-                'errors': errors,
-                'new': count - duplicates - dropped - errors,
+                'errors': self.errors,
+                'new': count - duplicates - dropped - self.errors,
             })
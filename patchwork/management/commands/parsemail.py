@@ -15,6 +15,36 @@ from patchwork.parser import DuplicateMailError
 logger = logging.getLogger(__name__)
 
 
+def process_mail(mail, list_id=None):
+    """Parse a mail and store any patch/comment found.
+
+    Returns:
+        The exit code that should be used to report the outcome.
+    """
+    # it's important to get exit codes correct here. The key is to allow
+    # proper separation of real errors vs expected 'failures'.
+    #
+    # patch/comment parsed:        0
+    # no parseable content found:  0
+    # duplicate messages:          0
+    # db integrity/other db error: 1
+    # broken email (ValueError):   1 (this could be noisy, if it's an issue
+    #                                 we could use a different return code)
+    try:
+        result = parse_mail(mail, list_id)
+        if result is None:
+            logger.warning('Nothing added to database')
+    except DuplicateMailError as exc:
+        logger.warning('Duplicate mail for message ID %s', exc.msgid)
+    except (ValueError, Exception) as exc:
+        logger.exception('Error when parsing incoming email: %s',
+                         repr(exc),
+                         extra={'mail': mail.as_string()})
+        return 1
+
+    return 0
+
+
 class Command(base.BaseCommand):
     help = 'Parse an mbox file and store any patch/comment found.'
 
@@ -45,23 +75,5 @@ class Command(base.BaseCommand):
             logger.warning("Broken email ignored")
             return
 
-        # it's important to get exit codes correct here. The key is to allow
-        # proper separation of real errors vs expected 'failures'.
-        #
-        # patch/comment parsed:        0
-        # no parseable content found:  0
-        # duplicate messages:          0
-        # db integrity/other db error: 1
-        # broken email (ValueError):   1 (this could be noisy, if it's an issue
-        #                                 we could use a different return code)
-        try:
-            result = parse_mail(mail, options['list_id'])
-            if result is None:
-                logger.warning('Nothing added to database')
-        except DuplicateMailError as exc:
-            logger.warning('Duplicate mail for message ID %s', exc.msgid)
-        except (ValueError, Exception) as exc:
-            logger.exception('Error when parsing incoming email: %s',
-                             repr(exc),
-                             extra={'mail': mail.as_string()})
+        if process_mail(mail, options['list_id']):
             sys.exit(1)
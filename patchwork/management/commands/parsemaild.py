@@ -0,0 +1,193 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+from concurrent import futures
+import email
+import logging
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import close_old_connections
+
+from patchwork.management.commands.parsemail import process_mail
+from patchwork.parser import get_project_routes
+
+logger = logging.getLogger(__name__)
+
+# The socket used when neither '--socket' nor '--maildir' are given. This
+# must match the default used by 'parsemail-client.py'
+DEFAULT_SOCKET = '/run/patchwork/parsemail.sock'
+
+# How many seconds to wait between scans of a Maildir spool?
+MAILDIR_INTERVAL = 5
+
+
+class Command(BaseCommand):
+    help = ('Run a daemon that parses mails received on a UNIX socket or '
+            'delivered to a Maildir and stores any patches/comments found.')
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument(
+            '--socket', default=None,
+            help='path of the UNIX socket to listen on. Mails can be sent '
+            'to this using the parsemail-client.py script. Defaults to %s.'
+            % DEFAULT_SOCKET)
+        source.add_argument(
+            '--maildir', default=None,
+            help='path of a Maildir to watch for new mails. Mails are '
+            'removed once parsed, or marked as seen and flagged if they '
+            'cannot be parsed.')
+        parser.add_argument(
+            '--socket-mode', type=lambda mode: int(mode, 8), default=0o660,
+            help='permissions of the UNIX socket, in octal. Defaults to 660.')
+        parser.add_argument(
+            '--list-id',
+            help='mailing list ID used for mails delivered to the Maildir. '
+            'If not supplied, this will be extracted from the mail headers.')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='number of mails that are parsed at the same time.')
+
+    def _process(self, mail, list_id):
+        close_old_connections()
+        try:
+            return process_mail(mail, list_id)
+        finally:
+            close_old_connections()
+
+    def handle_connection(self, conn):
+        """Parse a mail received from a client and report the outcome.
+
+        The client sends the mailing list ID, which may be empty, on a line
+        of its own followed by the mail. Once the mail has been parsed, the
+        exit code that 'parsemail' would have used is sent back on a line of
+        its own.
+        """
+        with conn:
+            with conn.makefile('rb') as rfile:
+                list_id = rfile.readline().decode('utf-8', 'replace').strip()
+                try:
+                    mail = email.message_from_binary_file(rfile)
+                except AttributeError:
+                    logger.warning('Broken email ignored')
+                    code = 0
+                else:
+                    code = self._process(mail, list_id or None)
+
+            conn.sendall(b'%d\n' % code)
+
+    def handle_maildir_message(self, path, name, list_id=None):
+        """Parse a mail delivered to a Maildir.
+
+        Mails that are parsed are removed, while those that can't be are
+        moved to 'cur' and flagged so they aren't parsed again.
+        """
+        filename = os.path.join(path, 'new', name)
+        with open(filename, 'rb') as file_:
+            try:
+                mail = email.message_from_binary_file(file_)
+            except AttributeError:
+                logger.warning('Broken email ignored')
+                mail = None
+
+        code = self._process(mail, list_id) if mail is not None else 0
+
+        if code:
+            os.rename(filename, os.path.join(path, 'cur', name + ':2,FS'))
+        else:
+            os.unlink(filename)
+
+    def _serve_socket(self, path, mode, pool, slots):
+        if os.path.exists(path):
+            os.unlink(path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        os.chmod(path, mode)
+        sock.listen(128)
+        sock.settimeout(1)
+
+        logger.info('Listening on %s', path)
+
+        try:
+            while not self.stopping.is_set():
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+
+                conn.settimeout(None)
+                self._submit(pool, slots, self.handle_connection, conn)
+        finally:
+            sock.close()
+            os.unlink(path)
+
+    def _serve_maildir(self, path, list_id, pool, slots):
+        if not os.path.isdir(os.path.join(path, 'new')):
+            raise CommandError('Invalid Maildir: %s' % path)
+
+        logger.info('Watching %s', path)
+
+        while not self.stopping.is_set():
+            pending = []
+            for name in sorted(os.listdir(os.path.join(path, 'new'))):
+                if name.startswith('.'):
+                    continue
+
+                pending.append(self._submit(
+                    pool, slots, self.handle_maildir_message, path, name,
+                    list_id))
+
+            # wait for this scan to finish so nothing is parsed twice
+            futures.wait(pending)
+
+            self.stopping.wait(MAILDIR_INTERVAL)
+
+    def _submit(self, pool, slots, fn, *args):
+        # only a bounded number of mails can be waiting for a worker at any
+        # time: beyond that, new mails wait to be accepted
+        slots.acquire()
+
+        def run():
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception('Unexpected error when parsing mail')
+            finally:
+                slots.release()
+
+        return pool.submit(run)
+
+    def _stop(self, signum, frame):
+        logger.info('Stopping')
+        self.stopping.set()
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('At least one worker is required')
+
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        # load the project routing table up front, rather than on the first
+        # mail, so start-up problems are reported straight away
+        get_project_routes()
+
+        workers = options['workers']
+        slots = threading.BoundedSemaphore(workers * 2)
+
+        with futures.ThreadPoolExecutor(workers) as pool:
+            if options['maildir']:
+                self._serve_maildir(options['maildir'], options['list_id'],
+                                    pool, slots)
+            else:
+                self._serve_socket(options['socket'] or DEFAULT_SOCKET,
+                                   options['socket_mode'], pool, slots)
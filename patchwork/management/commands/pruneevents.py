@@ -0,0 +1,183 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import datetime
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import Q
+
+from patchwork.models import Event
+from patchwork.models import Webhook
+from patchwork.models import WebhookDelivery
+
+CATEGORIES = [category for category, _ in Event.CATEGORY_CHOICES]
+
+
+def _parse_days(value):
+    try:
+        days = int(value)
+    except ValueError:
+        days = -1
+
+    if days < 0:
+        raise argparse.ArgumentTypeError('invalid number of days: %s' % value)
+
+    return days
+
+
+def _parse_category_days(value):
+    category, _, days = value.partition('=')
+    if category not in CATEGORIES:
+        raise argparse.ArgumentTypeError(
+            'invalid category: %s. Use one of: %s' % (
+                category, ', '.join(CATEGORIES)))
+
+    return category, _parse_days(days)
+
+
+class Command(BaseCommand):
+    help = 'Delete old events, optionally archiving them first'
+
+    # The number of events deleted at a time, by default
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=_parse_days,
+            help='delete events older than this many days.')
+        parser.add_argument(
+            '--category-days', metavar='CATEGORY=DAYS', action='append',
+            type=_parse_category_days, default=[],
+            help='delete events of this category older than this many days, '
+            'overriding --days. Events of categories without a number of '
+            'days, if --days is not given, are kept. This can be given '
+            'multiple times.')
+        parser.add_argument(
+            '--batch-size', type=int, default=self.batch_size,
+            help='number of events deleted at a time. Defaults to %d.'
+            % self.batch_size)
+        parser.add_argument(
+            '--archive',
+            help='path of a gzip-compressed file that events are written to, '
+            'one JSON object per line, before they are deleted. If the file '
+            'exists, events are appended to it.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='report how many events would be deleted, without deleting '
+            'them.')
+
+    def get_queryset(self, days, category_days):
+        """Return the events older than their retention period.
+
+        Events that are yet to be delivered to an active webhook, including
+        those of failed deliveries that are being retried, are kept.
+        """
+        now = datetime.datetime.utcnow()
+        query = Q()
+
+        for category, retention in category_days.items():
+            query |= Q(category=category,
+                       date__lt=now - datetime.timedelta(days=retention))
+
+        if days is not None:
+            query |= Q(date__lt=now - datetime.timedelta(days=days)) & ~Q(
+                category__in=list(category_days))
+
+        undelivered = Q()
+        for webhook in Webhook.objects.filter(active=True):
+            pending = Q(project=webhook.project_id,
+                        id__gt=webhook.last_event_id)
+            if webhook.get_categories():
+                pending &= Q(category__in=webhook.get_categories())
+            undelivered |= pending
+
+        events = Event.objects.filter(query)
+        if undelivered:
+            events = events.exclude(undelivered)
+
+        return events
+
+    def get_deliveries(self, last_id):
+        """Return the completed deliveries of events that were deleted.
+
+        A delivery is complete once its events have been delivered, either
+        by it or by a later delivery if it failed. Deliveries are deleted
+        along with their last event.
+        """
+        return WebhookDelivery.objects.filter(
+            Q(last_event_id__lte=last_id),
+            Q(last_event_id__lte=F('webhook__last_event_id')),
+            ~Exists(Event.objects.filter(id=OuterRef('last_event_id'))))
+
+    def _archive(self, archive, query):
+        for event in query.order_by('id').values().iterator():
+            archive.write(json.dumps(event, cls=DjangoJSONEncoder) + '\n')
+
+        # make sure events are archived before they're deleted
+        archive.flush()
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be at least 1')
+
+        category_days = dict(options['category_days'])
+        if options['days'] is None and not category_days:
+            raise CommandError('Either --days or --category-days is required')
+
+        query = self.get_queryset(options['days'], category_days)
+
+        count = query.count()
+        if options['dry_run']:
+            self.stdout.write('Would delete %d events' % count)
+            return
+
+        archive = None
+        if options['archive']:
+            archive = gzip.open(options['archive'], 'at', encoding='utf-8')
+
+        last_id = 0
+        done = 0
+        start = time.time()
+
+        try:
+            while True:
+                ids = list(query.filter(id__gt=last_id).order_by(
+                    'id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+
+                # we delete by ID range rather than listing the IDs, which
+                # keeps the query small. Each batch is deleted in its own
+                # transaction, so rows are only locked briefly
+                batch = query.filter(id__gte=ids[0], id__lte=ids[-1])
+                if archive:
+                    self._archive(archive, batch)
+                batch.delete()
+                self.get_deliveries(ids[-1]).delete()
+
+                last_id = ids[-1]
+                done += len(ids)
+
+                elapsed = time.time() - start
+                self.stdout.write('%06d/%06d (%.0f events/s)\r' % (
+                    done, count, done / elapsed if elapsed else 0), ending='')
+                self.stdout.flush()
+        finally:
+            if archive:
+                archive.close()
+
+        elapsed = time.time() - start
+        self.stdout.write('\ndone: deleted %d events in %.1fs '
+                          '(%.0f events/s)' % (
+                              done, elapsed, done / elapsed if elapsed else 0))
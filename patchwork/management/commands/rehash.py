@@ -4,29 +4,58 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from patchwork.hasher import analyse_diff
+from patchwork.management.batch import BatchCommand
 from patchwork.models import Patch
+from patchwork.models import PatchFile
 
 
-class Command(BaseCommand):
-    help = 'Update the hashes on existing patches'
-    args = '[<patch_id>...]'
+def _analyse(item):
+    """Hash a patch's diff and generate its diffstat.
 
-    def handle(self, *args, **options):
-        query = Patch.objects
+    This runs in a worker process and must not touch the database.
 
-        if args:
-            query = query.filter(id_in=args)
-        else:
-            query = query.all()
+    Args:
+        item: A (patch ID, diff) tuple.
 
-        count = query.count()
+    Returns:
+        A (patch ID, hash, files) tuple, where files is a dict mapping the
+        paths changed to lists of insertions and deletions.
+    """
+    patch_id, diff = item
+    analyser = analyse_diff(diff)
 
-        for i, patch in enumerate(query.iterator()):
-            patch.hash = None
-            patch.save()
-            if (i % 10) == 0:
-                self.stdout.write('%06d/%06d\r' % (i, count), ending='')
-                self.stdout.flush()
-        self.stdout.write('\ndone')
+    return patch_id, analyser.hexdigest(), dict(analyser.files)
+
+
+class Command(BatchCommand):
+    help = 'Update the hashes and diffstats on existing patches'
+
+    def get_queryset(self):
+        return Patch.objects.filter(diff__isnull=False)
+
+    def update(self, ids):
+        items = list(Patch.objects.filter(id__in=ids).values_list(
+            'id', 'diff'))
+
+        patches = []
+        files = []
+        for patch_id, hash_, patch_files in self.map(_analyse, items):
+            patches.append(Patch(
+                id=patch_id, hash=hash_, files_changed=len(patch_files),
+                insertions=sum(i for i, _ in patch_files.values()),
+                deletions=sum(d for _, d in patch_files.values())))
+            files.extend(
+                PatchFile(patch_id=patch_id, path=path[:255],
+                          insertions=insertions, deletions=deletions)
+                for path, (insertions, deletions) in patch_files.items())
+
+        # this bypasses 'save' and so the signal handlers that generate
+        # events, which is fine as these are derived data
+        with transaction.atomic():
+            Patch.objects.bulk_update(
+                patches, ['hash', 'files_changed', 'insertions', 'deletions'])
+            PatchFile.objects.filter(patch__in=ids).delete()
+            PatchFile.objects.bulk_create(files)
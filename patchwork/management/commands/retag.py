@@ -3,28 +3,85 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-from django.core.management.base import BaseCommand
+from collections import Counter
+from collections import defaultdict
 
+from django.db import transaction
+
+from patchwork.management.batch import BatchCommand
+from patchwork.models import get_tag_extractor
+from patchwork.models import pack_counts
 from patchwork.models import Patch
+from patchwork.models import PatchComment
+from patchwork.models import PatchTag
+from patchwork.models import Project
+from patchwork.models import Tag
+
+
+def _count_tags(item):
+    """Count the tags given for a patch.
+
+    This runs in a worker process and must not touch the database.
+
+    Args:
+        item: A (patch ID, tags, contents) tuple, where tags is a tuple of
+            (tag ID, pattern) tuples and contents are those of the patch and
+            its comments.
+
+    Returns:
+        A (patch ID, counts) tuple, where counts maps tag IDs to counts.
+    """
+    patch_id, tags, contents = item
+    extractor = get_tag_extractor(
+        [Tag(id=tag_id, pattern=pattern) for tag_id, pattern in tags])
 
+    counts = Counter()
+    for content in contents:
+        if content:
+            counts += extractor.extract(content)
 
-class Command(BaseCommand):
+    return patch_id, {tag.id: count for tag, count in counts.items()}
+
+
+class Command(BatchCommand):
     help = 'Update the tag (Ack/Review/Test) counts on existing patches'
-    args = '[<patch_id>...]'
 
     def handle(self, *args, **options):
-        query = Patch.objects
+        self.tags = {
+            project.id: tuple((tag.id, tag.pattern) for tag in project.tags)
+            for project in Project.objects.all()}
+
+        super(Command, self).handle(*args, **options)
+
+    def update(self, ids):
+        patches = Patch.objects.filter(id__in=ids).values_list(
+            'id', 'project_id', 'content')
+
+        comments = defaultdict(list)
+        for patch_id, content in PatchComment.objects.filter(
+                patch__in=ids).values_list('patch_id', 'content'):
+            comments[patch_id].append(content)
 
-        if args:
-            query = query.filter(id__in=args)
-        else:
-            query = query.all()
+        # projects that don't use tags are left alone, as with
+        # 'Patch.refresh_tag_counts'
+        items = [(patch_id, self.tags[project_id],
+                  [content] + comments[patch_id])
+                 for patch_id, project_id, content in patches
+                 if self.tags[project_id]]
 
-        count = query.count()
+        patchtags = []
+        updated = []
+        for patch_id, counts in self.map(_count_tags, items):
+            patchtags.extend(
+                PatchTag(patch_id=patch_id, tag_id=tag_id, count=count)
+                for tag_id, count in counts.items())
+            updated.append(Patch(id=patch_id,
+                                 tag_counts=pack_counts(counts)))
 
-        for i, patch in enumerate(query.iterator()):
-            patch.refresh_tag_counts()
-            if (i % 10) == 0:
-                self.stdout.write('%06d/%06d\r' % (i, count), ending='')
-                self.stdout.flush()
-        self.stdout.write('\ndone')
+        # this bypasses 'save' and so the signal handlers that generate
+        # events, which is fine as the counts are derived data
+        with transaction.atomic():
+            PatchTag.objects.filter(patch__in=[
+                patch.id for patch in updated]).delete()
+            PatchTag.objects.bulk_create(patchtags)
+            Patch.objects.bulk_update(updated, ['tag_counts'])
@@ -0,0 +1,57 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import logging
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import close_old_connections
+
+from patchwork.webhooks import deliver_webhooks
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Run a worker that delivers new events to webhooks. Only one '
+            'worker should be run at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='number of seconds to wait between checks for new events. '
+            'Defaults to 5.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='deliver any new events and exit, rather than running '
+            'continuously.')
+
+    def _stop(self, signum, frame):
+        logger.info('Stopping')
+        self.stopping.set()
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0:
+            raise CommandError('The interval must be greater than zero')
+
+        if options['once']:
+            count = deliver_webhooks()
+            logger.info('Made %d deliveries', count)
+            return
+
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                deliver_webhooks()
+            except Exception:
+                logger.exception('Unexpected error when delivering events')
+
+            self.stopping.wait(options['interval'])
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.14 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0043_merge_patch_submission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='deletions',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='files_changed',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='insertions',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0.14 on 2026-10-17 18:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0044_patch_diffstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatchFile',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('path', models.CharField(db_index=True, max_length=255)),
+                ('insertions', models.PositiveIntegerField(default=0)),
+                ('deletions', models.PositiveIntegerField(default=0)),
+                (
+                    'patch',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='files',
+                        related_query_name='file',
+                        to='patchwork.Patch',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['patch', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.0.14 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0045_patch_files'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(
+                fields=['hash', 'project'], name='patch_hash_project_idx'
+            ),
+        ),
+    ]
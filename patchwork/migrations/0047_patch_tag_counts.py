@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+def copy_tag_counts(apps, schema_editor):
+    Patch = apps.get_model('patchwork', 'Patch')
+    PatchTag = apps.get_model('patchwork', 'PatchTag')
+
+    def pack(patch_id, counts):
+        # this must match 'patchwork.models.pack_counts'
+        return Patch(
+            id=patch_id,
+            tag_counts=','.join(
+                '%d:%d' % (tag_id, count)
+                for tag_id, count in sorted(counts.items())
+                if count
+            ),
+        )
+
+    patches = []
+    patch_id = None
+    counts = {}
+
+    for patchtag in (
+        PatchTag.objects.order_by('patch_id')
+        .values_list('patch_id', 'tag_id', 'count')
+        .iterator()
+    ):
+        if patchtag[0] != patch_id:
+            if counts:
+                patches.append(pack(patch_id, counts))
+            patch_id = patchtag[0]
+            counts = {}
+
+        counts[patchtag[1]] = patchtag[2]
+
+        if len(patches) >= 1000:
+            Patch.objects.bulk_update(patches, ['tag_counts'])
+            patches = []
+
+    if counts:
+        patches.append(pack(patch_id, counts))
+
+    Patch.objects.bulk_update(patches, ['tag_counts'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0046_patch_hash_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='tag_counts',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(
+            copy_tag_counts, migrations.RunPython.noop
+        ),
+    ]
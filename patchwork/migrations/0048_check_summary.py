@@ -0,0 +1,109 @@
+from django.db import migrations, models
+
+# these must match 'patchwork.models.Check'
+STATE_PENDING = 0
+STATE_SUCCESS = 1
+STATE_WARNING = 2
+STATE_FAIL = 3
+
+
+def summarise_checks(apps, schema_editor):
+    Check = apps.get_model('patchwork', 'Check')
+    Patch = apps.get_model('patchwork', 'Patch')
+
+    def summarise(patch_id, latest):
+        # this must match 'patchwork.models.Patch.refresh_check_summary'
+        counts = {}
+        for check in latest.values():
+            counts[check[4]] = counts.get(check[4], 0) + 1
+
+        check_state = STATE_SUCCESS
+        for state in [STATE_FAIL, STATE_WARNING, STATE_PENDING]:
+            if counts.get(state):
+                check_state = state
+                break
+
+        return Patch(
+            id=patch_id,
+            check_state=check_state,
+            check_counts=','.join(
+                '%d:%d' % (state, count)
+                for state, count in sorted(counts.items())
+            ),
+        )
+
+    def flush(patches, ids):
+        Patch.objects.bulk_update(patches, ['check_state', 'check_counts'])
+        Check.objects.filter(id__in=ids).update(is_latest=True)
+
+    patches = []
+    ids = []
+    patch_id = None
+    latest = {}
+
+    for check in (
+        Check.objects.order_by('patch_id', 'id')
+        .values_list('id', 'patch_id', 'user_id', 'context', 'state', 'date')
+        .iterator()
+    ):
+        if check[1] != patch_id:
+            if latest:
+                patches.append(summarise(patch_id, latest))
+                ids.extend(x[0] for x in latest.values())
+            patch_id = check[1]
+            latest = {}
+
+        key = (check[2], check[3])
+        if key not in latest or check[5] >= latest[key][5]:
+            latest[key] = check
+
+        # some databases limit the number of parameters of a query
+        if len(ids) >= 500:
+            flush(patches, ids)
+            patches = []
+            ids = []
+
+    if latest:
+        patches.append(summarise(patch_id, latest))
+        ids.extend(x[0] for x in latest.values())
+
+    flush(patches, ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0047_patch_tag_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='check',
+            name='is_latest',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='check_counts',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='check_state',
+            field=models.SmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(summarise_checks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='check',
+            index=models.Index(
+                fields=['patch', 'is_latest'], name='check_latest_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(
+                fields=['project', 'check_state'],
+                name='patch_check_state_idx',
+            ),
+        ),
+    ]
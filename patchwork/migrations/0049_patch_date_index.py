@@ -0,0 +1,20 @@
+# Generated by Django 3.0.14 on 2026-10-17 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0048_check_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(
+                fields=['project', 'date', 'id'],
+                name='patch_project_date_idx',
+            ),
+        ),
+    ]
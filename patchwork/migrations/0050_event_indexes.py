@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0049_patch_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date'], name='event_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(
+                fields=['project', 'date'], name='event_project_date_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(
+                fields=['project', 'category', 'date'],
+                name='event_project_category_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(
+                fields=['project', 'id'], name='event_project_id_idx'
+            ),
+        ),
+    ]
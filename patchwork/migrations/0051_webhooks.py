@@ -0,0 +1,134 @@
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0050_event_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Webhook',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'url',
+                    models.URLField(
+                        help_text='The URL that events are posted to.',
+                        max_length=2000,
+                    ),
+                ),
+                (
+                    'categories',
+                    models.CharField(
+                        blank=True,
+                        help_text='A comma-separated list of the categories '
+                        'of events to deliver. If empty, events of all '
+                        'categories are delivered.',
+                        max_length=255,
+                    ),
+                ),
+                (
+                    'secret',
+                    models.CharField(
+                        blank=True,
+                        help_text='If set, deliveries are signed with this '
+                        'using HMAC-SHA256, with the signature given in the '
+                        'X-Patchwork-Signature header.',
+                        max_length=255,
+                    ),
+                ),
+                ('active', models.BooleanField(default=True)),
+                (
+                    'last_event_id',
+                    models.IntegerField(
+                        default=0,
+                        editable=False,
+                        help_text='The ID of the last event delivered.',
+                    ),
+                ),
+                (
+                    'failures',
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text='The number of consecutive failed '
+                        'deliveries.',
+                    ),
+                ),
+                (
+                    'next_attempt',
+                    models.DateTimeField(
+                        blank=True,
+                        editable=False,
+                        help_text='The time of the next delivery, if '
+                        'retrying.',
+                        null=True,
+                    ),
+                ),
+                (
+                    'project',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='webhooks',
+                        to='patchwork.Project',
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WebhookDelivery',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'date',
+                    models.DateTimeField(default=datetime.datetime.utcnow),
+                ),
+                ('first_event_id', models.IntegerField()),
+                ('last_event_id', models.IntegerField()),
+                ('event_count', models.PositiveIntegerField()),
+                ('success', models.BooleanField()),
+                (
+                    'status',
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        help_text='The HTTP status of the response, if any.',
+                        null=True,
+                    ),
+                ),
+                ('error', models.TextField(blank=True)),
+                (
+                    'webhook',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='deliveries',
+                        to='patchwork.Webhook',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name_plural': 'Webhook deliveries',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
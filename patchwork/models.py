@@ -5,20 +5,24 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 from collections import Counter
-from collections import OrderedDict
+from collections import defaultdict
+import contextlib
 import datetime
 import random
 import re
+import threading
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db import models
+from django.db import transaction
 from django.urls import reverse
 from django.utils.functional import cached_property
 
 from patchwork.fields import HashField
-from patchwork.hasher import hash_diff
+from patchwork.hasher import analyse_diff
 
 if settings.ENABLE_REST_API:
     from rest_framework.authtoken.models import Token
@@ -237,10 +241,6 @@ class Tag(models.Model):
                                       ' tag\'s count in the patch list view',
                                       default=True)
 
-    @property
-    def attr_name(self):
-        return 'tag_%d_count' % self.id
-
     def __str__(self):
         return self.name
 
@@ -248,6 +248,111 @@ class Tag(models.Model):
         ordering = ['abbrev']
 
 
+class TagExtractor(object):
+    """Count the tags given in content.
+
+    Most tags are simple prefixes of a line, such as ``^Acked-by:``. These
+    are combined into a single regex so that content is scanned once,
+    whatever the number of tags. Any other patterns are compiled once and
+    matched separately.
+    """
+
+    # a pattern matching literal text at the start of a line
+    prefix_re = re.compile(r'^\^([\w\- ]+:?)$')
+
+    def __init__(self, tags):
+        self.prefixes = defaultdict(list)
+        self.patterns = []
+
+        for tag in tags:
+            match = self.prefix_re.match(tag.pattern)
+            if match:
+                self.prefixes[match.group(1).lower()].append(tag)
+            else:
+                self._add_pattern(tag)
+
+        # only one alternative can match at any position, so prefixes that
+        # are the start of others must be matched separately
+        shadowed = [prefix for prefix in self.prefixes if any(
+            other != prefix and other.startswith(prefix)
+            for other in self.prefixes)]
+        for prefix in shadowed:
+            for tag in self.prefixes.pop(prefix):
+                self._add_pattern(tag)
+
+        self.regex = None
+        if self.prefixes:
+            self.regex = re.compile('^(%s)' % '|'.join(
+                re.escape(prefix) for prefix in self.prefixes),
+                re.MULTILINE | re.IGNORECASE)
+
+    def _add_pattern(self, tag):
+        self.patterns.append((tag, re.compile(
+            tag.pattern, re.MULTILINE | re.IGNORECASE)))
+
+    def extract(self, content):
+        """Return a Counter of the number of times each tag was given."""
+        counts = Counter()
+
+        if self.regex:
+            for match in self.regex.finditer(content):
+                for tag in self.prefixes[match.group(1).lower()]:
+                    counts[tag] += 1
+
+        for tag, regex in self.patterns:
+            counts[tag] += len(regex.findall(content))
+
+        return counts
+
+
+# TagExtractors for each set of tags used, indexed by their IDs and patterns
+_tag_extractors = {}
+
+
+def get_tag_extractor(tags):
+    """Return a, possibly cached, TagExtractor for the given tags."""
+    key = tuple((tag.id, tag.pattern) for tag in tags)
+
+    extractor = _tag_extractors.get(key)
+    if extractor is None:
+        extractor = _tag_extractors[key] = TagExtractor(tags)
+
+    return extractor
+
+
+def invalidate_tag_extractors():
+    """Drop all cached TagExtractors, such as when tags change."""
+    _tag_extractors.clear()
+
+
+def pack_counts(counts):
+    """Pack counts for storage, such as in ``Patch.tag_counts``.
+
+    Args:
+        counts: A mapping of integer keys, such as tag IDs, to counts.
+
+    Returns:
+        A string of comma-separated ``<key>:<count>`` pairs, omitting keys
+        with a zero count.
+    """
+    return ','.join('%d:%d' % (key, count)
+                    for key, count in sorted(counts.items()) if count)
+
+
+def unpack_counts(value):
+    """Unpack counts packed by ``pack_counts``.
+
+    Returns:
+        A dict mapping keys to counts.
+    """
+    counts = {}
+    for pair in value.split(',') if value else []:
+        key, _, count = pair.partition(':')
+        counts[int(key)] = int(count)
+
+    return counts
+
+
 class PatchTag(models.Model):
     patch = models.ForeignKey('Patch', on_delete=models.CASCADE)
     tag = models.ForeignKey('Tag', on_delete=models.CASCADE)
@@ -257,39 +362,114 @@ class PatchTag(models.Model):
         unique_together = [('patch', 'tag')]
 
 
+class PatchFileQuerySet(models.query.QuerySet):
+
+    def matching(self, path):
+        """Filter files to those at or below the given path.
+
+        A trailing ``*`` matches any path starting with the preceding
+        characters, such that ``drivers/net/*`` and ``drivers/net`` are
+        equivalent but ``drivers/net*`` also matches ``drivers/netdevsim``.
+        """
+        path = path.strip()
+        if path.endswith('*'):
+            return self.filter(path__startswith=path.rstrip('*'))
+
+        path = path.rstrip('/')
+        return self.filter(
+            models.Q(path=path) | models.Q(path__startswith=path + '/'))
+
+
+class PatchFile(models.Model):
+    """A file changed by a patch, and the lines changed in it."""
+
+    patch = models.ForeignKey(
+        'Patch',
+        on_delete=models.CASCADE,
+        related_name='files',
+        related_query_name='file',
+    )
+    path = models.CharField(max_length=255, db_index=True)
+    insertions = models.PositiveIntegerField(default=0)
+    deletions = models.PositiveIntegerField(default=0)
+
+    objects = PatchFileQuerySet.as_manager()
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        ordering = ['patch', 'id']
+
+
 def get_default_initial_patch_state():
     return State.objects.get(ordering=0)
 
 
 class PatchQuerySet(models.query.QuerySet):
 
+    # The maximum number of values to look up in a single 'IN' query
+    LOOKUP_SIZE = 500
+
     def with_tag_counts(self, project=None):
+        """Prepare patches for reading tag counts with ``get_tag_count``.
+
+        Tag counts are stored with each patch, so this only ensures that
+        patches share an instance of their project, and so its cached tags.
+        """
         if project and not project.use_tags:
             return self
 
-        # We need the project's use_tags field loaded for Project.tags().
-        # Using prefetch_related means we'll share the one instance of
-        # Project, and share the project.tags cache between all patch.project
-        # references.
-        qs = self.prefetch_related('project')
-        select = OrderedDict()
-        select_params = []
+        return self.prefetch_related('project')
 
-        # All projects have the same tags, so we're good to go here
-        if project:
-            tags = project.tags
-        else:
-            tags = Tag.objects.all()
+    def touching(self, path):
+        """Filter patches to those changing files at or below a path.
 
-        for tag in tags:
-            select[tag.attr_name] = (
-                "coalesce("
-                "(SELECT count FROM patchwork_patchtag"
-                " WHERE patchwork_patchtag.patch_id=patchwork_patch.id"
-                " AND patchwork_patchtag.tag_id=%s), 0)")
-            select_params.append(tag.id)
+        Refer to ``PatchFileQuerySet.matching``.
+        """
+        return self.filter(
+            id__in=PatchFile.objects.matching(path).values('patch_id'))
+
+    def set_commits(self, commits, state, user=None):
+        """Mark the patches matching the given commits as committed.
+
+        Patches are matched using the hash of each commit's diff. Matching
+        patches have their state and commit reference set, all in a single
+        transaction, and the events for these changes are created in bulk.
+        If a hash is given for more than one commit, the patches matching it
+        will reference the last of these.
+
+        Args:
+            commits: A list of (commit, hash) tuples.
+            state: The state to set on matching patches.
+            user: The user making the change, if any.
+
+        Returns:
+            A list of (commit, hash, patches) tuples, in the same order as
+            ``commits``.
+        """
+        commits = [(commit, hash.lower()) for commit, hash in commits]
+
+        matches = defaultdict(list)
+        hashes = sorted({hash for _, hash in commits})
+        for i in range(0, len(hashes), self.LOOKUP_SIZE):
+            for patch in self.filter(hash__in=hashes[i:i + self.LOOKUP_SIZE]):
+                matches[patch.hash].append(patch)
+
+        updated = {}
+        for commit, hash in commits:
+            for patch in matches[hash]:
+                patch.commit_ref = commit
+                patch.state = state
+                if user:
+                    patch._edited_by = user
+                updated[patch.id] = patch
 
-        return qs.extra(select=select, select_params=select_params)
+        with defer_events():
+            for patch in updated.values():
+                patch.save()
+
+        return [(commit, hash, matches[hash]) for commit, hash in commits]
 
 
 class PatchManager(models.Manager):
@@ -300,6 +480,12 @@ class PatchManager(models.Manager):
     def with_tag_counts(self, project):
         return self.get_queryset().with_tag_counts(project)
 
+    def touching(self, path):
+        return self.get_queryset().touching(path)
+
+    def set_commits(self, commits, state, user=None):
+        return self.get_queryset().set_commits(commits, state, user)
+
 
 class EmailMixin(models.Model):
     """Mixin for models with an email-origin."""
@@ -420,6 +606,9 @@ class Patch(SubmissionMixin):
     commit_ref = models.CharField(max_length=255, null=True, blank=True)
     pull_url = models.CharField(max_length=255, null=True, blank=True)
     tags = models.ManyToManyField(Tag, through=PatchTag)
+    # a copy of the counts stored in PatchTag, so that patch lists don't need
+    # to query these. Refer to 'pack_counts'
+    tag_counts = models.TextField(blank=True, default='', editable=False)
 
     # patchwork metadata
 
@@ -433,6 +622,18 @@ class Patch(SubmissionMixin):
     archived = models.BooleanField(default=False)
     hash = HashField(null=True, blank=True)
 
+    # a summary of the latest check of each context, so that patch lists
+    # don't need to load checks. Refer to 'Check.save'
+
+    check_state = models.SmallIntegerField(default=0, editable=False)
+    check_counts = models.TextField(blank=True, default='', editable=False)
+
+    # diffstat, so that lists don't need to read the diff itself
+
+    files_changed = models.PositiveIntegerField(null=True, blank=True)
+    insertions = models.PositiveIntegerField(null=True, blank=True)
+    deletions = models.PositiveIntegerField(null=True, blank=True)
+
     # series metadata
 
     series = models.ForeignKey(
@@ -459,13 +660,10 @@ class Patch(SubmissionMixin):
 
     @staticmethod
     def extract_tags(content, tags):
-        counts = Counter()
-
-        for tag in tags:
-            regex = re.compile(tag.pattern, re.MULTILINE | re.IGNORECASE)
-            counts[tag] = len(regex.findall(content))
+        if not tags:
+            return Counter()
 
-        return counts
+        return get_tag_extractor(tags).extract(content)
 
     def _set_tag(self, tag, count):
         if count == 0:
@@ -489,15 +687,116 @@ class Patch(SubmissionMixin):
         for tag in tags:
             self._set_tag(tag, counter[tag])
 
+        # counts for tags the project doesn't use are left as they are
+        counts = unpack_counts(self.tag_counts)
+        counts.update((tag.id, counter[tag]) for tag in tags)
+        self._set_tag_counts(counts)
+
+    def add_tag_counts(self, counts):
+        """Add to the tag counts, such as for a new comment.
+
+        Unlike ``refresh_tag_counts``, this doesn't rescan the patch and
+        its comments. Changes are applied atomically so that comments
+        received at the same time are all counted.
+
+        Args:
+            counts: A mapping of tags to the number of times each was
+                given, as returned by ``extract_tags``.
+        """
+        counts = {tag: count for tag, count in counts.items() if count}
+        if not counts:
+            return
+
+        with transaction.atomic():
+            # serialise updates to the counts of this patch
+            list(Patch.objects.select_for_update().filter(
+                pk=self.pk).values_list('pk'))
+
+            for tag, count in counts.items():
+                if not PatchTag.objects.filter(patch=self, tag=tag).update(
+                        count=models.F('count') + count):
+                    PatchTag.objects.create(patch=self, tag=tag, count=count)
+
+            tag_counts = pack_counts(dict(
+                self.patchtag_set.values_list('tag_id', 'count')))
+            Patch.objects.filter(pk=self.pk).update(tag_counts=tag_counts)
+
+        self.tag_counts = tag_counts
+        self.__dict__.pop('_tag_counts', None)
+
+    def _set_tag_counts(self, counts):
+        tag_counts = pack_counts(counts)
+        if tag_counts != self.tag_counts:
+            # this bypasses 'save' and so the pre_save handlers that generate
+            # events, which is fine as the counts are derived data
+            Patch.objects.filter(pk=self.pk).update(tag_counts=tag_counts)
+            self.tag_counts = tag_counts
+        self.__dict__.pop('_tag_counts', None)
+
+    @cached_property
+    def _tag_counts(self):
+        return unpack_counts(self.tag_counts)
+
+    def get_tag_count(self, tag):
+        """Return the number of times a tag was given for this patch."""
+        return self._tag_counts.get(tag.id, 0)
+
+    def set_diff_metadata(self, analyser):
+        """Set the hash and diffstat from an analysed diff.
+
+        Args:
+            analyser: A ``patchwork.hasher.DiffAnalyser`` that the diff
+                has been fed to.
+        """
+        if self.hash is None:
+            self.hash = analyser.hexdigest()
+
+        self.files_changed = len(analyser.files)
+        self.insertions = analyser.insertions
+        self.deletions = analyser.deletions
+
+        # these can only be saved once the patch has been
+        self._files = [
+            PatchFile(path=path[:255], insertions=insertions,
+                      deletions=deletions)
+            for path, (insertions, deletions) in analyser.files.items()]
+
+    def pop_files(self):
+        """Return the files set by ``set_diff_metadata``, if any.
+
+        This is for use when bulk creating patches, which bypasses
+        ``save``. The patch must have been saved already.
+
+        Returns:
+            A list of unsaved ``PatchFile`` instances for this patch, or
+            None if the diff hasn't been analysed.
+        """
+        files = getattr(self, '_files', None)
+        for patch_file in files or []:
+            patch_file.patch = self
+        self._files = None
+
+        return files
+
     def save(self, *args, **kwargs):
         if not hasattr(self, 'state') or not self.state:
             self.state = get_default_initial_patch_state()
 
+        # existing patches without a diffstat are left to the 'diffstat'
+        # command, rather than analysing their diff on every save
         if self.hash is None and self.diff is not None:
-            self.hash = hash_diff(self.diff)
+            self.set_diff_metadata(analyse_diff(self.diff))
+
+        adding = self._state.adding
 
         super(Patch, self).save(**kwargs)
 
+        files = self.pop_files()
+        if files is not None:
+            if not adding:
+                self.files.all().delete()
+            PatchFile.objects.bulk_create(files)
+
         self.refresh_tag_counts()
 
     def is_editable(self, user):
@@ -528,18 +827,7 @@ class Patch(SubmissionMixin):
           * success, if latest checks for all contexts reports as
               success
         """
-        state_names = dict(Check.STATE_CHOICES)
-        states = [check.state for check in self.checks]
-
-        if not states:
-            return state_names[Check.STATE_PENDING]
-
-        for state in [Check.STATE_FAIL, Check.STATE_WARNING,
-                      Check.STATE_PENDING]:  # order sensitive
-            if state in states:
-                return state_names[state]
-
-        return state_names[Check.STATE_SUCCESS]
+        return dict(Check.STATE_CHOICES)[self.check_state]
 
     @property
     def checks(self):
@@ -553,37 +841,8 @@ class Patch(SubmissionMixin):
         association of types to number of unique checks for said
         type.
         """
-        unique = {}
-        duplicates = []
-
-        for check in self.check_set.all():
-            ctx = check.context
-            user = check.user_id
-
-            if user in unique and ctx in unique[user]:
-                # recheck condition - ignore the older result
-                if unique[user][ctx].date > check.date:
-                    duplicates.append(check.id)
-                    continue
-                duplicates.append(unique[user][ctx].id)
-
-            if user not in unique:
-                unique[user] = {}
-
-            unique[user][ctx] = check
-
-        # filter out the "duplicates" or older, now-invalid results
-
-        # Why don't we use filter or exclude here? Surprisingly, it's
-        # an optimisation in the common case. Where we're looking at
-        # checks in anything that uses a generic_list() in the view,
-        # we do a prefetch_related('check_set'). But, if we then do a
-        # .filter or a .exclude, that throws out the existing, cached
-        # information, and does another query. (See the Django docs on
-        # prefetch_related.) So, do it 'by hand' in Python. We can
-        # also be confident that this won't be worse, seeing as we've
-        # just iterated over self.check_set.all() *anyway*.
-        return [c for c in self.check_set.all() if c.id not in duplicates]
+        return list(self.check_set.filter(is_latest=True).select_related(
+            'user'))
 
     @property
     def check_count(self):
@@ -597,12 +856,56 @@ class Patch(SubmissionMixin):
         of types to number of unique checks for said type.
         """
         counts = {key: 0 for key, _ in Check.STATE_CHOICES}
-
-        for check in self.checks:
-            counts[check.state] += 1
+        counts.update(unpack_counts(self.check_counts))
 
         return counts
 
+    def refresh_check_summary(self):
+        """Work out which checks are the latest and summarise them.
+
+        This is the full rebuild of what ``Check.save`` maintains as
+        checks are created, for use when checks are changed or deleted.
+        """
+        latest = {}
+        for check in self.check_set.only(
+                'user', 'context', 'date', 'state').order_by('id'):
+            key = (check.user_id, check.context)
+            # the newest check wins, or the last created if dates are equal
+            if key not in latest or check.date >= latest[key].date:
+                latest[key] = check
+
+        ids = [check.id for check in latest.values()]
+
+        with transaction.atomic():
+            self.check_set.filter(is_latest=True).exclude(id__in=ids).update(
+                is_latest=False)
+            self.check_set.filter(id__in=ids, is_latest=False).update(
+                is_latest=True)
+            self._set_check_summary(
+                [check.state for check in latest.values()])
+
+    def _set_check_summary(self, states):
+        counts = Counter(states)
+
+        check_state = Check.STATE_SUCCESS
+        if not counts:
+            check_state = Check.STATE_PENDING
+        else:
+            for state in [Check.STATE_FAIL, Check.STATE_WARNING,
+                          Check.STATE_PENDING]:  # order sensitive
+                if counts[state]:
+                    check_state = state
+                    break
+
+        check_counts = pack_counts(counts)
+
+        # this bypasses 'save' and so the pre_save handlers that generate
+        # events, which is fine as the summary is derived data
+        Patch.objects.filter(pk=self.pk).update(
+            check_state=check_state, check_counts=check_counts)
+        self.check_state = check_state
+        self.check_counts = check_counts
+
     def get_absolute_url(self):
         return reverse('patch-detail',
                        kwargs={'project_id': self.project.linkname,
@@ -635,6 +938,21 @@ class Patch(SubmissionMixin):
                 ],
                 name='patch_covering_idx',
             ),
+            # This serves lookups by hash, with or without a project
+            models.Index(
+                fields=['hash', 'project'],
+                name='patch_hash_project_idx',
+            ),
+            # This serves filtering by the combined state of checks
+            models.Index(
+                fields=['project', 'check_state'],
+                name='patch_check_state_idx',
+            ),
+            # This serves paginating a project's patches by date
+            models.Index(
+                fields=['project', 'date', 'id'],
+                name='patch_project_date_idx',
+            ),
         ]
 
 
@@ -692,8 +1010,17 @@ class PatchComment(EmailMixin, models.Model):
         return reverse('comment-redirect', kwargs={'comment_id': self.id})
 
     def save(self, *args, **kwargs):
+        adding = self._state.adding
+
         super(PatchComment, self).save(*args, **kwargs)
-        self.patch.refresh_tag_counts()
+
+        # a new comment can only add tags, so there's no need to rescan the
+        # patch and its other comments
+        if adding:
+            self.patch.add_tag_counts(
+                Patch.extract_tags(self.content, self.patch.project.tags))
+        else:
+            self.patch.refresh_tag_counts()
 
     def delete(self, *args, **kwargs):
         super(PatchComment, self).delete(*args, **kwargs)
@@ -710,6 +1037,35 @@ class PatchComment(EmailMixin, models.Model):
         ]
 
 
+class SeriesQuerySet(models.query.QuerySet):
+
+    def with_check_state(self):
+        """Annotate series with the combined state of their patches' checks.
+
+        Each series is given the number of its patches in each combined
+        check state, as ``patches_<state>``, and a ``check_state``
+        combining these in the same way as the checks of a patch: failure
+        if any patch is failing, then warning, then pending, and success
+        only if all patches are successful. A series without patches is
+        pending. This is a single aggregate query.
+        """
+        counts = {}
+        for state, name in Check.STATE_CHOICES:
+            counts['patches_%s' % name] = models.Count(
+                'patch', filter=models.Q(patch__check_state=state))
+
+        return self.annotate(**counts).annotate(
+            check_state=models.Case(
+                models.When(patches_fail__gt=0,
+                            then=models.Value(Check.STATE_FAIL)),
+                models.When(patches_warning__gt=0,
+                            then=models.Value(Check.STATE_WARNING)),
+                models.When(patches_success__gt=0, patches_pending=0,
+                            then=models.Value(Check.STATE_SUCCESS)),
+                default=models.Value(Check.STATE_PENDING),
+                output_field=models.SmallIntegerField()))
+
+
 class Series(FilenameMixin, models.Model):
     """A collection of patches."""
 
@@ -737,6 +1093,8 @@ class Series(FilenameMixin, models.Model):
     total = models.IntegerField(help_text='Number of patches in series as '
                                 'indicated by the subject prefix(es)')
 
+    objects = SeriesQuerySet.as_manager()
+
     @staticmethod
     def _format_name(obj):
         # The parser ensure 'Cover.name' will always take the form 'subject' or
@@ -924,6 +1282,79 @@ class PatchRelation(models.Model):
         return name
 
 
+class CheckQuerySet(models.query.QuerySet):
+
+    def create_checks(self, checks):
+        """Create many checks at once.
+
+        This is equivalent to saving each check in turn, but the checks are
+        inserted using a single query, where the database can return the IDs
+        of rows inserted in bulk, as are the 'check-created' events for
+        them. The check summary of each patch is updated once.
+
+        Args:
+            checks: A list of unsaved checks. Their patches should have been
+                retrieved along with their project.
+
+        Returns:
+            The checks, now saved.
+        """
+        patches = {check.patch_id: check.patch for check in checks}
+
+        with defer_events():
+            # serialise changes to the checks of these patches. Refer to
+            # 'Check.save'
+            list(Patch.objects.select_for_update().filter(
+                pk__in=patches).order_by('pk').values_list('pk'))
+
+            latest = {}
+            for check in self.filter(patch__in=patches, is_latest=True).only(
+                    'patch', 'user', 'context', 'date'):
+                latest[(check.patch_id, check.user_id, check.context)] = check
+            existing = list(latest.values())
+
+            for check in checks:
+                key = (check.patch_id, check.user_id, check.context)
+                current = latest.get(key)
+                check.is_latest = current is None or check.date >= current.date
+                if check.is_latest:
+                    if current is not None:
+                        current.is_latest = False
+                    latest[key] = check
+
+            features = connection.features
+            if getattr(features, 'can_return_rows_from_bulk_insert', getattr(
+                    features, 'can_return_ids_from_bulk_insert', False)):
+                self.bulk_create(checks)
+                for check in checks:
+                    record_event(
+                        category=Event.CATEGORY_CHECK_CREATED,
+                        project_id=check.patch.project_id,
+                        actor=check.user,
+                        patch=check.patch,
+                        created_check=check)
+            else:
+                # we need the IDs of checks for their events, so insert them
+                # one at a time, leaving the event to the post_save handler
+                for check in checks:
+                    models.Model.save(check)
+
+            self.filter(pk__in=[
+                check.pk for check in existing if not check.is_latest
+            ]).update(is_latest=False)
+
+            states = defaultdict(list)
+            for patch_id, state in self.filter(
+                    patch__in=patches, is_latest=True).values_list(
+                        'patch', 'state'):
+                states[patch_id].append(state)
+
+            for patch in patches.values():
+                patch._set_check_summary(states[patch.id])
+
+        return checks
+
+
 class Check(models.Model):
 
     """Check for a patch.
@@ -960,6 +1391,46 @@ class Check(models.Model):
         max_length=255, default='default',
         help_text='A label to discern check from checks of other testing '
         'systems.')
+    # whether this is the latest check of its user and context. Refer to
+    # 'Patch.checks'
+    is_latest = models.BooleanField(default=False, editable=False)
+
+    objects = CheckQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            with transaction.atomic():
+                super(Check, self).save(*args, **kwargs)
+                self.patch.refresh_check_summary()
+            return
+
+        with transaction.atomic():
+            # serialise changes to the checks of this patch
+            list(Patch.objects.select_for_update().filter(
+                pk=self.patch_id).values_list('pk'))
+
+            latest = Check.objects.filter(
+                patch=self.patch_id, user=self.user_id, context=self.context,
+                is_latest=True).only('date').first()
+            # a recheck replaces the previous result, unless it's older
+            self.is_latest = latest is None or self.date >= latest.date
+
+            super(Check, self).save(*args, **kwargs)
+
+            if not self.is_latest:
+                return
+
+            if latest:
+                Check.objects.filter(pk=latest.pk).update(is_latest=False)
+
+            self.patch._set_check_summary(Check.objects.filter(
+                patch=self.patch_id, is_latest=True).values_list(
+                    'state', flat=True))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            super(Check, self).delete(*args, **kwargs)
+            self.patch.refresh_check_summary()
 
     def __repr__(self):
         return "<Check id='%d' context='%s' state='%s'" % (
@@ -968,6 +1439,35 @@ class Check(models.Model):
     def __str__(self):
         return '%s (%s)' % (self.context, self.get_state_display())
 
+    class Meta:
+        indexes = [
+            # This serves lookups of the latest checks of a patch
+            models.Index(
+                fields=['patch', 'is_latest'],
+                name='check_latest_idx',
+            ),
+        ]
+
+
+class EventQuerySet(models.query.QuerySet):
+
+    def settled(self):
+        """Filter events older than ``EVENT_VISIBILITY_LAG`` seconds.
+
+        An event's ID is assigned when it's inserted, but it can only be
+        seen once the transaction inserting it commits, so events can be
+        seen out of order of ID. Events are assumed to be visible once they
+        are older than the lag, so settled events can be listed in order of
+        ID without any being skipped. As an event's date is set before it is
+        inserted, the lag must be at least twice as long as any transaction
+        creating events for this to hold.
+        """
+        return self.filter(date__lt=Event.get_settled_date())
+
+    def unsettled(self):
+        """Filter events that may not all be visible yet."""
+        return self.filter(date__gte=Event.get_settled_date())
+
 
 class Event(models.Model):
     """An event raised against a patch.
@@ -1080,11 +1580,192 @@ class Event(models.Model):
     # TODO(stephenfin): Validate that the correct fields are being set by way
     # of a 'clean' method
 
+    objects = EventQuerySet.as_manager()
+
+    @staticmethod
+    def get_settled_date():
+        """Return the date before which events are assumed to be visible."""
+        return datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=settings.EVENT_VISIBILITY_LAG)
+
     def __repr__(self):
         return "<Event id='%d' category='%s'" % (self.id, self.category)
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # These serve listing events by date, with or without a project
+            # and category. Refer to 'EventFilterSet'
+            models.Index(
+                fields=['date'],
+                name='event_date_idx',
+            ),
+            models.Index(
+                fields=['project', 'date'],
+                name='event_project_date_idx',
+            ),
+            models.Index(
+                fields=['project', 'category', 'date'],
+                name='event_project_category_idx',
+            ),
+            # This serves polling for events after a given event
+            models.Index(
+                fields=['project', 'id'],
+                name='event_project_id_idx',
+            ),
+        ]
+
+
+# The events buffered by 'defer_events', if any, for each thread
+_deferred_events = threading.local()
+
+
+@contextlib.contextmanager
+def defer_events():
+    """Buffer the events created in a block and create them in bulk.
+
+    Events recorded using ``record_event``, such as those created by the
+    signal handlers, are created using a single bulk insert at the end of
+    the block, rather than one at a time. The block runs in a transaction,
+    so the events are created along with the changes that caused them. They
+    are created in the order they were recorded, with the dates they were
+    recorded at.
+
+    Blocks can be nested, in which case the events are created at the end
+    of the outermost block. Events recorded in any savepoint that is rolled
+    back, such as a nested block or ``atomic`` block that raises an
+    exception, are discarded along with its changes.
+    """
+    if getattr(_deferred_events, 'events', None) is not None:
+        with transaction.atomic():
+            yield
+        return
+
+    events = []
+    # the length of the buffer when each savepoint was created, so the
+    # events recorded since can be discarded if it's rolled back
+    lengths = {}
+    savepoint = connection.savepoint
+    savepoint_rollback = connection.savepoint_rollback
+
+    def _savepoint():
+        sid = savepoint()
+        lengths[sid] = len(events)
+        return sid
+
+    def _savepoint_rollback(sid):
+        savepoint_rollback(sid)
+        if sid in lengths:
+            del events[lengths[sid]:]
+
+    connection.savepoint = _savepoint
+    connection.savepoint_rollback = _savepoint_rollback
+    _deferred_events.events = events
+    try:
+        with transaction.atomic():
+            yield
+            # bulk inserts don't send signals, so nothing can be recorded
+            # while these are created
+            _deferred_events.events = None
+            Event.objects.bulk_create(events)
+    finally:
+        _deferred_events.events = None
+        del connection.savepoint
+        del connection.savepoint_rollback
+
+
+def record_event(**kwargs):
+    """Create an event, or buffer it if in a ``defer_events`` block.
+
+    Returns:
+        The event, which is unsaved if it was buffered.
+    """
+    events = getattr(_deferred_events, 'events', None)
+    if events is None:
+        return Event.objects.create(**kwargs)
+
+    event = Event(**kwargs)
+    events.append(event)
+    return event
+
+
+class Webhook(models.Model):
+    """A URL that the events of a project are delivered to.
+
+    Events are delivered in batches by the 'webhookworker' management
+    command, in order of creation. Only events created after the webhook
+    are delivered.
+    """
+
+    project = models.ForeignKey(
+        Project, related_name='webhooks', on_delete=models.CASCADE)
+    url = models.URLField(
+        max_length=2000,
+        help_text='The URL that events are posted to.')
+    categories = models.CharField(
+        max_length=255, blank=True,
+        help_text='A comma-separated list of the categories of events to '
+        'deliver. If empty, events of all categories are delivered.')
+    secret = models.CharField(
+        max_length=255, blank=True,
+        help_text='If set, deliveries are signed with this using '
+        'HMAC-SHA256, with the signature given in the '
+        'X-Patchwork-Signature header.')
+    active = models.BooleanField(default=True)
+
+    # delivery state
+
+    last_event_id = models.IntegerField(
+        default=0, editable=False,
+        help_text='The ID of the last event delivered.')
+    failures = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text='The number of consecutive failed deliveries.')
+    next_attempt = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        help_text='The time of the next delivery, if retrying.')
+
+    def get_categories(self):
+        return [x.strip() for x in self.categories.split(',') if x.strip()]
+
+    def clean(self):
+        valid = {x for x, _ in Event.CATEGORY_CHOICES}
+        invalid = [x for x in self.get_categories() if x not in valid]
+        if invalid:
+            raise ValidationError({
+                'categories': 'Invalid categories: %s' % ', '.join(invalid)})
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.last_event_id:
+            # we only deliver events created from now on
+            self.last_event_id = Event.objects.filter(
+                project=self.project_id).aggregate(
+                    models.Max('id'))['id__max'] or 0
+
+        super(Webhook, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return self.url
+
+
+class WebhookDelivery(models.Model):
+    """An attempt to deliver a batch of events to a webhook."""
+
+    webhook = models.ForeignKey(
+        Webhook, related_name='deliveries', on_delete=models.CASCADE)
+    date = models.DateTimeField(default=datetime.datetime.utcnow)
+    first_event_id = models.IntegerField()
+    last_event_id = models.IntegerField()
+    event_count = models.PositiveIntegerField()
+    success = models.BooleanField()
+    status = models.PositiveSmallIntegerField(
+        null=True, blank=True,
+        help_text='The HTTP status of the response, if any.')
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Webhook deliveries'
 
 
 class EmailConfirmation(models.Model):
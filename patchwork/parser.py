@@ -4,28 +4,38 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import codecs
+import collections
 import datetime
 from email.header import decode_header
 from email.header import make_header
 from email.utils import mktime_tz
 from email.utils import parsedate_tz
 from email.errors import HeaderParseError
-from fnmatch import fnmatch
+import fnmatch
 import logging
 import re
+import time
 
 from django.contrib.auth.models import User
 from django.db.utils import IntegrityError
-from django.db import transaction
+from django.db.models.functions import Lower
 
+from patchwork.hasher import analyse_diff
+from patchwork.hasher import DiffConsumer
 from patchwork.models import Cover
 from patchwork.models import CoverComment
+from patchwork.models import defer_events
 from patchwork.models import DelegationRule
+from patchwork.models import Event
 from patchwork.models import get_default_initial_patch_state
+from patchwork.models import pack_counts
 from patchwork.models import Patch
 from patchwork.models import PatchComment
+from patchwork.models import PatchFile
+from patchwork.models import PatchTag
 from patchwork.models import Person
 from patchwork.models import Project
+from patchwork.models import record_event
 from patchwork.models import Series
 from patchwork.models import SeriesReference
 from patchwork.models import State
@@ -42,6 +52,23 @@ list_id_headers = ['List-ID', 'X-Mailing-List', 'X-list']
 # (such as when the mail is not threaded)
 SERIES_DELAY_INTERVAL = 20
 
+# How many mails should be saved at a time by 'parse_mails'?
+BULK_BATCH_SIZE = 500
+
+# The maximum number of values to look up in a single 'IN' query. Some
+# database backends limit the number of parameters a query can have.
+BULK_LOOKUP_SIZE = 500
+
+# How many seconds should compiled delegation rules be cached for? Changes
+# to rules are seen immediately by the process making them, but other
+# processes will only see them once this has passed
+DELEGATION_CACHE_TTL = 60
+
+# How many seconds should the list ID to project routing table be cached
+# for? As with delegation rules, other processes will only see changes to
+# projects once this has passed
+PROJECT_CACHE_TTL = 60
+
 # @see https://git-scm.com/docs/git-diff#_generating_patches_with_p
 EXTENDED_HEADER_LINES = (
     'old mode ', 'new mode ',
@@ -60,11 +87,6 @@ class DuplicateMailError(Exception):
         self.msgid = msgid
 
 
-class DuplicateSeriesError(Exception):
-
-    pass
-
-
 def normalise_space(value):
     whitespace_re = re.compile(r'\s+')
     return whitespace_re.sub(' ', value).strip()
@@ -146,22 +168,79 @@ def clean_header(header):
     return normalise_space(header_str)
 
 
+class ProjectRoutes(object):
+    """A routing table mapping list IDs to projects.
+
+    Each list ID maps to the projects using it, in order, along with their
+    precompiled ``subject_match`` patterns.
+    """
+
+    def __init__(self, projects):
+        self._routes = collections.defaultdict(list)
+        for project in projects:
+            pattern = None
+            if project.subject_match:
+                pattern = re.compile(project.subject_match,
+                                     re.MULTILINE | re.IGNORECASE)
+            self._routes[project.listid].append((pattern, project))
+
+    def find(self, list_id, subject):
+        """Find the project for a given list ID and subject, if any.
+
+        Since an empty ``subject_match`` matches everything, a project with
+        the given list ID and an empty ``subject_match`` serves as a default
+        if no other project matches.
+        """
+        default = None
+        for pattern, project in self._routes.get(list_id, ()):
+            if pattern is None:
+                default = project
+            elif pattern.search(subject):
+                return project
+
+        return default
+
+
+# (expiry, ProjectRoutes)
+_project_routes = None
+
+
+def get_project_routes():
+    """Return the list ID to project routing table.
+
+    This is cached until a project is changed. As this is only known to
+    the process making the change, the table also expires after
+    ``PROJECT_CACHE_TTL`` seconds so long-running processes will
+    eventually see changes made elsewhere.
+    """
+    global _project_routes
+
+    now = time.monotonic()
+
+    cached = _project_routes
+    if cached and cached[0] > now:
+        return cached[1]
+
+    routes = ProjectRoutes(Project.objects.all())
+    _project_routes = (now + PROJECT_CACHE_TTL, routes)
+
+    return routes
+
+
+def invalidate_project_routes():
+    """Remove the list ID to project routing table from the cache."""
+    global _project_routes
+
+    _project_routes = None
+
+
 def find_project_by_id_and_subject(list_id, subject):
     """Find a `project` object based on `list_id` and subject match.
     Since empty `subject_match` field matches everything, project with
     given `list_id` and empty `subject_match` field serves as a default
     (in case it exists) if no other match is found.
     """
-    projects = Project.objects.filter(listid=list_id)
-    default = None
-    for project in projects:
-        if not project.subject_match:
-            default = project
-        elif re.search(project.subject_match, subject,
-                       re.MULTILINE | re.IGNORECASE):
-            return project
-
-    return default
+    return get_project_routes().find(list_id, subject)
 
 
 def find_project(mail, list_id=None):
@@ -405,7 +484,15 @@ def get_original_sender(mail, name, email):
     return (name, email)
 
 
-def get_or_create_author(mail, project=None):
+def find_author(mail, project=None):
+    """Find the name and email address of the author of a mail.
+
+    Returns:
+        A tuple of the name, which may be None, and email address.
+
+    Raises:
+        ValueError if the 'From' header is missing or invalid
+    """
     from_header = clean_header(mail.get('From'))
 
     if not from_header:
@@ -423,6 +510,12 @@ def get_or_create_author(mail, project=None):
     if project and email.lower() == project.listemail.lower():
         name, email = get_original_sender(mail, name, email)
 
+    return name, email
+
+
+def get_or_create_author(mail, project=None):
+    name, email = find_author(mail, project)
+
     # this correctly handles the case where we lose the race to create
     # the person and another process beats us to it. (If the record
     # does not exist, g_o_c invokes _create_object_from_params which
@@ -652,6 +745,23 @@ def find_comment_content(mail):
     return None, commentbuf
 
 
+def find_mail_content(mail):
+    """Extract a comment and potential diff from a mail.
+
+    Replies are only searched for comments, while anything else may
+    also contain a diff. This does not touch the database, so it is
+    safe to call from worker processes.
+
+    Returns:
+        A tuple of the diff and comment, as returned by
+        ``find_patch_content`` or ``find_comment_content``.
+    """
+    if subject_check(mail.get('Subject')):
+        return find_comment_content(mail)
+
+    return find_patch_content(mail)
+
+
 def find_patch_for_comment(project, refs):
     for ref in refs:
         ref = ref[:255]
@@ -806,25 +916,27 @@ def clean_content(content):
     return content.strip()
 
 
-def parse_patch(content):
-    """Split a mail's contents into a diff and comment.
+def stream_patch(lines, on_diff, on_comment):
+    """Split the lines of a mail's contents into diff and comment lines.
 
     This is a state machine that takes a patch, generally in UNIX mbox
-    format, and splits it into the component comments and diff.
+    format, and splits it into the component comments and diff. Each
+    line is passed on as soon as we know which of these it belongs to,
+    which may not be until subsequent lines have been seen, so neither
+    needs to be held in memory.
 
     Args:
-        patch: The patch to be split
-
-    Returns:
-        A tuple containing the diff and comment. Either one or both of
-        these can be empty.
+        lines: An iterable of the lines of the patch, with or without
+            trailing newlines.
+        on_diff: Called with each line of the diff, in order, including
+            its trailing newline.
+        on_comment: Called with each line of the comment, in order,
+            including its trailing newline.
 
     Raises:
         Exception: The state machine transitioned to an invalid state.
     """
-    patchbuf = ''
-    commentbuf = ''
-    buf = ''
+    buf = []
 
     # state specified the line we just saw, and what to expect next
     state = 0
@@ -848,29 +960,55 @@ def parse_patch(content):
     #  6 -> 2 (---)
     #  6 -> 1 (other text)
     #
-    # Suspected patch header is stored into buf, and appended to
-    # patchbuf if we find a following hunk. Otherwise, append to
-    # comment after parsing.
+    # Suspected patch header is stored into buf, and passed on as part of
+    # the diff if we find a following hunk. Otherwise, pass it on as part
+    # of the comment.
 
     # line counts while parsing a patch hunk
     lc = (0, 0)
     hunk = 0
 
-    for line in content.split('\n'):
-        line += '\n'
+    def fn(x):
+        if not x:
+            return 1
+        return int(x)
+
+    for line in lines:
+        if line[-1:] != '\n':
+            line += '\n'
+
+        # hunk content is by far the most common state so check it first
+        if state == 5 or state == 4:
+            if line.startswith('-'):
+                lc[0] -= 1
+            elif line.startswith('+'):
+                lc[1] -= 1
+            elif line.startswith(r'\ No newline at end of file'):
+                # Special case: Not included as part of the hunk's line count
+                pass
+            else:
+                lc[0] -= 1
+                lc[1] -= 1
+
+            on_diff(line)
 
-        if state == 0:
+            if lc[0] <= 0 and lc[1] <= 0:
+                state = 3
+                hunk += 1
+            else:
+                state = 5
+        elif state == 0:
             if line.startswith('diff ') \
                     or line.startswith('Index: '):
                 state = 1
-                buf += line
+                buf.append(line)
             elif line.startswith('--- '):
                 state = 2
-                buf += line
+                buf.append(line)
             else:
-                commentbuf += line
+                on_comment(line)
         elif state == 1:
-            buf += line
+            buf.append(line)
             if line.startswith('--- '):
                 state = 2
             if line.startswith(EXTENDED_HEADER_LINES):
@@ -878,84 +1016,112 @@ def parse_patch(content):
         elif state == 2:
             if line.startswith('+++ '):
                 state = 3
-                buf += line
+                buf.append(line)
             elif hunk:
                 state = 1
-                buf += line
+                buf.append(line)
             else:
                 state = 0
-                commentbuf += buf + line
-                buf = ''
+                buf.append(line)
+                for buf_line in buf:
+                    on_comment(buf_line)
+                buf = []
         elif state == 3:
             match = _hunk_re.match(line)
             if match:
-                def fn(x):
-                    if not x:
-                        return 1
-                    return int(x)
-
                 lc = [fn(x) for x in match.groups()]
 
                 state = 4
-                patchbuf += buf + line
-                buf = ''
+                buf.append(line)
+                for buf_line in buf:
+                    on_diff(buf_line)
+                buf = []
             elif line.startswith('--- '):
-                patchbuf += buf + line
-                buf = ''
+                buf.append(line)
+                for buf_line in buf:
+                    on_diff(buf_line)
+                buf = []
                 state = 2
             elif hunk and line.startswith(r'\ No newline at end of file'):
                 # If we had a hunk and now we see this, it's part of the patch,
                 # and we're still expecting another @@ line.
-                patchbuf += line
+                on_diff(line)
             elif hunk:
                 state = 1
-                buf += line
+                buf.append(line)
             else:
                 state = 0
-                commentbuf += buf + line
-                buf = ''
-        elif state in [4, 5]:
-            if line.startswith('-'):
-                lc[0] -= 1
-            elif line.startswith('+'):
-                lc[1] -= 1
-            elif line.startswith(r'\ No newline at end of file'):
-                # Special case: Not included as part of the hunk's line count
-                pass
-            else:
-                lc[0] -= 1
-                lc[1] -= 1
-
-            patchbuf += line
-
-            if lc[0] <= 0 and lc[1] <= 0:
-                state = 3
-                hunk += 1
-            else:
-                state = 5
+                buf.append(line)
+                for buf_line in buf:
+                    on_comment(buf_line)
+                buf = []
         elif state == 6:
             if line.startswith(EXTENDED_HEADER_LINES):
-                patchbuf += buf + line
-                buf = ''
+                buf.append(line)
+                for buf_line in buf:
+                    on_diff(buf_line)
+                buf = []
             elif line.startswith('--- '):
-                patchbuf += buf + line
-                buf = ''
+                buf.append(line)
+                for buf_line in buf:
+                    on_diff(buf_line)
+                buf = []
                 state = 2
             else:
-                buf += line
+                buf.append(line)
                 state = 1
         else:
             raise Exception("Unknown state %d! (line '%s')" % (state, line))
 
-    commentbuf += buf
+    for buf_line in buf:
+        on_comment(buf_line)
 
-    if patchbuf == '':
-        patchbuf = None
 
-    if commentbuf == '':
-        commentbuf = None
+class _DiffTee(DiffConsumer):
+    """Feed the lines of a diff to multiple consumers."""
 
-    return patchbuf, commentbuf
+    def __init__(self, consumers):
+        super(_DiffTee, self).__init__()
+        self.consumers = consumers
+
+    def consume(self, lines):
+        for consumer in self.consumers:
+            consumer.consume(lines)
+
+
+def parse_patch(content, consumers=()):
+    """Split a mail's contents into a diff and comment.
+
+    Args:
+        content: The patch to be split, either as a string or as an
+            iterable of lines. Refer to ``stream_patch``.
+        consumers: A list of ``patchwork.hasher.DiffConsumer`` instances,
+            such as ``DiffHasher`` or ``FilenameFinder``, that the lines
+            of the diff are fed to. This avoids joining the diff only to
+            split it again in order to process it.
+
+    Returns:
+        A tuple containing the diff and comment. Either one or both of
+        these can be empty.
+
+    Raises:
+        Exception: The state machine transitioned to an invalid state.
+    """
+    if isinstance(content, str):
+        content = content.split('\n')
+
+    patchbuf = []
+    commentbuf = []
+
+    stream_patch(content, patchbuf.append, commentbuf.append)
+
+    if consumers:
+        # normalise the lines once, rather than once per consumer
+        tee = _DiffTee(consumers)
+        tee.update(patchbuf)
+        tee.finish()
+
+    return ''.join(patchbuf) or None, ''.join(commentbuf) or None
 
 
 def parse_pull_request(content):
@@ -981,30 +1147,142 @@ def find_state(mail):
     return get_default_initial_patch_state()
 
 
-def find_delegate_by_filename(project, filenames):
-    if not filenames:
-        return None
+class DelegationMatcher(object):
+    """Match filenames against a project's delegation rules.
 
-    rules = list(DelegationRule.objects.filter(project=project))
+    This is equivalent to matching each filename against each rule in
+    turn, in order of priority, using ``fnmatch``, but avoids doing so.
+    Literal paths are looked up directly, patterns whose only wildcard is
+    a trailing ``*`` are looked up using a prefix trie, and all other
+    patterns are combined into a single regex. Each of these finds the
+    highest priority rule that it holds, if any, and the highest priority
+    of these wins.
+    """
 
-    patch_delegate = None
+    _RULE = object()  # trie node key for a rule ending at that node
+
+    def __init__(self, rules):
+        """Compile a list of rules, ordered from highest priority."""
+        self.users = []
+        self._literals = {}
+        self._trie = {}
+
+        patterns = []
+        for index, rule in enumerate(rules):
+            self.users.append(rule.user)
+
+            path = rule.path
+            prefix = path.rstrip('*')
+            if not any(c in prefix for c in '*?['):
+                if prefix == path:
+                    self._literals.setdefault(path, index)
+                else:
+                    node = self._trie
+                    for c in prefix:
+                        node = node.setdefault(c, {})
+                    node.setdefault(self._RULE, index)
+                continue
 
-    for filename in filenames:
-        file_delegate = None
-        for rule in rules:
-            if fnmatch(filename, rule.path):
-                file_delegate = rule.user
+            # the alternatives of a regex are tried in order, so the first
+            # to match is the highest priority of the patterns. Each is
+            # named for its rule, as 'translate' can add groups of its own
+            # which would throw off group numbers. The group of the
+            # alternative closes last, so 'lastgroup' identifies it
+            patterns.append('(?P<r%d>%s)' % (index, fnmatch.translate(path)))
+
+        self._regex = None
+        if patterns:
+            self._regex = re.compile('|'.join(patterns))
+
+    def match(self, filename):
+        """Return the index of the highest priority matching rule."""
+        indexes = []
+
+        index = self._literals.get(filename)
+        if index is not None:
+            indexes.append(index)
+
+        node = self._trie
+        for c in filename:
+            if self._RULE in node:
+                indexes.append(node[self._RULE])
+            node = node.get(c)
+            if node is None:
                 break
+        else:
+            if self._RULE in node:
+                indexes.append(node[self._RULE])
 
-        if file_delegate is None:
-            return None
+        if self._regex:
+            match = self._regex.match(filename)
+            if match:
+                indexes.append(int(match.lastgroup[1:]))
+
+        return min(indexes) if indexes else None
+
+    def find_delegate(self, filenames):
+        """Find the delegate for all of the given files, if any.
 
-        if patch_delegate is not None and file_delegate != patch_delegate:
+        Returns:
+            The user that the highest priority matching rule for every
+            file delegates to, or None if any file doesn't match a rule or
+            if the files would be delegated to different users.
+        """
+        if not filenames:
             return None
 
-        patch_delegate = file_delegate
+        patch_delegate = None
+
+        for filename in filenames:
+            index = self.match(filename)
+            if index is None:
+                return None
+
+            file_delegate = self.users[index]
+            if patch_delegate is not None and file_delegate != patch_delegate:
+                return None
+
+            patch_delegate = file_delegate
 
-    return patch_delegate
+        return patch_delegate
+
+
+# project ID -> (expiry, DelegationMatcher)
+_delegation_matchers = {}
+
+
+def get_delegation_matcher(project):
+    """Return the compiled delegation rules for a project.
+
+    These are cached until the project's rules are changed. As this is
+    only known to the process making the change, entries also expire
+    after ``DELEGATION_CACHE_TTL`` seconds so long-running processes will
+    eventually see changes made elsewhere.
+    """
+    now = time.monotonic()
+
+    cached = _delegation_matchers.get(project.id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    rules = DelegationRule.objects.filter(
+        project=project).select_related('user')
+    matcher = DelegationMatcher(list(rules))
+    _delegation_matchers[project.id] = (now + DELEGATION_CACHE_TTL, matcher)
+
+    return matcher
+
+
+def invalidate_delegation_matcher(project_id):
+    """Remove a project's compiled delegation rules from the cache."""
+    _delegation_matchers.pop(project_id, None)
+
+
+def find_delegate_by_filename(project, filenames):
+    if not filenames:
+        return None
+
+    return get_delegation_matcher(project).find_delegate(filenames)
 
 
 def find_delegate_by_header(mail):
@@ -1019,12 +1297,19 @@ def find_delegate_by_header(mail):
     return None
 
 
-def parse_mail(mail, list_id=None):
+def parse_mail(mail, list_id=None, content=None):
     """Parse a mail and add to the database.
 
+    This uses the same parser as ``parse_mails`` but, as mails belonging to
+    the same series are often received at once, the mail is parsed again
+    if it conflicts with a mail saved in the meantime.
+
     Args:
         mail (`mbox.Mail`): Mail to parse and add.
         list_id (str): Mailing list ID
+        content (tuple): The diff and comment of the mail, as returned
+            by ``find_mail_content``. If not provided, these will be
+            extracted from the mail.
 
     Returns:
         patch/cover letter/comment
@@ -1036,309 +1321,898 @@ def parse_mail(mail, list_id=None):
         ValueError if there is an error in parsing or a duplicate mail
         Other truly unexpected issues may bubble up from the DB.
     """
-    # some basic sanity checks
-    if 'From' not in mail:
-        raise ValueError("Missing 'From' header")
+    parser = _MailParser(list_id)
 
-    if 'Subject' not in mail:
-        raise ValueError("Missing 'Subject' header")
+    for attempt in range(1, 11):  # arbitrary retry count
+        try:
+            [(result, error)] = parser.parse([(mail, content)])
+            break
+        except IntegrityError:
+            if attempt == 10:
+                raise
 
-    if 'Message-Id' not in mail:
-        raise ValueError("Missing 'Message-Id' header")
+            # we lost the race so go again
+            logger.warning('Conflict while saving mail. This is probably '
+                           'because multiple mails belonging to the same '
+                           'series have been received at once. Trying '
+                           'again (attempt %02d/10)', attempt)
 
-    hint = clean_header(mail.get('X-Patchwork-Hint', ''))
-    if hint and hint.lower() == 'ignore':
-        logger.info("Ignoring email due to 'ignore' hint")
-        return
+    if error is not None:
+        raise error
 
-    project = find_project(mail, list_id)
+    return result
 
-    if project is None:
-        logger.error('Failed to find a project for email')
-        return
 
-    # parse metadata
+def _chunks(values, size=BULK_LOOKUP_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
 
-    msgid = clean_header(mail.get('Message-Id'))
-    if not msgid:
-        raise ValueError("Broken 'Message-Id' header")
-    msgid = msgid[:255]
 
-    subject = mail.get('Subject')
-    name, prefixes = clean_subject(subject, [project.linkname])
-    is_comment = subject_check(subject)
-    x, n = parse_series_marker(prefixes)
-    version = parse_version(name, prefixes)
-    refs = find_references(mail)
-    date = find_date(mail)
-    headers = find_headers(mail)
+def _refresh_relations(obj, *names):
+    """Refresh foreign keys to objects that were unsaved when assigned."""
+    for name in names:
+        field = obj._meta.get_field(name)
+        if field.is_cached(obj):
+            setattr(obj, name, field.get_cached_value(obj))
 
-    # parse content
 
-    if not is_comment:
-        diff, message = find_patch_content(mail)
-    else:
-        diff, message = find_comment_content(mail)
+def _bulk_create(model, objs, *fields):
+    """Insert objects in bulk, ensuring their primary keys are set.
+
+    Not all database backends return primary keys from bulk inserts so,
+    where necessary, these are looked up using the given fields, which
+    must uniquely identify each object.
+    """
+    model.objects.bulk_create(objs)
+
+    missing = {tuple(getattr(obj, field) for field in fields): obj
+               for obj in objs if obj.pk is None}
+    for values in _chunks({key[-1] for key in missing}):
+        rows = model.objects.filter(**{
+            '%s__in' % fields[-1]: values,
+        }).values_list('pk', *fields)
+        for row in rows:
+            obj = missing.get(tuple(row[1:]))
+            if obj is not None:
+                obj.pk = row[0]
+
+
+class _MailRecord(object):
+    """A mail being parsed by ``_MailParser``."""
+
+    def __init__(self, mail):
+        self.mail = mail
+        self.project = None
+        self.result = None
+        self.error = None
+
+
+class _MailParser(object):
+    """Parse batches of mails and add them to the database.
+
+    This is used by both ``parse_mail`` and ``parse_mails``, a single mail
+    being a batch of one. State that is unlikely to change during an
+    import, such as states, is loaded once, while projects are found using
+    the shared routing table. Everything else is loaded for each batch.
+    Objects are threaded in memory before being saved so relationships to
+    objects that have yet to be saved are refreshed just before saving.
+    Refer to ``parse_mails`` for more information.
+    """
+
+    def __init__(self, list_id=None):
+        self.list_id = list_id
+
+        self.states = {state.name.lower(): state
+                       for state in State.objects.all()}
+        self.default_state = None
+        self.delegates = {}
+        self.persons = {}
+
+    def parse(self, items):
+        """Parse a batch of mails and add them to the database.
+
+        Args:
+            items: A list of (mail, content) tuples, as for ``parse_mails``.
+
+        Returns:
+            A (result, error) tuple for each mail, as for ``parse_mails``.
+
+        Raises:
+            IntegrityError if the batch conflicts with mails saved in the
+            meantime, in which case nothing is saved.
+        """
+        self.series = {}
+        self.series_patches = {}
+        self.series_refs = {}
+        self.new_series = []
+        self.new_references = []
+        self.updated_series = {}
+        self.covered = set()
+        self.patches = {}
+        self.covers = {}
+        self.cover_names = collections.Counter()
+        self.patch_comments = {}
+        self.patch_comment_keys = set()
+        self.cover_comments = {}
+        self.cover_comment_keys = set()
+        self.updated_persons = {}
+        self.events = []
+
+        records = []
+        for mail, content in items:
+            record = _MailRecord(mail)
+            try:
+                self._extract(record, content)
+            except Exception as exc:
+                record.project = None
+                record.error = exc
+            records.append(record)
+
+        self._prefetch(records)
 
-    if not (diff or message):
-        return  # nothing to work with
+        for record in records:
+            if not record.project:
+                continue
 
-    pull_url = parse_pull_request(message)
+            try:
+                self._resolve(record)
+            except (DuplicateMailError, ValueError) as exc:
+                record.error = exc
 
-    # build objects
+        try:
+            self._save(records)
+        except IntegrityError:
+            # any new people were not saved
+            self.persons = {}
+            raise
 
-    if not is_comment and (diff or pull_url):  # patches or pull requests
-        # we delay the saving until we know we have a patch.
-        author = get_or_create_author(mail, project)
+        return [(record.result, record.error) for record in records]
 
-        delegate = find_delegate_by_header(mail)
-        if not delegate and diff:
-            filenames = find_filenames(diff)
-            delegate = find_delegate_by_filename(project, filenames)
+    # extraction
 
-        with transaction.atomic():
-            if Patch.objects.filter(project=project, msgid=msgid):
-                raise DuplicateMailError(msgid=msgid)
+    def _extract(self, record, content):
+        mail = record.mail
 
-            patch = Patch.objects.create(
-                msgid=msgid,
-                project=project,
-                name=name[:255],
-                date=date,
-                headers=headers,
-                submitter=author,
-                content=message,
-                diff=diff,
-                pull_url=pull_url,
-                delegate=delegate,
-                state=find_state(mail))
-            logger.debug('Patch saved')
-
-        for attempt in range(1, 11):  # arbitrary retry count
-            try:
-                with transaction.atomic():
-                    # if we don't have a series marker, we will never have an
-                    # existing series to match against.
-                    series = None
-                    if n:
-                        series = find_series(project, mail, author)
-                        if len(series) > 1:
-                            # if this isn't our final attempt, go again
-                            if attempt != 10:
-                                raise DuplicateSeriesError()
-
-                            # if it is and we still haven't been able to save a
-                            # series, it's time to give up and just save yet
-                            # another duplicate - find the best possible match
-                            for series in series.order_by('-date'):
-                                if Patch.objects.filter(
-                                        series=series, number=x).count():
-                                    continue
-                                break
-                            else:
-                                series = None
-                        elif len(series) == 1:
-                            series = series.first()
-                    else:
-                        x = n = 1
-
-                    # We will create a new series if:
-                    # - there is no existing series to assign this patch to, or
-                    # - there is an existing series, but it already has a patch
-                    #   with this number in it
-                    if not series or Patch.objects.filter(
-                            series=series, number=x).count():
-                        series = Series.objects.create(
-                            project=project,
-                            date=date,
-                            submitter=author,
-                            version=version,
-                            total=n)
-
-                        # NOTE(stephenfin) We must save references for series.
-                        # We do this to handle the case where a later patch is
-                        # received first. Without storing references, it would
-                        # not be possible to identify the relationship between
-                        # patches as the earlier patch does not reference the
-                        # later one.
-                        for ref in refs + [msgid]:
-                            ref = ref[:255]
-                            # we don't want duplicates
-                            try:
-                                # we could have a ref to a previous series.
-                                # (For example, a series sent in reply to
-                                # another series.) That should not create a
-                                # series ref for this series, so check for the
-                                # msg-id only, not the msg-id/series pair.
-                                SeriesReference.objects.get(
-                                    msgid=ref, project=project)
-                            except SeriesReference.DoesNotExist:
-                                SeriesReference.objects.create(
-                                    msgid=ref, project=project, series=series)
-
-                        # attempt to pull the series in again, raising an
-                        # exception if we lost the race when creating a series
-                        # and force us to go through this again
-                        if attempt != 10 and find_series(
-                                project, mail, author).count() > 1:
-                            raise DuplicateSeriesError()
+        # some basic sanity checks
+        if 'From' not in mail:
+            raise ValueError("Missing 'From' header")
 
-                    break
-            except (IntegrityError, DuplicateSeriesError):
-                # we lost the race so go again
-                logger.warning('Conflict while saving series. This is '
-                               'probably because multiple patches belonging '
-                               'to the same series have been received at '
-                               'once. Trying again (attempt %02d/10)',
-                               attempt)
+        if 'Subject' not in mail:
+            raise ValueError("Missing 'Subject' header")
+
+        if 'Message-Id' not in mail:
+            raise ValueError("Missing 'Message-Id' header")
+
+        hint = clean_header(mail.get('X-Patchwork-Hint', ''))
+        if hint and hint.lower() == 'ignore':
+            logger.info("Ignoring email due to 'ignore' hint")
+            return
+
+        project = find_project(mail, self.list_id)
+
+        if project is None:
+            logger.error('Failed to find a project for email')
+            return
+
+        # parse metadata
+
+        msgid = clean_header(mail.get('Message-Id'))
+        if not msgid:
+            raise ValueError("Broken 'Message-Id' header")
+        record.msgid = msgid[:255]
+
+        subject = mail.get('Subject')
+        record.name, prefixes = clean_subject(subject, [project.linkname])
+        record.is_comment = subject_check(subject)
+        record.x, record.n = parse_series_marker(prefixes)
+        record.version = parse_version(record.name, prefixes)
+        record.refs = find_references(mail)
+        record.date = find_date(mail)
+        record.headers = find_headers(mail)
+
+        # parse content
+
+        if content is None:
+            content = find_mail_content(mail)
+
+        record.diff, record.message = content
+
+        if not (record.diff or record.message):
+            return  # nothing to work with
+
+        record.pull_url = parse_pull_request(record.message)
+
+        # we don't know if we need the author yet, so any error is raised
+        # when we do
+        try:
+            record.author = find_author(mail, project)
+        except ValueError as exc:
+            record.author = exc
+
+        record.project = project
+
+    # lookups
+
+    def _prefetch(self, records):
+        """Load everything the batch could refer to."""
+        records = [record for record in records if record.project]
+
+        projects = {record.project.id for record in records}
+        msgids = set()
+        emails = set()
+        cover_names = set()
+
+        for record in records:
+            msgids.add(record.msgid)
+            msgids.update(ref[:255] for ref in record.refs)
+
+            if not isinstance(record.author, Exception):
+                emails.add(record.author[1].lower())
+
+            if (record.x == 0 and record.refs and not record.is_comment and
+                    not (record.diff or record.pull_url)):
+                cover_names.add(record.name)
+
+        for values in _chunks(msgids):
+            refs = SeriesReference.objects.filter(
+                project__in=projects, msgid__in=values,
+            ).select_related('series')
+            for ref in refs:
+                self.series_refs[(ref.project_id, ref.msgid)] = (
+                    self._get_series(ref.series))
+
+            patches = Patch.objects.filter(
+                project__in=projects, msgid__in=values,
+            ).defer('content', 'diff', 'headers')
+            for patch in patches:
+                self.patches[(patch.project_id, patch.msgid)] = patch
+
+            comments = PatchComment.objects.filter(
+                patch__project__in=projects, msgid__in=values,
+            ).select_related('patch').defer(
+                'content', 'headers',
+                'patch__content', 'patch__diff', 'patch__headers',
+            ).order_by('date')
+            for comment in comments:
+                patch = comment.patch
+                # if there are multiple comments with the same message ID,
+                # we use the latest - see 'find_patch_for_comment'
+                self.patch_comments[(patch.project_id, comment.msgid)] = (
+                    patch)
+                self.patch_comment_keys.add(
+                    (patch.project_id, patch.msgid, comment.msgid))
+
+            covers = Cover.objects.filter(
+                project__in=projects, msgid__in=values,
+            ).defer('content', 'headers')
+            for cover in covers:
+                self.covers[(cover.project_id, cover.msgid)] = cover
+
+            comments = CoverComment.objects.filter(
+                cover__project__in=projects, msgid__in=values,
+            ).select_related('cover').defer(
+                'content', 'headers', 'cover__content', 'cover__headers',
+            ).order_by('date')
+            for comment in comments:
+                cover = comment.cover
+                self.cover_comments[(cover.project_id, comment.msgid)] = (
+                    cover)
+                self.cover_comment_keys.add(
+                    (cover.project_id, cover.msgid, comment.msgid))
+
+        for series in self.series.values():
+            self.series_patches[id(series)] = {}
+
+        for values in _chunks(self.series):
+            patches = Patch.objects.filter(series__in=values).only(
+                'id', 'project', 'msgid', 'name', 'series', 'number')
+            for patch in patches:
+                series = self.series[patch.series_id]
+                self.series_patches[id(series)][patch.number] = patch
+
+        for values in _chunks(cover_names):
+            names = Cover.objects.filter(name__in=values).values_list(
+                'name', flat=True)
+            self.cover_names.update(names)
+
+        emails -= set(self.persons)
+        for values in _chunks(emails):
+            persons = Person.objects.annotate(
+                email_lower=Lower('email'),
+            ).filter(email_lower__in=values)
+            for person in persons:
+                self.persons.setdefault(person.email_lower, person)
+
+    def _get_series(self, series):
+        """Return the one instance of a series used for the batch."""
+        return self.series.setdefault(series.pk, series)
+
+    def _get_series_patches(self, series):
+        """Return a mapping of numbers to patches for a series."""
+        if id(series) not in self.series_patches:
+            # this is a series we've found using series markers
+            patches = Patch.objects.filter(series=series).only(
+                'id', 'project', 'msgid', 'name', 'series', 'number')
+            self.series_patches[id(series)] = {
+                patch.number: patch for patch in patches}
+
+        return self.series_patches[id(series)]
+
+    def _get_person(self, record):
+        if isinstance(record.author, Exception):
+            raise record.author
+
+        name, email = record.author
+
+        person = self.persons.get(email.lower())
+        if person is None:
+            person = Person(name=name, email=email)
+            self.persons[email.lower()] = person
+        elif name and name != person.name:  # use the latest provided name
+            person.name = name
+            if person.pk:
+                self.updated_persons[person.pk] = person
+
+        return person
+
+    def _find_state(self, mail):
+        state_name = clean_header(mail.get('X-Patchwork-State', ''))
+        if state_name and state_name.lower() in self.states:
+            return self.states[state_name.lower()]
+
+        if self.default_state is None:
+            self.default_state = get_default_initial_patch_state()
+
+        return self.default_state
+
+    def _find_delegate(self, record, analyser):
+        delegate = None
+
+        delegate_email = clean_header(
+            record.mail.get('X-Patchwork-Delegate', ''))
+        if delegate_email:
+            if delegate_email.lower() not in self.delegates:
+                self.delegates[delegate_email.lower()] = (
+                    find_delegate_by_header(record.mail))
+            delegate = self.delegates[delegate_email.lower()]
+
+        if not delegate and record.diff:
+            delegate = find_delegate_by_filename(
+                record.project, analyser.filenames)
+
+        return delegate
+
+    def _find_series(self, record, author):
+        """Find a series for a patch, as done by ``find_series``."""
+        project = record.project
+
+        for ref in [record.msgid] + record.refs:
+            series = self.series_refs.get((project.id, ref[:255]))
+            if series:
+                return series
+
+        delta = datetime.timedelta(minutes=SERIES_DELAY_INTERVAL)
+        start_date = record.date - delta
+        end_date = record.date + delta
+
+        candidates = []
+        if author.pk:
+            candidates = [self._get_series(series) for series in
+                          _find_series_by_markers(project, record.mail,
+                                                  author)]
+
+        candidates += [
+            series for series in self.new_series
+            if series.project_id == project.id and
+            series.submitter is author and
+            series.version == record.version and
+            series.total == record.n and
+            start_date <= series.date <= end_date]
+
+        if len(candidates) == 1:
+            return candidates[0]
+
+        # find the best possible match
+        candidates.sort(key=lambda series: series.date, reverse=True)
+        for series in candidates:
+            if record.x not in self._get_series_patches(series):
+                return series
+
+    def _find_patch_for_comment(self, project, refs):
+        for ref in refs:
+            key = (project.id, ref[:255])
+            if key in self.patches:
+                return self.patches[key]
+
+            if key in self.patch_comments:
+                return self.patch_comments[key]
+
+    def _find_cover_for_comment(self, project, refs):
+        for ref in refs:
+            key = (project.id, ref[:255])
+            if key in self.covers:
+                return self.covers[key]
+
+            if key in self.cover_comments:
+                return self.cover_comments[key]
+
+    # threading
+
+    def _resolve(self, record):
+        # if refs are empty, it's implicitly a cover letter. If not, however,
+        # we need to see if a match already exists and, if not, assume that
+        # it is indeed a new cover letter. Multiple matches are ignored
+        if not record.is_comment and (record.diff or record.pull_url):
+            self._resolve_patch(record)
+        elif (record.x == 0 and not record.is_comment and (
+                not record.refs or not self.cover_names[record.name])):
+            self._resolve_cover(record)
         else:
-            # we failed to save the series so return the series-less patch
-            logger.warning('Failed to save series. Your patch with message ID '
-                           '%s has been saved but this should not happen. '
-                           'Please report this as a bug and include logs',
-                           msgid)
-            return patch
+            self._resolve_comment(record)
 
-        # add to a series if we have found one, and we have a numbered
-        # patch. Don't add unnumbered patches (for example diffs sent
-        # in reply, or just messages with random refs/in-reply-tos)
-        if series and x:
-            # TODO(stephenfin): Remove 'series' from the conditional as we will
-            # always have a series
-            series.add_patch(patch, x)
-
-        return patch
-    elif x == 0:  # (potential) cover letters
-        # if refs are empty, it's implicitly a cover letter. If not,
-        # however, we need to see if a match already exists and, if
-        # not, assume that it is indeed a new cover letter
-        is_cover_letter = False
-        if not is_comment:
-            if not refs == []:
-                try:
-                    Cover.objects.all().get(name=name)
-                except Cover.DoesNotExist:
-                    # if no match, this is a new cover letter
-                    is_cover_letter = True
-                except Cover.MultipleObjectsReturned:
-                    # if multiple cover letters are found, just ignore
-                    pass
-            else:
-                is_cover_letter = True
+    def _resolve_patch(self, record):
+        project = record.project
 
-        if is_cover_letter:
-            author = get_or_create_author(mail, project)
+        author = self._get_person(record)
+        analyser = None
+        if record.diff is not None:
+            analyser = analyse_diff(record.diff)
 
-            # we don't use 'find_series' here as a cover letter will
-            # always be the first item in a thread, thus the references
-            # could only point to a different series or unrelated
-            # message
-            try:
-                series = SeriesReference.objects.get(
-                    msgid=msgid, project=project).series
-            except SeriesReference.DoesNotExist:
-                series = None
-
-            if not series:
-                series = Series.objects.create(
-                    project=project,
-                    date=date,
-                    submitter=author,
-                    version=version,
-                    total=n)
-
-                # we don't save the in-reply-to or references fields
-                # for a cover letter, as they can't refer to the same
-                # series
-                SeriesReference.objects.create(
-                    msgid=msgid, project=project, series=series)
-
-            with transaction.atomic():
-                if Cover.objects.filter(project=project, msgid=msgid):
-                    raise DuplicateMailError(msgid=msgid)
-
-                cover_letter = Cover.objects.create(
-                    msgid=msgid,
-                    project=project,
-                    name=name[:255],
-                    date=date,
-                    headers=headers,
-                    submitter=author,
-                    content=message)
-
-            logger.debug('Cover letter saved')
-
-            series.add_cover_letter(cover_letter)
-
-            return cover_letter
-
-    # comments
-
-    # we only save comments if we have the parent email
-    patch = find_patch_for_comment(project, refs)
-    if patch:
-        author = get_or_create_author(mail, project)
-
-        with transaction.atomic():
-            if PatchComment.objects.filter(patch=patch, msgid=msgid):
-                raise DuplicateMailError(msgid=msgid)
-            comment = PatchComment.objects.create(
+        delegate = self._find_delegate(record, analyser)
+
+        key = (project.id, record.msgid)
+        if key in self.patches:
+            raise DuplicateMailError(msgid=record.msgid)
+
+        patch = Patch(
+            msgid=record.msgid,
+            project=project,
+            name=record.name[:255],
+            date=record.date,
+            headers=record.headers,
+            submitter=author,
+            content=_clean_newlines(record.message),
+            diff=record.diff,
+            pull_url=record.pull_url,
+            delegate=delegate,
+            state=self._find_state(record.mail))
+        if analyser is not None:
+            patch.set_diff_metadata(analyser)
+        self.patches[key] = patch
+        self.events.append({
+            'category': Event.CATEGORY_PATCH_CREATED,
+            'project': project,
+            'patch': patch,
+        })
+        record.result = patch
+
+        x, n = record.x, record.n
+
+        # if we don't have a series marker, we will never have an existing
+        # series to match against.
+        series = None
+        if n:
+            series = self._find_series(record, author)
+        else:
+            x = n = 1
+
+        # We will create a new series if:
+        # - there is no existing series to assign this patch to, or
+        # - there is an existing series, but it already has a patch with
+        #   this number in it
+        if not series or x in self._get_series_patches(series):
+            series = self._create_series(record, author, n)
+            for ref in record.refs + [record.msgid]:
+                self._add_reference(project, ref, series)
+
+        # add to a series if we have a numbered patch
+        if x:
+            self._add_patch(series, patch, x)
+
+    def _resolve_cover(self, record):
+        project = record.project
+
+        author = self._get_person(record)
+
+        key = (project.id, record.msgid)
+        if key in self.covers:
+            raise DuplicateMailError(msgid=record.msgid)
+
+        # we don't use '_find_series' here as a cover letter will always be
+        # the first item in a thread, thus the references could only point
+        # to a different series or unrelated message. For the same reason,
+        # we don't save the references as references of the series
+        series = self.series_refs.get(key)
+        if not series:
+            series = self._create_series(record, author, record.n)
+            self._add_reference(project, record.msgid, series)
+
+        cover = Cover(
+            msgid=record.msgid,
+            project=project,
+            name=record.name[:255],
+            date=record.date,
+            headers=record.headers,
+            submitter=author,
+            content=_clean_newlines(record.message))
+        self.covers[key] = cover
+        self.cover_names[record.name] += 1
+        self.events.append({
+            'category': Event.CATEGORY_COVER_CREATED,
+            'project': project,
+            'cover': cover,
+        })
+        record.result = cover
+
+        self._add_cover_letter(series, cover)
+
+    def _resolve_comment(self, record):
+        project = record.project
+
+        # we only save comments if we have the parent email
+        patch = self._find_patch_for_comment(project, record.refs)
+        if patch:
+            author = self._get_person(record)
+
+            key = (patch.project_id, patch.msgid, record.msgid)
+            if key in self.patch_comment_keys:
+                raise DuplicateMailError(msgid=record.msgid)
+
+            self.patch_comment_keys.add(key)
+            self.patch_comments[(project.id, record.msgid)] = patch
+            record.result = PatchComment(
                 patch=patch,
-                msgid=msgid,
-                date=date,
-                headers=headers,
+                msgid=record.msgid,
+                date=record.date,
+                headers=record.headers,
                 submitter=author,
-                content=message)
+                content=_clean_newlines(record.message))
+            return
 
-        logger.debug('Comment saved')
+        cover = self._find_cover_for_comment(project, record.refs)
+        if not cover:
+            return
 
-        return comment
+        author = self._get_person(record)
 
-    cover = find_cover_for_comment(project, refs)
-    if not cover:
-        return
+        key = (cover.project_id, cover.msgid, record.msgid)
+        if key in self.cover_comment_keys:
+            raise DuplicateMailError(msgid=record.msgid)
 
-    author = get_or_create_author(mail, project)
-
-    with transaction.atomic():
-        if CoverComment.objects.filter(cover=cover, msgid=msgid):
-            raise DuplicateMailError(msgid=msgid)
-        comment = CoverComment.objects.create(
+        self.cover_comment_keys.add(key)
+        self.cover_comments[(project.id, record.msgid)] = cover
+        record.result = CoverComment(
             cover=cover,
-            msgid=msgid,
-            date=date,
-            headers=headers,
+            msgid=record.msgid,
+            date=record.date,
+            headers=record.headers,
+            submitter=author,
+            content=_clean_newlines(record.message))
+
+    def _create_series(self, record, author, total):
+        series = Series(
+            project=record.project,
+            date=record.date,
             submitter=author,
-            content=message)
+            version=record.version,
+            total=total)
+        self.new_series.append(series)
+        self.series_patches[id(series)] = {}
+        self.events.append({
+            'category': Event.CATEGORY_SERIES_CREATED,
+            'project': record.project,
+            'series': series,
+        })
 
-    logger.debug('Comment saved')
+        return series
 
-    return comment
+    def _add_reference(self, project, msgid, series):
+        # we must save references for series to handle the case where a
+        # later patch is received first. We could have a ref to a previous
+        # series, for example a series sent in reply to another series, so
+        # check for the msg-id only, not the msg-id/series pair
+        key = (project.id, msgid[:255])
+        if key in self.series_refs:
+            return
+
+        self.series_refs[key] = series
+        self.new_references.append(SeriesReference(
+            project=project, msgid=msgid[:255], series=series))
+
+    def _add_patch(self, series, patch, number):
+        """Add a patch to a series, as done by ``Series.add_patch``."""
+        patches = self._get_series_patches(series)
+
+        # both user defined names and cover letter-based names take
+        # precedence
+        if not series.name and number == 1:
+            series.name = patch.name
+            self._update_series(series)
+
+        # raise the events that saving the patch would
+        predecessors = [x for x in patches if x < number]
+        if len(predecessors) == number - 1:
+            self.events.append({
+                'category': Event.CATEGORY_PATCH_COMPLETED,
+                'project': patch.project,
+                'patch': patch,
+                'series': series,
+            })
+
+            count = number + 1
+            for successor in sorted(x for x in patches if x > number):
+                if successor != count:
+                    break
 
+                self.events.append({
+                    'category': Event.CATEGORY_PATCH_COMPLETED,
+                    'project': patch.project,
+                    'patch': patches[successor],
+                    'series': series,
+                })
+                count += 1
+
+        if len(patches) + 1 >= series.total:
+            self.events.append({
+                'category': Event.CATEGORY_SERIES_COMPLETED,
+                'project': series.project,
+                'series': series,
+            })
+
+        patch.series = series
+        patch.number = number
+        patches[number] = patch
+
+    def _add_cover_letter(self, series, cover):
+        """Add a cover letter to a series, as done by
+        ``Series.add_cover_letter``.
+        """
+        if series.cover_letter_id or id(series) in self.covered:
+            return
+
+        series.cover_letter = cover
+        self.covered.add(id(series))
+
+        if not series.name:
+            series.name = Series._format_name(cover)
+        else:
+            patch = self._get_series_patches(series).get(1)
+            if patch and series.name == patch.name:
+                series.name = Series._format_name(cover)
+
+        self._update_series(series)
+
+    def _update_series(self, series):
+        if series.pk:
+            self.updated_series[series.pk] = series
+
+    # saving
+
+    def _save(self, records):
+        objs = collections.defaultdict(list)
+        for record in records:
+            if record.result is not None:
+                objs[type(record.result)].append(record.result)
+
+        with defer_events():
+            persons = [person for person in self.persons.values()
+                       if person.pk is None]
+            _bulk_create(Person, persons, 'email')
+            Person.objects.bulk_update(
+                list(self.updated_persons.values()), ['name'])
+
+            for cover in objs[Cover]:
+                _refresh_relations(cover, 'submitter')
+            _bulk_create(Cover, objs[Cover], 'project_id', 'msgid')
+
+            # series are saved individually as not all database backends
+            # return primary keys from bulk inserts and there is nothing
+            # else to identify them by. They are saved as 'raw' so that the
+            # 'series-created' events are recorded with the others, in the
+            # order they happened
+            for series in self.new_series:
+                _refresh_relations(series, 'submitter', 'cover_letter')
+                series.save_base(raw=True)
+
+            for series in self.updated_series.values():
+                _refresh_relations(series, 'cover_letter')
+            Series.objects.bulk_update(
+                list(self.updated_series.values()), ['name', 'cover_letter'])
+
+            for ref in self.new_references:
+                _refresh_relations(ref, 'series')
+            SeriesReference.objects.bulk_create(self.new_references)
+
+            for patch in objs[Patch]:
+                _refresh_relations(patch, 'submitter', 'series')
+            _bulk_create(Patch, objs[Patch], 'project_id', 'msgid')
+            PatchFile.objects.bulk_create([
+                patch_file for patch in objs[Patch]
+                for patch_file in patch.pop_files() or []])
+
+            for comment in objs[PatchComment]:
+                _refresh_relations(comment, 'submitter', 'patch')
+            _bulk_create(PatchComment, objs[PatchComment], 'patch_id', 'msgid')
+
+            for comment in objs[CoverComment]:
+                _refresh_relations(comment, 'submitter', 'cover')
+            _bulk_create(CoverComment, objs[CoverComment], 'cover_id', 'msgid')
+
+            self._save_tags(records)
+
+            for event in self.events:
+                record_event(**event)
+
+        logger.debug('Saved %d mails', len(records))
+
+    def _save_tags(self, records):
+        """Update tag counts, as done by ``Patch.refresh_tag_counts``.
+
+        Comments are only ever added, so we only need to add their tags to
+        the existing counts.
+        """
+        counts = collections.defaultdict(collections.Counter)
+
+        for record in records:
+            tags = record.project.tags if record.project else None
+            if not tags:
+                continue
 
-def find_filenames(diff):
-    """Find files changes in a given diff."""
-    # normalise spaces
-    diff = diff.replace('\r', '')
-    diff = diff.strip() + '\n'
+            if isinstance(record.result, Patch):
+                patch = record.result
+                if patch.content:
+                    counts[patch.id] += Patch.extract_tags(
+                        patch.content, tags)
+            elif isinstance(record.result, PatchComment):
+                comment = record.result
+                counts[comment.patch_id] += Patch.extract_tags(
+                    comment.content, tags)
+
+        patchtags = {}
+        for values in _chunks(counts):
+            # serialise updates to the counts of these patches, as done by
+            # 'Patch.add_tag_counts'
+            list(Patch.objects.select_for_update().filter(
+                pk__in=values).values_list('pk'))
+            for patchtag in PatchTag.objects.filter(patch__in=values):
+                patchtags[(patchtag.patch_id, patchtag.tag_id)] = patchtag
+
+        new = []
+        updated = []
+        for patch_id, counter in counts.items():
+            for tag, count in counter.items():
+                if not count:
+                    continue
 
-    filenames = {}
+                patchtag = patchtags.get((patch_id, tag.id))
+                if patchtag:
+                    patchtag.count += count
+                    updated.append(patchtag)
+                else:
+                    patchtag = PatchTag(patch_id=patch_id, tag=tag,
+                                        count=count)
+                    patchtags[(patch_id, tag.id)] = patchtag
+                    new.append(patchtag)
 
-    for line in diff.split('\n'):
-        if len(line) <= 0:
-            continue
+        PatchTag.objects.bulk_create(new)
+        PatchTag.objects.bulk_update(updated, ['count'])
 
-        filename_match = _filename_re.match(line)
-        if not filename_match:
-            continue
+        # keep the copy of the counts stored with each patch in sync
+        tag_counts = collections.defaultdict(dict)
+        for (patch_id, tag_id), patchtag in patchtags.items():
+            tag_counts[patch_id][tag_id] = patchtag.count
 
-        filename = filename_match.group(2)
-        if filename.startswith('/dev/null'):
-            continue
+        Patch.objects.bulk_update(
+            [Patch(id=patch_id, tag_counts=pack_counts(patch_counts))
+             for patch_id, patch_counts in tag_counts.items()],
+            ['tag_counts'])
+
+
+def _clean_newlines(content):
+    # see 'EmailMixin.save'
+    if content:
+        return content.replace('\r\n', '\n')
+
+    return content
+
+
+def parse_mails(mails, list_id=None, batch_size=BULK_BATCH_SIZE):
+    """Parse mails and add them to the database in bulk.
 
-        filename = '/'.join(filename.split('/')[1:])
-        filenames[filename] = True
+    This is equivalent to calling ``parse_mail`` for each mail in turn,
+    but is intended for importing archives where doing so would result
+    in many queries for each mail. Mails are handled in batches. Each
+    batch is first parsed without touching the database. The patches,
+    series, comments and people that the batch refers to are then
+    loaded using a handful of queries, allowing the batch to be
+    threaded in memory, before everything is saved in a single
+    transaction using bulk inserts. Events are created in bulk at the
+    end of each batch.
 
-    filenames = sorted(filenames.keys())
+    If a batch cannot be saved, for example because some of its mails
+    were received at the same time, the mails are parsed individually
+    using ``parse_mail`` instead. Both use the same parser so, either way,
+    the result is the same as parsing each mail in turn.
+
+    Args:
+        mails: An iterable of (mail, content) tuples, where content is
+            the diff and comment of the mail, as returned by
+            ``find_mail_content``, or None to extract these from the
+            mail.
+        list_id (str): Mailing list ID
+        batch_size (int): Number of mails to save at a time
+
+    Yields:
+        A (result, error) tuple for each mail, in order, where result is
+        as returned by ``parse_mail`` and error is the exception that
+        ``parse_mail`` would have raised, if any.
+    """
+    parser = _MailParser(list_id)
+
+    batch = []
+    for mail in mails:
+        batch.append(mail)
+        if len(batch) >= batch_size:
+            yield from _parse_batch(parser, batch)
+            batch = []
+
+    if batch:
+        yield from _parse_batch(parser, batch)
+
+
+def _parse_batch(parser, items):
+    try:
+        return parser.parse(items)
+    except IntegrityError:
+        logger.warning('Conflict while saving a batch of %d mails. This is '
+                       'probably because some mails were received while '
+                       'parsing them. Parsing the mails individually '
+                       'instead', len(items))
+
+    results = []
+    for mail, content in items:
+        try:
+            results.append((parse_mail(mail, parser.list_id, content), None))
+        except Exception as exc:
+            results.append((None, exc))
+
+    return results
+
+
+class FilenameFinder(DiffConsumer):
+    """Find files changed in a diff, in chunks of lines."""
+
+    def __init__(self):
+        super(FilenameFinder, self).__init__()
+        self._filenames = set()
+
+    def consume(self, lines):
+        for line in lines:
+            # avoid matching every line against the regex as this is slow
+            if not line.startswith(('--- ', '+++ ')):
+                continue
+
+            filename_match = _filename_re.match(line)
+            if not filename_match:
+                continue
+
+            filename = filename_match.group(2)
+            if filename.startswith('/dev/null'):
+                continue
+
+            filename = '/'.join(filename.split('/')[1:])
+            self._filenames.add(filename)
+
+    @property
+    def filenames(self):
+        self.finish()
+        return sorted(self._filenames)
+
+
+def find_filenames(diff):
+    """Find files changes in a given diff."""
+    finder = FilenameFinder()
+    finder.update(diff.split('\n'))
 
-    return filenames
+    return finder.filenames
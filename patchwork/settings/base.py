@@ -218,6 +218,18 @@ ENABLE_REST_API = True
 REST_RESULTS_PER_PAGE = 30
 MAX_REST_RESULTS_PER_PAGE = 250
 
+# The number of seconds between polls for new events to send to event
+# streams, the number of seconds an event stream is kept open for, and the
+# maximum number of event streams each process serves at once
+EVENT_STREAM_INTERVAL = 1
+EVENT_STREAM_TIMEOUT = 300
+EVENT_STREAM_MAX_STREAMS = 10
+
+# The number of seconds after which events are assumed to be visible to
+# other clients. This should be at least twice as long as any transaction
+# creating events
+EVENT_VISIBILITY_LAG = 60
+
 # Set to True to enable redirections or URLs from previous versions
 # of patchwork
 COMPAT_REDIR = True
@@ -5,35 +5,58 @@
 
 from datetime import datetime as dt
 
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 
 from patchwork.models import Check
 from patchwork.models import Cover
+from patchwork.models import DelegationRule
 from patchwork.models import Event
+from patchwork.models import invalidate_tag_extractors
 from patchwork.models import Patch
 from patchwork.models import PatchChangeNotification
+from patchwork.models import Project
+from patchwork.models import record_event
 from patchwork.models import Series
+from patchwork.models import Tag
+from patchwork.parser import invalidate_delegation_matcher
+from patchwork.parser import invalidate_project_routes
 
 
 @receiver(pre_save, sender=Patch)
-def patch_change_callback(sender, instance, raw, **kwargs):
-    # we only want notification of modified patches
-    if raw or instance.pk is None:
-        return
+def patch_pre_save_callback(sender, instance, raw, **kwargs):
+    """Handle changes to existing patches.
 
-    if instance.project is None or not instance.project.send_notifications:
+    The original patch is loaded once and shared by each of the handlers
+    below, rather than each handler loading it for itself.
+    """
+    # don't trigger for items loaded from fixtures or new items
+    if raw or instance.pk is None:
         return
 
     try:
-        orig_patch = Patch.objects.get(pk=instance.pk)
+        orig_patch = Patch.objects.only(
+            'state', 'delegate', 'related', 'series').get(pk=instance.pk)
     except Patch.DoesNotExist:
         return
 
+    patch_change_callback(instance, orig_patch)
+    create_patch_state_changed_event(instance, orig_patch)
+    create_patch_delegated_event(instance, orig_patch)
+    create_patch_relation_changed_event(instance, orig_patch)
+    create_patch_completed_event(instance, orig_patch)
+    create_series_completed_event(instance, orig_patch)
+
+
+def patch_change_callback(instance, orig_patch):
     # If there's no interesting changes, abort without creating the
     # notification
-    if orig_patch.state == instance.state:
+    if orig_patch.state_id == instance.state_id:
+        return
+
+    if instance.project_id is None or not instance.project.send_notifications:
         return
 
     notification = None
@@ -43,9 +66,9 @@ def patch_change_callback(sender, instance, raw, **kwargs):
         pass
 
     if notification is None:
-        notification = PatchChangeNotification(patch=instance,
-                                               orig_state=orig_patch.state)
-    elif notification.orig_state == instance.state:
+        notification = PatchChangeNotification(
+            patch=instance, orig_state_id=orig_patch.state_id)
+    elif notification.orig_state_id == instance.state_id:
         # If we're back at the original state, there is no need to notify
         notification.delete()
         return
@@ -54,11 +77,33 @@ def patch_change_callback(sender, instance, raw, **kwargs):
     notification.save()
 
 
+@receiver(post_save, sender=DelegationRule)
+@receiver(post_delete, sender=DelegationRule)
+def invalidate_delegation_rules(sender, instance, **kwargs):
+    invalidate_delegation_matcher(instance.project_id)
+
+
+# projects cache their tags, so the routing table must be reloaded if these
+# change
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_projects(sender, instance, **kwargs):
+    invalidate_project_routes()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, instance, **kwargs):
+    invalidate_tag_extractors()
+
+
 @receiver(post_save, sender=Cover)
 def create_cover_created_event(sender, instance, created, raw, **kwargs):
 
     def create_event(cover):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_COVER_CREATED,
             project=cover.project,
             cover=cover)
@@ -74,7 +119,7 @@ def create_cover_created_event(sender, instance, created, raw, **kwargs):
 def create_patch_created_event(sender, instance, created, raw, **kwargs):
 
     def create_event(patch):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_PATCH_CREATED,
             project=patch.project,
             patch=patch)
@@ -86,98 +131,73 @@ def create_patch_created_event(sender, instance, created, raw, **kwargs):
     create_event(instance)
 
 
-@receiver(pre_save, sender=Patch)
-def create_patch_state_changed_event(sender, instance, raw, **kwargs):
+def create_patch_state_changed_event(instance, orig_patch):
 
     def create_event(patch, before, after):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_PATCH_STATE_CHANGED,
             project=patch.project,
             actor=getattr(patch, '_edited_by', None),
             patch=patch,
-            previous_state=before,
-            current_state=after)
+            previous_state_id=before,
+            current_state_id=after)
 
-    # don't trigger for items loaded from fixtures or new items
-    if raw or not instance.pk:
+    if orig_patch.state_id == instance.state_id:
         return
 
-    orig_patch = Patch.objects.get(pk=instance.pk)
+    create_event(instance, orig_patch.state_id, instance.state_id)
 
-    if orig_patch.state == instance.state:
-        return
 
-    create_event(instance, orig_patch.state, instance.state)
-
-
-@receiver(pre_save, sender=Patch)
-def create_patch_delegated_event(sender, instance, raw, **kwargs):
+def create_patch_delegated_event(instance, orig_patch):
 
     def create_event(patch, before, after):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_PATCH_DELEGATED,
             project=patch.project,
             actor=getattr(patch, '_edited_by', None),
             patch=patch,
-            previous_delegate=before,
-            current_delegate=after)
-
-    # don't trigger for items loaded from fixtures or new items
-    if raw or not instance.pk:
-        return
+            previous_delegate_id=before,
+            current_delegate_id=after)
 
-    orig_patch = Patch.objects.get(pk=instance.pk)
-
-    if orig_patch.delegate == instance.delegate:
+    if orig_patch.delegate_id == instance.delegate_id:
         return
 
-    create_event(instance, orig_patch.delegate, instance.delegate)
+    create_event(instance, orig_patch.delegate_id, instance.delegate_id)
 
 
-@receiver(pre_save, sender=Patch)
-def create_patch_relation_changed_event(sender, instance, raw, **kwargs):
+def create_patch_relation_changed_event(instance, orig_patch):
 
     def create_event(patch, before, after):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_PATCH_RELATION_CHANGED,
             project=patch.project,
             actor=getattr(patch, '_edited_by', None),
             patch=patch,
-            previous_relation=before,
-            current_relation=after)
+            previous_relation_id=before,
+            current_relation_id=after)
 
-    # don't trigger for items loaded from fixtures or new items
-    if raw or not instance.pk:
-        return
-
-    orig_patch = Patch.objects.get(pk=instance.pk)
-
-    if orig_patch.related == instance.related:
+    if orig_patch.related_id == instance.related_id:
         return
 
-    create_event(instance, orig_patch.related, instance.related)
+    create_event(instance, orig_patch.related_id, instance.related_id)
 
 
-@receiver(pre_save, sender=Patch)
-def create_patch_completed_event(sender, instance, raw, **kwargs):
+def create_patch_completed_event(instance, orig_patch):
 
     def create_event(patch):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_PATCH_COMPLETED,
             project=patch.project,
             patch=patch,
             series=patch.series)
 
-    # don't trigger for items loaded from fixtures, new items or items that
-    # (still) don't have a series
-    if raw or not instance.pk or not instance.series:
+    # don't trigger for items that (still) don't have a series
+    if not instance.series_id:
         return
 
-    orig_patch = Patch.objects.get(pk=instance.pk)
-
     # we don't currently allow users to change a series, though this might
     # change in the future. However, we handle that here nonetheless
-    if orig_patch.series == instance.series:
+    if orig_patch.series_id == instance.series_id:
         return
 
     # if dependencies not met, don't raise event. There's also no point raising
@@ -207,7 +227,7 @@ def create_check_created_event(sender, instance, created, raw, **kwargs):
     def create_event(check):
         # TODO(stephenfin): It might make sense to add a 'project' field to
         # 'check' to prevent lookups here and in the REST API
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_CHECK_CREATED,
             project=check.patch.project,
             actor=check.user,
@@ -225,7 +245,7 @@ def create_check_created_event(sender, instance, created, raw, **kwargs):
 def create_series_created_event(sender, instance, created, raw, **kwargs):
 
     def create_event(series):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_SERIES_CREATED,
             project=series.project,
             series=series)
@@ -237,8 +257,7 @@ def create_series_created_event(sender, instance, created, raw, **kwargs):
     create_event(instance)
 
 
-@receiver(pre_save, sender=Patch)
-def create_series_completed_event(sender, instance, raw, **kwargs):
+def create_series_completed_event(instance, orig_patch):
 
     # NOTE(stephenfin): It's actually possible for this event to be fired
     # multiple times for a given series. To trigger this case, you would need
@@ -247,22 +266,19 @@ def create_series_completed_event(sender, instance, raw, **kwargs):
     # in that case.
 
     def create_event(series):
-        return Event.objects.create(
+        return record_event(
             category=Event.CATEGORY_SERIES_COMPLETED,
             project=series.project,
             series=series)
 
-    # don't trigger for items loaded from fixtures, new items or items that
-    # (still) don't have a series
-    if raw or not instance.pk or not instance.series:
+    # don't trigger for items that (still) don't have a series
+    if not instance.series_id:
         return
 
-    orig_patch = Patch.objects.get(pk=instance.pk)
-
     # we don't currently allow users to change a series (though this might
     # change in the future) meaning if the patch already had a series, there's
     # nothing to notify about
-    if orig_patch.series:
+    if orig_patch.series_id:
         return
 
     # we can't use "series.received_all" here since we haven't actually saved
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 from django import template
+from django.template.defaultfilters import pluralize
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 
@@ -19,7 +20,7 @@ def patch_tags(patch):
     counts = []
     titles = []
     for tag in [t for t in patch.project.tags if t.show_column]:
-        count = getattr(patch, tag.attr_name)
+        count = patch.get_tag_count(tag)
         titles.append('%d %s' % (count, tag.name))
         if count == 0:
             counts.append("-")
@@ -61,6 +62,23 @@ def patch_checks(patch):
         ''.join(check_elements)))
 
 
+@register.filter(name='patch_diffstat')
+def patch_diffstat(patch):
+    if patch.insertions is None:
+        return ''
+
+    title = '%d file%s changed, %d insertion%s(+), %d deletion%s(-)' % (
+        patch.files_changed, pluralize(patch.files_changed),
+        patch.insertions, pluralize(patch.insertions),
+        patch.deletions, pluralize(patch.deletions))
+
+    return mark_safe(
+        '<span title="%s">'
+        '<span class="text-success">+%d</span> '
+        '<span class="text-danger">-%d</span>'
+        '</span>' % (title, patch.insertions, patch.deletions))
+
+
 @register.filter(name='patch_commit_display')
 def patch_commit_display(patch):
     commit = patch.commit_ref
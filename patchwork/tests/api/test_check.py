@@ -6,9 +6,12 @@
 import unittest
 
 from django.conf import settings
+from django.urls import NoReverseMatch
 from django.urls import reverse
 
 from patchwork.models import Check
+from patchwork.models import Event
+from patchwork.models import Patch
 from patchwork.tests.api import utils
 from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_patch
@@ -197,6 +200,113 @@ class TestCheckAPI(utils.APITestCase):
         self.assertEqual(status.HTTP_405_METHOD_NOT_ALLOWED, resp.status_code)
 
 
+@unittest.skipUnless(settings.ENABLE_REST_API, 'requires ENABLE_REST_API')
+class TestCheckBulkAPI(utils.APITestCase):
+    fixtures = ['default_tags']
+
+    @staticmethod
+    def api_url(version=None):
+        kwargs = {}
+        if version:
+            kwargs['version'] = version
+
+        return reverse('api-check-bulk-create', kwargs=kwargs)
+
+    def setUp(self):
+        super(TestCheckBulkAPI, self).setUp()
+        self.project = create_project()
+        self.user = create_maintainer(self.project)
+        self.patches = [create_patch(project=self.project) for _ in range(2)]
+
+    def _check(self, patch, state='success', context='context'):
+        return {
+            'patch': patch.id,
+            'state': state,
+            'target_url': 'http://t.co',
+            'description': 'description',
+            'context': context,
+        }
+
+    @utils.store_samples('check-bulk-create')
+    def test_create(self):
+        """Create checks for many patches at once."""
+        patch_a, patch_b = self.patches
+        create_check(patch=patch_a, user=self.user, context='build',
+                     state=Check.STATE_FAIL)
+
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(self.api_url(), {'checks': [
+            self._check(patch_a, 'success', 'build'),
+            self._check(patch_a, 'warning', 'test'),
+            self._check(patch_b, 'pending', 'build'),
+            self._check(patch_b, 'fail', 'build'),
+        ]})
+        self.assertEqual(status.HTTP_201_CREATED, resp.status_code)
+        self.assertEqual(4, len(resp.data))
+        self.assertEqual(['success', 'warning', 'pending', 'fail'],
+                         [check['state'] for check in resp.data])
+        self.assertEqual(5, Check.objects.count())
+        self.assertEqual(5, Event.objects.filter(
+            category=Event.CATEGORY_CHECK_CREATED).count())
+
+        # the summary of each patch only counts the latest checks
+        patch_a = Patch.objects.get(id=patch_a.id)
+        self.assertEqual('warning', patch_a.combined_check_state)
+        self.assertEqual(
+            ['build', 'test'],
+            sorted(check.context for check in patch_a.checks))
+        patch_b = Patch.objects.get(id=patch_b.id)
+        self.assertEqual('fail', patch_b.combined_check_state)
+        self.assertEqual(1, len(patch_b.checks))
+
+    def test_create_anonymous(self):
+        """Create checks as an anonymous user."""
+        resp = self.client.post(self.api_url(), {'checks': [
+            self._check(self.patches[0])]})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+        self.assertEqual(0, Check.objects.count())
+
+    def test_create_non_maintainer(self):
+        """Create checks for patches of a project not maintained."""
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(self.api_url(), {'checks': [
+            self._check(self.patches[0]), self._check(create_patch())]})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+        self.assertEqual(0, Check.objects.count())
+
+    def test_create_invalid_patch(self):
+        """Create checks for a patch that doesn't exist."""
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(self.api_url(), {'checks': [
+            self._check(self.patches[0]),
+            dict(self._check(self.patches[0]), patch=999999)]})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+        self.assertEqual(['Patch 999999 not found'], resp.data['checks'])
+        self.assertEqual(0, Check.objects.count())
+
+    def test_create_invalid_state(self):
+        """Create checks using an invalid state."""
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(self.api_url(), {'checks': [
+            self._check(self.patches[0], state='this-is-not-a-valid-state'),
+        ]}, validate_request=False)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+        self.assertIn('state', resp.data['checks'][0])
+        self.assertEqual(0, Check.objects.count())
+
+    def test_create_empty(self):
+        """Create checks without giving any."""
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(self.api_url(), {'checks': []},
+                                validate_request=False)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+
+    def test_create_version_1_2(self):
+        """Create checks using API v1.2, which doesn't support this."""
+        with self.assertRaises(NoReverseMatch):
+            self.api_url(version='1.2')
+
+
 @unittest.skipUnless(settings.ENABLE_REST_API, 'requires ENABLE_REST_API')
 class TestCheckAPIMultipart(BaseAPITestCase):
     """Test a minimal subset of functionality where the data is passed as
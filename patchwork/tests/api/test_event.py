@@ -3,9 +3,15 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import datetime
+import json
 import unittest
+from unittest import mock
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch
 from django.urls import reverse
 
 from patchwork.models import Event
@@ -20,6 +26,9 @@ from patchwork.tests.utils import create_state
 if settings.ENABLE_REST_API:
     from rest_framework import status
 
+    from patchwork.api.event import EventBroadcaster
+    from patchwork.api.event import EventSubscriber
+
 
 @unittest.skipUnless(settings.ENABLE_REST_API, 'requires ENABLE_REST_API')
 class TestEventAPI(utils.APITestCase):
@@ -182,12 +191,151 @@ class TestEventAPI(utils.APITestCase):
                                {'actor': 'foo-bar'})
         self.assertEqual(len(events), len(resp.data))
 
+    def test_list_filter_after_id(self):
+        """Filter events by ID."""
+        self._create_events()
+        after_id = Event.objects.order_by('-id')[0].id
+        self._create_events()
+
+        with self.settings(EVENT_VISIBILITY_LAG=0):
+            resp = self.client.get(self.api_url(), {'after_id': after_id})
+        self.assertEqual(8, len(resp.data))
+        self.assertTrue(all(x['id'] > after_id for x in resp.data))
+
+    def test_list_filter_after_id_unsettled(self):
+        """Filter events by ID, which only lists settled events."""
+        events = self._create_events()
+
+        # the events are too recent to be sure that no events with lower IDs
+        # are yet to become visible
+        resp = self.client.get(self.api_url(), {'after_id': 0})
+        self.assertEqual(0, len(resp.data))
+
+        events.update(date=datetime.datetime.utcnow() -
+                      datetime.timedelta(minutes=2))
+
+        resp = self.client.get(self.api_url(), {'after_id': 0})
+        self.assertEqual(len(events), len(resp.data))
+
+    def test_list_filter_after_id_version_1_2(self):
+        """Filter events by ID using API v1.2."""
+        events = self._create_events()
+
+        # we still see all the events since the after_id field is ignored
+        resp = self.client.get(self.api_url(version='1.2'),
+                               {'after_id': events.order_by('-id')[0].id})
+        self.assertEqual(len(events), len(resp.data))
+
+    def test_list_etag(self):
+        """List events only if new events match."""
+        events = self._create_events()
+        project = events[0].project
+
+        resp = self.client.get(self.api_url(), {'project': project.pk})
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        etag = resp['ETag']
+
+        # nothing has changed
+        resp = self.client.get(self.api_url(), {'project': project.pk},
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, resp.status_code)
+        self.assertEqual(etag, resp['ETag'])
+        self.assertFalse(resp.content)
+
+        # new events in another project don't change this list...
+        create_series()
+
+        resp = self.client.get(self.api_url(), {'project': project.pk},
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, resp.status_code)
+
+        # ...but they change other lists
+        resp = self.client.get(self.api_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+
+        # new events in this project change this list
+        create_series(project=project)
+
+        resp = self.client.get(self.api_url(), {'project': project.pk},
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        self.assertNotEqual(etag, resp['ETag'])
+
+    def test_list_etag_pruned(self):
+        """List events if matching events have been pruned."""
+        events = self._create_events()
+
+        resp = self.client.get(self.api_url())
+        etag = resp['ETag']
+
+        events.order_by('id')[0].delete()
+
+        resp = self.client.get(self.api_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+
+    def test_list_etag_late(self):
+        """List events if matching events become visible out of order."""
+        events = self._create_events()
+        event = events.order_by('id')[1]
+        event_id = event.id
+        event.delete()
+
+        resp = self.client.get(self.api_url())
+        etag = resp['ETag']
+
+        # simulate the event being committed after later events
+        event.id = event_id
+        event.save(force_insert=True)
+
+        resp = self.client.get(self.api_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+
+    def test_list_etag_late_settled(self):
+        """List events if one becomes visible late as another settles."""
+        events = list(self._create_events().order_by('id'))
+        event = events[1]
+        event_id = event.id
+        event.delete()
+
+        resp = self.client.get(self.api_url())
+        etag = resp['ETag']
+
+        # the number of unsettled events and the lowest and greatest IDs
+        # are unchanged by these
+        Event.objects.filter(id=events[0].id).update(
+            date=datetime.datetime.utcnow() - datetime.timedelta(minutes=2))
+        event.id = event_id
+        event.save(force_insert=True)
+
+        resp = self.client.get(self.api_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+
+    def test_list_etag_queries(self):
+        """Check for changes to a list using a single query."""
+        self._create_events()
+
+        resp = self.client.get(self.api_url())
+        etag = resp['ETag']
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.api_url(),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, resp.status_code)
+
+    def test_list_etag_version_1_2(self):
+        """List events using API v1.2."""
+        self._create_events()
+
+        resp = self.client.get(self.api_url(version='1.2'))
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        self.assertNotIn('ETag', resp)
+
     def test_list_bug_335(self):
         """Ensure we retrieve the embedded series project once."""
         for _ in range(3):
             self._create_events()
 
-        with self.assertNumQueries(28):
+        with self.assertNumQueries(29):
             self.client.get(self.api_url())
 
     def test_order_by_date_default(self):
@@ -208,6 +356,21 @@ class TestEventAPI(utils.APITestCase):
         for api_event, event in zip(resp.data, events):
             self.assertEqual(api_event["id"], event.id)
 
+    def test_list_cursor(self):
+        """List events a page at a time using cursors."""
+        for _ in range(2):
+            self._create_events()
+        expected = list(Event.objects.order_by(
+            '-date', '-id').values_list('id', flat=True))
+
+        # the default ordering is by date descending
+        resp = self.client.get(self.api_url(), {'cursor': '', 'per_page': 4})
+        ids = [event['id'] for event in resp.data]
+        while 'next' in utils.get_links(resp):
+            resp = self.get_link(resp, 'next')
+            ids += [event['id'] for event in resp.data]
+        self.assertEqual(expected, ids)
+
     def test_create(self):
         """Ensure creates aren't allowed"""
         user = create_maintainer()
@@ -217,3 +380,205 @@ class TestEventAPI(utils.APITestCase):
         self.client.force_authenticate(user=user)
         resp = self.client.post(self.api_url(), {'category': 'patch-created'})
         self.assertEqual(status.HTTP_405_METHOD_NOT_ALLOWED, resp.status_code)
+
+
+@unittest.skipUnless(settings.ENABLE_REST_API, 'requires ENABLE_REST_API')
+class TestEventStreamAPI(utils.APITestCase):
+
+    @staticmethod
+    def api_url(version=None):
+        kwargs = {}
+        if version:
+            kwargs['version'] = version
+
+        return reverse('api-event-stream', kwargs=kwargs)
+
+    def _create_events(self, **kwargs):
+        # series-created, patch-created, patch-completed, series-completed,
+        # check-created
+        series = create_series(**kwargs)
+        patch = create_patch(series=series, project=series.project)
+        create_check(patch=patch)
+
+        return Event.objects.filter(project=series.project)
+
+    def _stream(self, *args, **kwargs):
+        # we don't wait for new events, only send those already created
+        with self.settings(EVENT_STREAM_TIMEOUT=0):
+            resp = self.client.get(self.api_url(), *args,
+                                   validate_response=False, **kwargs)
+            self.assertEqual(status.HTTP_200_OK, resp.status_code)
+            self.assertEqual('text/event-stream', resp['Content-Type'])
+            content = b''.join(resp.streaming_content).decode()
+
+        events = []
+        for message in content.split('\n\n')[:-1]:
+            fields = dict(line.split(': ', 1) for line in message.split('\n'))
+            data = json.loads(fields['data'])
+            self.assertEqual(int(fields['id']), data['id'])
+            self.assertEqual(fields['event'], data['category'])
+            events.append(data)
+
+        return events
+
+    def test_stream(self):
+        """Stream events created after a given event."""
+        events = self._create_events()
+        after_id = events.order_by('id')[0].id
+
+        # we retrieve the IDs of unsettled events, then the unsettled events
+        # before the given event and the events after it, but nothing else
+        # is needed to serialize the events
+        with CaptureQueriesContext(connection) as queries:
+            with self.settings(EVENT_VISIBILITY_LAG=0):
+                resp = self._stream({'after_id': after_id})
+        self.assertEqual(3, len(queries), [q['sql'] for q in queries])
+        self.assertEqual(
+            list(events.filter(id__gt=after_id).order_by(
+                'id').values_list('id', flat=True)),
+            [event['id'] for event in resp])
+
+    def test_stream_last_event_id(self):
+        """Resume a stream using the Last-Event-ID header."""
+        events = self._create_events()
+        after_id = events.order_by('-id')[1].id
+
+        with self.settings(EVENT_VISIBILITY_LAG=0):
+            resp = self._stream({'after_id': 0}, HTTP_LAST_EVENT_ID=after_id)
+        self.assertEqual(1, len(resp))
+        self.assertEqual(events.order_by('-id')[0].id, resp[0]['id'])
+
+    def test_stream_resume_unsettled(self):
+        """Resume a stream, sending unsettled events again."""
+        events = self._create_events()
+        ids = list(events.order_by('id').values_list('id', flat=True))
+        events.filter(id=ids[0]).update(
+            date=datetime.datetime.utcnow() - datetime.timedelta(minutes=2))
+
+        # any of the unsettled events may have become visible after the
+        # last event was received, so these are sent again
+        resp = self._stream(HTTP_LAST_EVENT_ID=ids[-2])
+        self.assertEqual(ids[1:], [event['id'] for event in resp])
+
+    def test_stream_filter(self):
+        """Stream events of a given project and category."""
+        events = self._create_events()
+        self._create_events()  # create events in another project
+        project = events[0].project
+
+        resp = self._stream({'after_id': 0, 'project': project.linkname,
+                             'category': 'patch-created'})
+        self.assertEqual(1, len(resp))
+        self.assertEqual(project.id, resp[0]['project']['id'])
+        self.assertEqual('patch-created', resp[0]['category'])
+
+    def test_stream_filter_invalid(self):
+        """Stream events of an invalid project."""
+        with self.settings(EVENT_STREAM_TIMEOUT=0):
+            resp = self.client.get(
+                self.api_url(), {'project': 'invalidproject'},
+                validate_response=False)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+
+    def test_stream_connection(self):
+        """Release the database connection once older events are sent."""
+        events = self._create_events()
+
+        with mock.patch('patchwork.api.event.connection') as conn:
+            conn.in_atomic_block = False
+            resp = self._stream({'after_id': 0})
+        self.assertEqual(events.count(), len(resp))
+        conn.close.assert_called_once_with()
+
+    def test_stream_max_streams(self):
+        """Refuse streams once the maximum number are open."""
+        broadcaster = EventBroadcaster()
+        self.assertTrue(broadcaster.subscribe(EventSubscriber()))
+
+        with mock.patch('patchwork.api.event.broadcaster', broadcaster):
+            with self.settings(EVENT_STREAM_TIMEOUT=0,
+                               EVENT_STREAM_MAX_STREAMS=1):
+                resp = self.client.get(self.api_url(),
+                                       validate_response=False)
+        self.assertEqual(status.HTTP_503_SERVICE_UNAVAILABLE,
+                         resp.status_code)
+        self.assertEqual(1, len(broadcaster.subscribers))
+
+    def test_stream_version_1_2(self):
+        """Stream events using API v1.2, which lacks this."""
+        with self.assertRaises(NoReverseMatch):
+            self.api_url(version='1.2')
+
+    def test_broadcast(self):
+        """Publish new events to each matching subscriber."""
+        broadcaster = EventBroadcaster()
+        events = self._create_events()
+        project = events[0].project
+        last_id = events.order_by('-id')[0].id
+
+        everything = EventSubscriber()
+        filtered = EventSubscriber(projects={project.id},
+                                   category='patch-created')
+        broadcaster.subscribe(everything)
+        broadcaster.subscribe(filtered)
+
+        # only events created after subscribing are published
+        self._create_events(project=project)
+        self._create_events()  # create events in another project
+
+        # events are retrieved with the same queries however many
+        # subscribers there are: one for the IDs of unsettled events and one
+        # for the new events
+        with CaptureQueriesContext(connection) as queries:
+            broadcaster.poll()
+        self.assertEqual(2, len(queries))
+
+        published = list(everything.events.queue)
+
+        self.assertEqual(
+            list(Event.objects.filter(id__gt=last_id).order_by('id')),
+            published)
+        self.assertEqual(
+            list(Event.objects.filter(
+                id__gt=last_id, project=project, category='patch-created')),
+            list(filtered.events.queue))
+
+        # subscribers don't receive events twice
+        broadcaster.poll()
+        self.assertEqual(len(published), everything.events.qsize())
+
+    def test_broadcast_late(self):
+        """Publish events that become visible out of order."""
+        broadcaster = EventBroadcaster()
+        subscriber = EventSubscriber()
+        broadcaster.subscribe(subscriber)
+
+        events = list(self._create_events().order_by('id'))
+        event = events[0]
+        event_id = event.id
+        event.delete()
+
+        broadcaster.poll()
+        self.assertEqual(len(events) - 1, subscriber.events.qsize())
+
+        # simulate the event being committed after later events
+        event.id = event_id
+        event.save(force_insert=True)
+
+        broadcaster.poll()
+        published = list(subscriber.events.queue)
+        self.assertEqual(len(events), len(published))
+        self.assertEqual(event_id, published[-1].id)
+
+    def test_broadcast_overflow(self):
+        """Stop publishing to subscribers that aren't keeping up."""
+        broadcaster = EventBroadcaster()
+        subscriber = EventSubscriber()
+        subscriber.events.maxsize = 2
+        broadcaster.subscribe(subscriber)
+
+        self._create_events()
+        broadcaster.poll()
+
+        self.assertTrue(subscriber.overflowed)
+        self.assertEqual(2, subscriber.events.qsize())
@@ -3,15 +3,20 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import datetime
 import email.parser
 from email.utils import make_msgid
 import unittest
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from patchwork.models import Check
 from patchwork.models import Patch
 from patchwork.tests.api import utils
+from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_maintainer
 from patchwork.tests.utils import create_patch
 from patchwork.tests.utils import create_patches
@@ -20,6 +25,7 @@ from patchwork.tests.utils import create_project
 from patchwork.tests.utils import create_series
 from patchwork.tests.utils import create_state
 from patchwork.tests.utils import create_user
+from patchwork.tests.utils import make_diff
 
 if settings.ENABLE_REST_API:
     from rest_framework import status
@@ -211,6 +217,125 @@ class TestPatchAPI(utils.APITestCase):
             'msgid': 'fishfish@fish.fish'})
         self.assertEqual(0, len(resp.data))
 
+    def test_list_filter_path(self):
+        """Filter patches by the paths they change."""
+        patch_a = self._create_patch(diff=make_diff('drivers/net/a.c'))
+        patch_b = create_patch(project=patch_a.project,
+                               diff=make_diff('drivers/netdevsim/b.c'))
+        create_patch(project=patch_a.project, diff=make_diff('fs/c.c'))
+
+        for path in ('drivers/net', 'drivers/net/', 'drivers/net/*',
+                     'drivers/net/a.c'):
+            resp = self.client.get(self.api_url(), {'path': path})
+            self.assertEqual([patch_a.id], [x['id'] for x in resp.data])
+
+        resp = self.client.get(self.api_url(), {'path': 'drivers/net*'})
+        self.assertEqual([patch_a.id, patch_b.id],
+                         [x['id'] for x in resp.data])
+
+        # empty response if nothing matches
+        resp = self.client.get(self.api_url(), {'path': 'drivers/n'})
+        self.assertEqual(0, len(resp.data))
+
+    def test_list_filter_path_version_1_2(self):
+        """Filter patches by path using API v1.2."""
+        self._create_patch()
+
+        # we still see the patch since the path field is ignored
+        resp = self.client.get(self.api_url(version='1.2'),
+                               {'path': 'garbagevalue'})
+        self.assertEqual(1, len(resp.data))
+
+    def test_list_filter_check(self):
+        """Filter patches by the combined state of their checks."""
+        patch_a = self._create_patch()
+        patch_b = create_patch(project=patch_a.project)
+        patch_c = create_patch(project=patch_a.project)
+        create_check(patch=patch_a, state=Check.STATE_FAIL)
+        create_check(patch=patch_b, state=Check.STATE_SUCCESS)
+
+        resp = self.client.get(self.api_url(), {'check': 'fail'})
+        self.assertEqual([patch_a.id], [x['id'] for x in resp.data])
+        self.assertEqual('fail', resp.data[0]['check'])
+
+        resp = self.client.get(self.api_url(), [
+            ('check', 'success'), ('check', 'pending')])
+        self.assertEqual([patch_b.id, patch_c.id],
+                         [x['id'] for x in resp.data])
+
+    def test_list_filter_check_version_1_2(self):
+        """Filter patches by check state using API v1.2."""
+        self._create_patch()
+
+        # we still see the patch since the check field is ignored
+        resp = self.client.get(self.api_url(version='1.2'),
+                               {'check': 'fail'})
+        self.assertEqual(1, len(resp.data))
+
+    def test_list_cursor(self):
+        """List patches a page at a time using cursors."""
+        project = create_project()
+        date = datetime.datetime(2020, 1, 1, 0, 0, 0, 1)
+        patches = [create_patch(project=project,
+                                date=date + datetime.timedelta(days=i % 3))
+                   for i in range(7)]
+        expected = [patch.id for patch in sorted(
+            patches, key=lambda patch: (patch.date, patch.id))]
+
+        # the patches aren't counted
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(self.api_url(), {
+                'cursor': '', 'per_page': 3})
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'COUNT(' in query['sql']])
+
+        ids = [patch['id'] for patch in resp.data]
+        self.assertNotIn('prev', utils.get_links(resp))
+        while 'next' in utils.get_links(resp):
+            resp = self.get_link(resp, 'next')
+            self.assertEqual(status.HTTP_200_OK, resp.status_code)
+            self.assertIn('prev', utils.get_links(resp))
+            ids += [patch['id'] for patch in resp.data]
+        self.assertEqual(expected, ids)
+
+        # and back again
+        ids = [patch['id'] for patch in resp.data]
+        while 'prev' in utils.get_links(resp):
+            resp = self.get_link(resp, 'prev')
+            self.assertEqual(status.HTTP_200_OK, resp.status_code)
+            self.assertEqual(3, len(resp.data))
+            self.assertIn('next', utils.get_links(resp))
+            ids = [patch['id'] for patch in resp.data] + ids
+        self.assertEqual(expected, ids)
+
+    def test_list_cursor_descending(self):
+        """List patches in descending order using cursors."""
+        patches = [create_patch() for _ in range(3)]
+
+        resp = self.client.get(self.api_url(), {
+            'cursor': '', 'per_page': 2, 'order': '-date'})
+        self.assertEqual([patches[2].id, patches[1].id],
+                         [patch['id'] for patch in resp.data])
+
+        resp = self.get_link(resp, 'next')
+        self.assertEqual([patches[0].id], [patch['id'] for patch in resp.data])
+        self.assertNotIn('next', utils.get_links(resp))
+
+    def test_list_cursor_invalid(self):
+        """List patches using an invalid cursor."""
+        resp = self.client.get(self.api_url(), {'cursor': 'garbage'},
+                               validate_response=False)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, resp.status_code)
+
+    def test_list_cursor_version_1_2(self):
+        """List patches using a cursor with API v1.2."""
+        create_patches(3)
+
+        # we get numbered pages since the cursor is ignored
+        resp = self.client.get(self.api_url(version='1.2'), {
+            'cursor': '', 'per_page': 2})
+        self.assertIn('page=2', utils.get_links(resp)['next'])
+
     @utils.store_samples('patch-list-1-0')
     def test_list_version_1_0(self):
         """List patches using API v1.0."""
@@ -227,7 +352,7 @@ class TestPatchAPI(utils.APITestCase):
         series = create_series()
         create_patches(5, series=series)
 
-        with self.assertNumQueries(7):
+        with self.assertNumQueries(6):
             self.client.get(self.api_url())
 
     @utils.store_samples('patch-detail')
@@ -250,7 +375,16 @@ class TestPatchAPI(utils.APITestCase):
 
         self.assertEqual(patch.content, resp.data['content'])
         self.assertEqual(patch.diff, resp.data['diff'])
-        self.assertEqual(0, len(resp.data['tags']))
+        self.assertEqual({'Reviewed-by': 1}, resp.data['tags'])
+
+    def test_detail_version_1_2(self):
+        """Show a specific patch, without tag counts."""
+        patch = create_patch(
+            content='Reviewed-by: Test User <test@example.com>\n')
+
+        resp = self.client.get(self.api_url(item=patch.id, version='1.2'))
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        self.assertEqual({}, resp.data['tags'])
 
     @utils.store_samples('patch-detail-1-0')
     def test_detail_version_1_0(self):
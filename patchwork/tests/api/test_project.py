@@ -6,13 +6,18 @@
 import unittest
 
 from django.conf import settings
+from django.urls import NoReverseMatch
 from django.urls import reverse
 
+from patchwork.models import Patch
 from patchwork.models import Project
 from patchwork.tests.api import utils
 from patchwork.tests.utils import create_maintainer
+from patchwork.tests.utils import create_patch
 from patchwork.tests.utils import create_project
+from patchwork.tests.utils import create_state
 from patchwork.tests.utils import create_user
+from patchwork.tests.utils import make_diff
 
 if settings.ENABLE_REST_API:
     from rest_framework import status
@@ -222,3 +227,94 @@ class TestProjectAPI(utils.APITestCase):
         resp = self.client.delete(self.api_url(project.id))
         self.assertEqual(status.HTTP_405_METHOD_NOT_ALLOWED, resp.status_code)
         self.assertEqual(1, Project.objects.all().count())
+
+
+@unittest.skipUnless(settings.ENABLE_REST_API, 'requires ENABLE_REST_API')
+class TestProjectCommitsAPI(utils.APITestCase):
+
+    @staticmethod
+    def api_url(item, version=None):
+        kwargs = {'pk': item}
+        if version:
+            kwargs['version'] = version
+
+        return reverse('api-project-commits', kwargs=kwargs)
+
+    def setUp(self):
+        super(TestProjectCommitsAPI, self).setUp()
+        self.project = create_project()
+        self.state = create_state(name='Accepted', slug='accepted')
+        self.patch = create_patch(project=self.project, diff=make_diff('a.c'))
+
+    def test_set_commits_anonymous(self):
+        """Set commits as anonymous user."""
+        resp = self.client.post(self.api_url(self.project.id), {
+            'commits': [{'commit': 'abc123', 'hash': self.patch.hash}],
+        })
+        self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+
+    def test_set_commits_non_maintainer(self):
+        """Set commits as normal user."""
+        user = create_user()
+        self.client.force_authenticate(user=user)
+        resp = self.client.post(self.api_url(self.project.id), {
+            'commits': [{'commit': 'abc123', 'hash': self.patch.hash}],
+        })
+        self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+
+    @utils.store_samples('project-commits')
+    def test_set_commits(self):
+        """Set commits as maintainer."""
+        other = create_patch(diff=make_diff('b.c'))
+
+        user = create_maintainer(self.project)
+        self.client.force_authenticate(user=user)
+        resp = self.client.post(self.api_url(self.project.id), {
+            'commits': [
+                {'commit': 'abc123', 'hash': self.patch.hash.upper()},
+                {'commit': 'def456', 'hash': other.hash},
+            ],
+        })
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        self.assertEqual(2, len(resp.data))
+        self.assertEqual('abc123', resp.data[0]['commit'])
+        self.assertEqual(self.patch.hash, resp.data[0]['hash'])
+        self.assertEqual([self.patch.id],
+                         [patch['id'] for patch in resp.data[0]['patches']])
+        # patches in other projects are ignored
+        self.assertEqual([], resp.data[1]['patches'])
+
+        patch = Patch.objects.get(id=self.patch.id)
+        self.assertEqual('abc123', patch.commit_ref)
+        self.assertEqual(self.state, patch.state)
+
+        other = Patch.objects.get(id=other.id)
+        self.assertIsNone(other.commit_ref)
+
+    def test_set_commits_state(self):
+        """Set commits with a state other than 'accepted'."""
+        state = create_state()
+
+        user = create_maintainer(self.project)
+        self.client.force_authenticate(user=user)
+        resp = self.client.post(self.api_url(self.project.id), {
+            'state': state.slug,
+            'commits': [{'commit': 'abc123', 'hash': self.patch.hash}],
+        })
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        self.assertEqual(state, Patch.objects.get(id=self.patch.id).state)
+
+    @utils.store_samples('project-commits-error-bad-request')
+    def test_set_commits_invalid(self):
+        """Set commits with an invalid hash."""
+        user = create_maintainer(self.project)
+        self.client.force_authenticate(user=user)
+        resp = self.client.post(self.api_url(self.project.id), {
+            'commits': [{'commit': 'abc123', 'hash': 'xyz'}],
+        }, validate_request=False)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+
+    def test_set_commits_version_1_2(self):
+        """Set commits using API v1.2, which doesn't support this."""
+        with self.assertRaises(NoReverseMatch):
+            self.api_url(self.project.id, version='1.2')
@@ -6,9 +6,14 @@
 import unittest
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch
 from django.urls import reverse
 
+from patchwork.models import Check
 from patchwork.tests.api import utils
+from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_cover
 from patchwork.tests.utils import create_maintainer
 from patchwork.tests.utils import create_patch
@@ -57,6 +62,28 @@ class TestSeriesAPI(utils.APITestCase):
         self.assertEqual(series_obj.patches.count(),
                          len(series_json['patches']))
 
+    @staticmethod
+    def api_checks_url(item, version=None):
+        kwargs = {'pk': item}
+        if version:
+            kwargs['version'] = version
+
+        return reverse('api-series-checks', kwargs=kwargs)
+
+    def _create_checked_series(self, states):
+        """Create a series with a patch for each of the given check states.
+
+        A state of None gives a patch without any checks.
+        """
+        series = create_series()
+        create_cover(series=series, project=series.project)
+        for state in states:
+            patch = create_patch(series=series, project=series.project)
+            if state is not None:
+                create_check(patch=patch, state=state)
+
+        return series
+
     def test_list_empty(self):
         """List series when none are present."""
         resp = self.client.get(self.api_url())
@@ -161,6 +188,82 @@ class TestSeriesAPI(utils.APITestCase):
         self.assertEqual(status.HTTP_200_OK, resp.status_code)
         self.assertSerialized(series, resp.data)
 
+    def test_detail_check(self):
+        """Show the combined state of the checks of a series."""
+        for states, expected in [
+            ([], 'pending'),
+            ([Check.STATE_SUCCESS, Check.STATE_SUCCESS], 'success'),
+            ([Check.STATE_SUCCESS, None], 'pending'),
+            ([Check.STATE_PENDING, Check.STATE_WARNING], 'warning'),
+            ([Check.STATE_WARNING, Check.STATE_FAIL, None], 'fail'),
+        ]:
+            series = self._create_checked_series(states)
+
+            resp = self.client.get(self.api_url(series.id))
+            self.assertEqual(expected, resp.data['check'])
+
+        resp = self.client.get(self.api_url(series.id, version='1.2'))
+        self.assertNotIn('check', resp.data)
+
+    def test_list_filter_check(self):
+        """Filter series by the combined state of their checks."""
+        series_a = self._create_checked_series([Check.STATE_SUCCESS])
+        series_b = self._create_checked_series(
+            [Check.STATE_SUCCESS, Check.STATE_FAIL])
+        series_c = self._create_checked_series([None])
+
+        resp = self.client.get(self.api_url(), {'check': 'fail'})
+        self.assertEqual([series_b.id], [x['id'] for x in resp.data])
+
+        resp = self.client.get(self.api_url(), [
+            ('check', 'success'), ('check', 'pending')])
+        self.assertEqual([series_a.id, series_c.id],
+                         [x['id'] for x in resp.data])
+
+        # the filter is ignored for older versions
+        resp = self.client.get(self.api_url(version='1.2'), {'check': 'fail'})
+        self.assertEqual(3, len(resp.data))
+
+    def test_list_check_version_1_2(self):
+        """List series using API v1.2, which doesn't need check states."""
+        self._create_checked_series([Check.STATE_SUCCESS])
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(self.api_url(version='1.2'))
+        self.assertEqual(1, len(resp.data))
+        self.assertFalse(any('patches_success' in query['sql']
+                             for query in queries))
+
+    @utils.store_samples('series-checks')
+    def test_checks(self):
+        """Show the check summary of a series."""
+        series = self._create_checked_series(
+            [Check.STATE_SUCCESS, Check.STATE_SUCCESS, Check.STATE_FAIL,
+             None])
+
+        # this is a single aggregate query, whatever the number of patches
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.api_checks_url(series.id))
+
+        self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        self.assertEqual(series.id, resp.data['id'])
+        self.assertIn(self.api_url(series.id), resp.data['series'])
+        self.assertEqual('fail', resp.data['state'])
+        self.assertEqual(4, resp.data['total'])
+        self.assertEqual(
+            {'pending': 1, 'success': 2, 'warning': 0, 'fail': 1},
+            resp.data['counts'])
+
+    def test_checks_invalid(self):
+        """Show the check summary of a series that doesn't exist."""
+        resp = self.client.get(self.api_checks_url(999999))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, resp.status_code)
+
+    def test_checks_version_1_2(self):
+        """Show the check summary using API v1.2, which lacks this."""
+        with self.assertRaises(NoReverseMatch):
+            self.api_checks_url(1, version='1.2')
+
     @utils.store_samples('series-detail-1-0')
     def test_detail_version_1_0(self):
         """Show series using API v1.0."""
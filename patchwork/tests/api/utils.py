@@ -6,6 +6,9 @@
 import functools
 import json
 import os
+import re
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
 
 from django.conf import settings
 from django.test import testcases
@@ -105,6 +108,12 @@ def store_samples(filename):
     return inner
 
 
+def get_links(response):
+    """Return the URLs of the Link header of a response, by relation."""
+    return {rel: url for url, rel in re.findall(
+        r'<([^>]*)>; rel="([^"]*)"', response.get('Link', ''))}
+
+
 class APIClient(BaseAPIClient):
 
     def __init__(self, *args, **kwargs):
@@ -179,3 +188,8 @@ class APIClient(BaseAPIClient):
 
 class APITestCase(testcases.TestCase):
     client_class = APIClient
+
+    def get_link(self, response, rel):
+        """Retrieve a URL from the Link header of a response."""
+        url = urlsplit(get_links(response)[rel])
+        return self.client.get(url.path, dict(parse_qsl(url.query)))
@@ -91,12 +91,12 @@ def _load_spec(version):
 
 def validate_data(path, request, response, validate_request,
                   validate_response):
-    if response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED:
+    if response.status_code in (status.HTTP_304_NOT_MODIFIED,
+                                status.HTTP_405_METHOD_NOT_ALLOWED):
         return
 
     spec = _load_spec(resolve(path).kwargs.get('version'))
     request = DjangoOpenAPIRequestFactory.create(request)
-    response = DjangoOpenAPIResponseFactory.create(response)
 
     # request
     if validate_request:
@@ -115,6 +115,7 @@ def validate_data(path, request, response, validate_request,
 
     # response
     if validate_response:
+        response = DjangoOpenAPIResponseFactory.create(response)
         validator = ResponseValidator(
             spec, custom_formatters=CUSTOM_FORMATTERS)
         result = validator.validate(request, response)
@@ -0,0 +1,31 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Benchmarks for performance sensitive code.
+
+These are skipped unless the ``PW_BENCHMARK`` environment variable is set.
+"""
+
+import os
+import sys
+import timeit
+import unittest
+
+BENCHMARK = bool(os.getenv('PW_BENCHMARK'))
+
+skip_unless_benchmark = unittest.skipUnless(
+    BENCHMARK, 'set PW_BENCHMARK to run benchmarks')
+
+
+def measure(func, repeat=3):
+    """Return the best time taken to call a function, in seconds."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, results):
+    """Report the times taken by each implementation benchmarked."""
+    sys.stderr.write('\n%s:\n' % name)
+    for label, duration in results:
+        sys.stderr.write('  %-40s %8.3fs\n' % (label, duration))
@@ -0,0 +1,66 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import unittest
+
+from django.conf import settings
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from patchwork.models import Check
+from patchwork.tests.benchmarks import measure
+from patchwork.tests.benchmarks import report
+from patchwork.tests.benchmarks import skip_unless_benchmark
+from patchwork.tests.utils import create_maintainer
+from patchwork.tests.utils import create_patches
+from patchwork.tests.utils import create_project
+
+if settings.ENABLE_REST_API:
+    from rest_framework.test import APIClient
+
+# The number of patches in the series checked, and the contexts reported
+# for each patch
+PATCHES = 10
+CONTEXTS = 40
+
+
+@skip_unless_benchmark
+@unittest.skipUnless(settings.ENABLE_REST_API, 'requires ENABLE_REST_API')
+class CheckCreateBenchmark(TransactionTestCase):
+
+    def setUp(self):
+        project = create_project()
+        self.patches = create_patches(PATCHES, project=project)
+        self.client = APIClient()
+        self.client.force_authenticate(user=create_maintainer(project))
+
+    def _checks(self):
+        return [{
+            'patch': patch.id,
+            'state': 'success',
+            'target_url': 'http://example.com/',
+            'description': 'description',
+            'context': 'ci-%d' % i,
+        } for patch in self.patches for i in range(CONTEXTS)]
+
+    def test_create(self):
+
+        def original():
+            for check in self._checks():
+                self.client.post(
+                    reverse('api-check-list', args=[check.pop('patch')]),
+                    check, format='json')
+
+        def bulk():
+            self.client.post(reverse('api-check-bulk-create'),
+                             {'checks': self._checks()}, format='json')
+
+        results = [('check at a time', measure(original, repeat=1))]
+        self.assertEqual(PATCHES * CONTEXTS, Check.objects.count())
+        results.append(('bulk', measure(bulk, repeat=1)))
+        self.assertEqual(PATCHES * CONTEXTS * 2, Check.objects.count())
+
+        report('create checks (%d patches, %d contexts)' % (
+            PATCHES, CONTEXTS), results)
@@ -0,0 +1,112 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.test import SimpleTestCase
+
+from patchwork import hasher
+from patchwork.tests.benchmarks import measure
+from patchwork.tests.benchmarks import report
+from patchwork.tests.benchmarks import skip_unless_benchmark
+
+HASHER = os.path.abspath(hasher.__file__)
+
+# The number of commits hashed. A local repository can be used by setting
+# the PW_BENCHMARK_REPO environment variable, otherwise one is generated
+COMMITS = 3000
+
+# The number of commits hashed one at a time, as this is far too slow to do
+# for every commit
+SAMPLE = 100
+
+
+def _create_repo(path, count, files=20, lines=100):
+    """Create a repository where each commit changes a few lines."""
+    subprocess.run(['git', 'init', '-q', path], check=True)
+
+    contents = [['file %d line %d\n' % (f, i) for i in range(lines)]
+                for f in range(files)]
+    stream = []
+
+    def data(content):
+        content = content.encode()
+        stream.append(b'data %d\n%s\n' % (len(content), content))
+
+    for i in range(count):
+        f = i % files
+        for j in range(i % 7, lines, 13):
+            contents[f][j] = 'file %d line %d changed by %d\n' % (f, j, i)
+
+        stream.append(b'commit refs/heads/master\nmark :%d\n' % (i + 1))
+        stream.append(b'committer A U Thor <author@example.com> '
+                      b'%d +0000\n' % (1500000000 + i))
+        data('Change %d\n\nChange some lines in file %d.\n' % (i, f))
+        if i:
+            stream.append(b'from :%d\n' % i)
+        stream.append(b'M 100644 inline file%d.txt\n' % f)
+        data(''.join(contents[f]))
+
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path,
+                   input=b''.join(stream), check=True)
+
+
+@skip_unless_benchmark
+class HashCommitsBenchmark(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(HashCommitsBenchmark, cls).setUpClass()
+
+        cls.repo = os.getenv('PW_BENCHMARK_REPO')
+        cls.tmpdir = None
+        if not cls.repo:
+            cls.tmpdir = tempfile.mkdtemp()
+            cls.repo = cls.tmpdir
+            _create_repo(cls.repo, COMMITS + 1)
+
+        cls.commits = subprocess.run(
+            ['git', 'rev-list', '--reverse', '--no-merges',
+             '--max-count=%d' % COMMITS, 'HEAD'],
+            cwd=cls.repo, stdout=subprocess.PIPE, check=True,
+            universal_newlines=True).stdout.split()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.tmpdir:
+            shutil.rmtree(cls.tmpdir)
+        super(HashCommitsBenchmark, cls).tearDownClass()
+
+    def _per_commit(self):
+        """The original 'patchwork-update-commits' approach."""
+        for commit in self.commits[:SAMPLE]:
+            subprocess.run(
+                'git diff "%s~..%s" | "%s" "%s"' % (
+                    commit, commit, sys.executable, HASHER),
+                shell=True, cwd=self.repo, stdout=subprocess.PIPE,
+                check=True)
+
+    def _stream(self, jobs=1):
+        subprocess.run(
+            'git log -p --reverse --no-merges --no-color '
+            '--format="commit %%H" --max-count=%d HEAD | '
+            '"%s" "%s" --log --jobs %d' % (
+                len(self.commits), sys.executable, HASHER, jobs),
+            shell=True, cwd=self.repo, stdout=subprocess.PIPE, check=True)
+
+    def test_hash_commits(self):
+        count = len(self.commits)
+
+        report('hasher (%d commits)' % count, [
+            ('one process per commit (extrapolated)',
+             measure(self._per_commit, repeat=1) * count /
+             min(count, SAMPLE)),
+            ('streaming', measure(self._stream)),
+            ('streaming, 4 jobs', measure(lambda: self._stream(4))),
+        ])
@@ -0,0 +1,80 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+from io import StringIO
+import os
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from patchwork.models import Patch
+from patchwork.models import PatchComment
+from patchwork.tests.benchmarks import measure
+from patchwork.tests.benchmarks import report
+from patchwork.tests.benchmarks import skip_unless_benchmark
+from patchwork.tests.utils import create_patches
+from patchwork.tests.utils import create_person
+from patchwork.tests.utils import create_project
+from patchwork.tests.utils import make_diff
+
+# The number of patches updated. This can be overridden using the
+# PW_BENCHMARK_PATCHES environment variable
+PATCHES = int(os.getenv('PW_BENCHMARK_PATCHES', 2000))
+
+
+def _retag():
+    """The original, patch at a time, 'retag'."""
+    for patch in Patch.objects.all().iterator():
+        patch.refresh_tag_counts()
+
+
+def _rehash():
+    """The original, patch at a time, 'rehash'."""
+    for patch in Patch.objects.all().iterator():
+        patch.hash = None
+        patch.save()
+
+
+@skip_unless_benchmark
+class BatchCommandBenchmark(TransactionTestCase):
+
+    fixtures = ['default_tags', 'default_states']
+
+    def setUp(self):
+        project = create_project()
+        submitter = create_person()
+        diff = ''.join(make_diff('drivers/net/file%d.c' % i)
+                       for i in range(10))
+
+        patches = create_patches(
+            PATCHES, project=project, submitter=submitter, diff=diff,
+            content='Add a driver\n\nSigned-off-by: Test User '
+            '<test@example.com>\n')
+
+        PatchComment.objects.bulk_create([
+            PatchComment(patch=patch, submitter=submitter,
+                         msgid='<%d.%d@example.com>' % (patch.id, i),
+                         content='> quoted\n\nAcked-by: Test User '
+                         '<test%d@example.com>\n' % i)
+            for patch in patches for i in range(5)])
+
+    def _command(self, name, **options):
+        return lambda: call_command(name, stdout=StringIO(), **options)
+
+    def test_retag(self):
+        report('retag (%d patches)' % PATCHES, [
+            ('patch at a time', measure(_retag, repeat=1)),
+            ('batched', measure(self._command('retag'), repeat=1)),
+            ('batched, 4 jobs', measure(
+                self._command('retag', jobs=4), repeat=1)),
+        ])
+
+    def test_rehash(self):
+        report('rehash (%d patches)' % PATCHES, [
+            ('patch at a time', measure(_rehash, repeat=1)),
+            ('batched', measure(self._command('rehash'), repeat=1)),
+            ('batched, 4 jobs', measure(
+                self._command('rehash', jobs=4), repeat=1)),
+        ])
@@ -0,0 +1,329 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import fnmatch
+import hashlib
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+
+from patchwork.hasher import DiffHasher
+from patchwork.hasher import FILENAME_RE
+from patchwork.hasher import HUNK_RE
+from patchwork.models import DelegationRule
+from patchwork.parser import DelegationMatcher
+from patchwork.parser import EXTENDED_HEADER_LINES
+from patchwork.parser import FilenameFinder
+from patchwork.parser import parse_patch
+from patchwork.parser import _hunk_re
+from patchwork.tests.benchmarks import measure
+from patchwork.tests.benchmarks import report
+from patchwork.tests.benchmarks import skip_unless_benchmark
+
+
+def _parse_patch(content):
+    """The original, string concatenation-based, 'parse_patch'."""
+    patchbuf = ''
+    commentbuf = ''
+    buf = ''
+
+    state = 0
+    lc = (0, 0)
+    hunk = 0
+
+    for line in content.split('\n'):
+        line += '\n'
+
+        if state == 0:
+            if line.startswith('diff ') \
+                    or line.startswith('Index: '):
+                state = 1
+                buf += line
+            elif line.startswith('--- '):
+                state = 2
+                buf += line
+            else:
+                commentbuf += line
+        elif state == 1:
+            buf += line
+            if line.startswith('--- '):
+                state = 2
+            if line.startswith(EXTENDED_HEADER_LINES):
+                state = 6
+        elif state == 2:
+            if line.startswith('+++ '):
+                state = 3
+                buf += line
+            elif hunk:
+                state = 1
+                buf += line
+            else:
+                state = 0
+                commentbuf += buf + line
+                buf = ''
+        elif state == 3:
+            match = _hunk_re.match(line)
+            if match:
+                def fn(x):
+                    if not x:
+                        return 1
+                    return int(x)
+
+                lc = [fn(x) for x in match.groups()]
+
+                state = 4
+                patchbuf += buf + line
+                buf = ''
+            elif line.startswith('--- '):
+                patchbuf += buf + line
+                buf = ''
+                state = 2
+            elif hunk and line.startswith(r'\ No newline at end of file'):
+                patchbuf += line
+            elif hunk:
+                state = 1
+                buf += line
+            else:
+                state = 0
+                commentbuf += buf + line
+                buf = ''
+        elif state in [4, 5]:
+            if line.startswith('-'):
+                lc[0] -= 1
+            elif line.startswith('+'):
+                lc[1] -= 1
+            elif line.startswith(r'\ No newline at end of file'):
+                pass
+            else:
+                lc[0] -= 1
+                lc[1] -= 1
+
+            patchbuf += line
+
+            if lc[0] <= 0 and lc[1] <= 0:
+                state = 3
+                hunk += 1
+            else:
+                state = 5
+        elif state == 6:
+            if line.startswith(EXTENDED_HEADER_LINES):
+                patchbuf += buf + line
+                buf = ''
+            elif line.startswith('--- '):
+                patchbuf += buf + line
+                buf = ''
+                state = 2
+            else:
+                buf += line
+                state = 1
+
+    commentbuf += buf
+
+    if patchbuf == '':
+        patchbuf = None
+
+    if commentbuf == '':
+        commentbuf = None
+
+    return patchbuf, commentbuf
+
+
+def _hash_diff(diff):
+    """The original, multi-pass, 'hash_diff'."""
+    diff = diff.replace('\r', '')
+    diff = diff.strip() + '\n'
+
+    prefixes = ['-', '+', ' ']
+    hashed = hashlib.sha1()
+
+    for line in diff.split('\n'):
+        if len(line) <= 0:
+            continue
+
+        hunk_match = HUNK_RE.match(line)
+        filename_match = FILENAME_RE.match(line)
+
+        if filename_match:
+            if filename_match.group(1) == '---':
+                filename = 'a/'
+            else:
+                filename = 'b/'
+            filename += '/'.join(filename_match.group(2).split('/')[1:])
+
+            line = filename_match.group(1) + ' ' + filename
+        elif hunk_match:
+            def fn(x):
+                if not x:
+                    return 1
+                return int(x)
+            line_nos = list(map(fn, hunk_match.groups()))
+            line = '@@ -%d +%d @@' % tuple(line_nos)
+        elif line[0] in prefixes:
+            pass
+        else:
+            continue
+
+        hashed.update((line + '\n').encode('utf-8'))
+
+    return hashed.hexdigest()
+
+
+def _find_filenames(diff):
+    """The original, multi-pass, 'find_filenames'."""
+    diff = diff.replace('\r', '')
+    diff = diff.strip() + '\n'
+
+    filenames = {}
+
+    for line in diff.split('\n'):
+        if len(line) <= 0:
+            continue
+
+        filename_match = FILENAME_RE.match(line)
+        if not filename_match:
+            continue
+
+        filename = filename_match.group(2)
+        if filename.startswith('/dev/null'):
+            continue
+
+        filename = '/'.join(filename.split('/')[1:])
+        filenames[filename] = True
+
+    filenames = sorted(filenames.keys())
+
+    return filenames
+
+
+def _create_patch(size):
+    """Create a tree-wide patch of roughly the given size, in bytes."""
+    lines = ['Convert everything to the new API', '',
+             'Signed-off-by: Test User <test@example.com>', '---']
+
+    hunk = ['@@ -1,20 +1,20 @@']
+    for i in range(10):
+        hunk += ['-\told_function(arg%d);' % i,
+                 '+\tnew_function(arg%d);' % i]
+
+    length = 0
+    index = 0
+    while length < size:
+        filename = 'drivers/subsystem%d/file%d.c' % (index // 50, index)
+        chunk = ['diff --git a/%s b/%s' % (filename, filename),
+                 'index 3d75d48..a57f4dd 100644',
+                 '--- a/%s' % filename,
+                 '+++ b/%s' % filename] + hunk * 5
+        length += sum(len(line) + 1 for line in chunk)
+        lines += chunk
+        index += 1
+
+    lines += ['-- ', '2.26.2', '']
+
+    return '\n'.join(lines)
+
+
+@skip_unless_benchmark
+class ParsePatchBenchmark(SimpleTestCase):
+
+    def _benchmark(self, size):
+        content = _create_patch(size)
+
+        def original():
+            diff, _ = _parse_patch(content)
+            return _find_filenames(diff), _hash_diff(diff)
+
+        def streaming():
+            hasher = DiffHasher()
+            finder = FilenameFinder()
+            parse_patch(content, [hasher, finder])
+            return finder.filenames, hasher.hexdigest()
+
+        self.assertEqual(_parse_patch(content), parse_patch(content))
+        self.assertEqual(original(), streaming())
+
+        report('parse_patch (%d MB)' % (size // 2 ** 20), [
+            ('original parse, filenames and hash', measure(original)),
+            ('original parse', measure(lambda: _parse_patch(content))),
+            ('single pass parse, filenames and hash', measure(streaming)),
+            ('single pass parse', measure(lambda: parse_patch(content))),
+        ])
+
+    def test_5mb(self):
+        self._benchmark(5 * 2 ** 20)
+
+    def test_20mb(self):
+        self._benchmark(20 * 2 ** 20)
+
+
+def _find_delegate(rules, filenames):
+    """The original, 'fnmatch'-based, 'find_delegate_by_filename'."""
+    patch_delegate = None
+
+    for filename in filenames:
+        file_delegate = None
+        for rule in rules:
+            if fnmatch.fnmatch(filename, rule.path):
+                file_delegate = rule.user
+                break
+
+        if file_delegate is None:
+            return None
+
+        if patch_delegate is not None and file_delegate != patch_delegate:
+            return None
+
+        patch_delegate = file_delegate
+
+    return patch_delegate
+
+
+@skip_unless_benchmark
+class DelegationBenchmark(SimpleTestCase):
+
+    def _create_rules(self, count):
+        """Create rules resembling those of a large project.
+
+        Most rules are directory prefixes, with some file globs and exact
+        paths, all ordered from highest priority as they would be loaded.
+        """
+        user = User(id=1, username='maintainer')
+        rules = []
+
+        for i in range(count):
+            if i % 10 == 0:
+                path = 'drivers/subsystem%d/*.[ch]' % i
+            elif i % 10 == 1:
+                path = 'drivers/subsystem%d/file%d.c' % (i, i)
+            else:
+                path = 'drivers/subsystem%d/*' % i
+            rules.append(DelegationRule(path=path, user=user,
+                                        priority=count - i))
+
+        rules.append(DelegationRule(path='*', user=user, priority=-1))
+
+        return rules
+
+    def _benchmark(self, rule_count, file_count):
+        rules = self._create_rules(rule_count)
+        filenames = ['drivers/subsystem%d/file%d.c' % (i % rule_count, i)
+                     for i in range(file_count)]
+
+        def compiled():
+            return DelegationMatcher(rules).find_delegate(filenames)
+
+        matcher = DelegationMatcher(rules)
+
+        self.assertEqual(_find_delegate(rules, filenames), compiled())
+
+        report('find_delegate_by_filename (%d rules, %d files)' % (
+            rule_count, file_count), [
+            ('original', measure(lambda: _find_delegate(rules, filenames))),
+            ('compiled, including compilation', measure(compiled)),
+            ('compiled, cached', measure(
+                lambda: matcher.find_delegate(filenames))),
+        ])
+
+    def test_500_rules_5000_files(self):
+        self._benchmark(500, 5000)
@@ -0,0 +1,65 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+from collections import Counter
+import re
+
+from django.test import SimpleTestCase
+
+from patchwork.models import Patch
+from patchwork.models import Tag
+from patchwork.tests.benchmarks import measure
+from patchwork.tests.benchmarks import report
+from patchwork.tests.benchmarks import skip_unless_benchmark
+
+TAGS = ['Acked-by', 'Reviewed-by', 'Tested-by', 'Reported-by',
+        'Suggested-by', 'Nacked-by']
+
+
+def _extract_tags(content, tags):
+    """The original, regex per tag, 'extract_tags'."""
+    counts = Counter()
+
+    for tag in tags:
+        regex = re.compile(tag.pattern, re.MULTILINE | re.IGNORECASE)
+        counts[tag] = len(regex.findall(content))
+
+    return counts
+
+
+def _create_comment(index):
+    """Create a reply of the kind found on a busy thread."""
+    lines = ['On Mon, 1 Jan 2020, Test User wrote:']
+    lines += ['> quoted line %d of the patch' % i for i in range(40)]
+    lines += ['', 'Looks good to me.', '',
+              '%s: Test User <test%d@example.com>' % (
+                  TAGS[index % len(TAGS)], index)]
+
+    return '\n'.join(lines)
+
+
+@skip_unless_benchmark
+class ExtractTagsBenchmark(SimpleTestCase):
+
+    def test_thread(self):
+        tags = [Tag(id=i, name=name, pattern='^%s:' % name)
+                for i, name in enumerate(TAGS, 1)]
+        comments = [_create_comment(i) for i in range(200)]
+
+        def original():
+            return sum((_extract_tags(comment, tags)
+                        for comment in comments), Counter())
+
+        def combined():
+            return sum((Patch.extract_tags(comment, tags)
+                        for comment in comments), Counter())
+
+        self.assertEqual(original(), combined())
+
+        report('extract_tags (%d tags, %d comments)' % (
+            len(tags), len(comments)), [
+            ('regex per tag', measure(original)),
+            ('combined regex', measure(combined)),
+        ])
@@ -0,0 +1,194 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+from collections import OrderedDict
+import datetime
+import os
+
+from django.db.models import Prefetch
+from django.test import TestCase
+
+from patchwork.models import Check
+from patchwork.models import Patch
+from patchwork.models import PatchTag
+from patchwork.models import Tag
+from patchwork.models import pack_counts
+from patchwork.tests.benchmarks import measure
+from patchwork.tests.benchmarks import report
+from patchwork.tests.benchmarks import skip_unless_benchmark
+from patchwork.tests.utils import create_person
+from patchwork.tests.utils import create_project
+from patchwork.tests.utils import create_state
+from patchwork.tests.utils import create_user
+
+# The number of patches in the project listed. This can be overridden using
+# the PW_BENCHMARK_PATCHES environment variable
+PATCHES = int(os.getenv('PW_BENCHMARK_PATCHES', 1000000))
+
+# The number of patches on a page of the list
+PAGE_SIZE = 100
+
+# The number of checks of each patch, and the contexts these are spread over
+CHECKS = 20
+CONTEXTS = 5
+
+
+def _with_tag_counts(qs, tags):
+    """The original, subquery-based, 'with_tag_counts'."""
+    select = OrderedDict()
+    select_params = []
+
+    for tag in tags:
+        select['tag_%d_count' % tag.id] = (
+            "coalesce("
+            "(SELECT count FROM patchwork_patchtag"
+            " WHERE patchwork_patchtag.patch_id=patchwork_patch.id"
+            " AND patchwork_patchtag.tag_id=%s), 0)")
+        select_params.append(tag.id)
+
+    return qs.prefetch_related('project').extra(
+        select=select, select_params=select_params)
+
+
+@skip_unless_benchmark
+class PatchListBenchmark(TestCase):
+
+    fixtures = ['default_tags']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = create_project()
+        submitter = create_person()
+        state = create_state()
+        tags = list(Tag.objects.all())
+        date = datetime.datetime(2020, 1, 1)
+
+        # a third of patches are given tags, which is typical of a busy list
+        for start in range(0, PATCHES, 10000):
+            patches = []
+            counts = {}
+            for i in range(start, min(start + 10000, PATCHES)):
+                if i % 3 == 0:
+                    counts[i] = {tags[i % len(tags)].id: 1 + i % 2}
+
+                # not all databases return the IDs of bulk created objects
+                patches.append(Patch(
+                    id=i + 1, project=cls.project, submitter=submitter,
+                    state=state, msgid='<%d@example.com>' % i,
+                    name='patch %d' % i,
+                    date=date + datetime.timedelta(minutes=i),
+                    headers='', content='', diff='',
+                    tag_counts=pack_counts(counts.get(i, {}))))
+
+            Patch.objects.bulk_create(patches)
+            PatchTag.objects.bulk_create([
+                PatchTag(patch_id=i + 1, tag_id=tag_id, count=count)
+                for i, patch_counts in counts.items()
+                for tag_id, count in patch_counts.items()])
+
+    def _list(self, qs, get_count):
+        """List a page of patches, as 'generic_list' does."""
+        tags = self.project.tags
+
+        qs = qs.order_by('-date').select_related('state', 'submitter')
+        qs = qs.only('state', 'submitter', 'project', 'name', 'date',
+                     'msgid', 'tag_counts')
+
+        qs.count()
+        return [[get_count(patch, tag) for tag in tags]
+                for patch in qs[:PAGE_SIZE]]
+
+    def test_list(self):
+        project = self.project
+        patches = Patch.objects.filter(project=project)
+
+        def original():
+            return self._list(
+                _with_tag_counts(patches, project.tags),
+                lambda patch, tag: getattr(patch, 'tag_%d_count' % tag.id))
+
+        def denormalized():
+            return self._list(
+                patches.with_tag_counts(project),
+                lambda patch, tag: patch.get_tag_count(tag))
+
+        self.assertEqual(original(), denormalized())
+
+        report('patch list (%d patches)' % PATCHES, [
+            ('tag count subqueries', measure(original)),
+            ('stored tag counts', measure(denormalized)),
+        ])
+
+
+def _check_count(patch):
+    """The original, check loading, 'check_count'."""
+    unique = {}
+    for check in patch.check_set.all():
+        key = (check.user_id, check.context)
+        if key not in unique or unique[key].date <= check.date:
+            unique[key] = check
+
+    counts = {key: 0 for key, _ in Check.STATE_CHOICES}
+    for check in unique.values():
+        counts[check.state] += 1
+
+    return counts
+
+
+@skip_unless_benchmark
+class PatchListChecksBenchmark(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = create_project()
+        submitter = create_person()
+        user = create_user()
+        state = create_state()
+        date = datetime.datetime(2020, 1, 1)
+
+        # not all databases return the IDs of bulk created objects
+        Patch.objects.bulk_create([
+            Patch(id=i + 1, project=cls.project, submitter=submitter,
+                  state=state, msgid='<%d@example.com>' % i,
+                  name='patch %d' % i,
+                  date=date + datetime.timedelta(minutes=i),
+                  headers='', content='', diff='')
+            for i in range(PAGE_SIZE * 10)])
+
+        # checks are created one at a time, as the REST API does
+        for patch in Patch.objects.all()[:PAGE_SIZE]:
+            for i in range(CHECKS):
+                Check.objects.create(
+                    patch=patch, user=user, context='ci-%d' % (i % CONTEXTS),
+                    state=i % 4, date=date + datetime.timedelta(minutes=i))
+
+    def _list(self, qs, get_counts):
+        """List a page of patches, as 'generic_list' does."""
+        qs = qs.order_by('date').select_related('state', 'submitter')
+        qs = qs.only('state', 'submitter', 'project', 'name', 'date',
+                     'msgid', 'check_counts')
+
+        qs.count()
+        return [get_counts(patch) for patch in qs[:PAGE_SIZE]]
+
+    def test_list(self):
+        patches = Patch.objects.filter(project=self.project)
+
+        def original():
+            return self._list(
+                patches.prefetch_related(Prefetch(
+                    'check_set', queryset=Check.objects.only(
+                        'context', 'user_id', 'patch_id', 'state', 'date'))),
+                _check_count)
+
+        def denormalized():
+            return self._list(patches, lambda patch: patch.check_count)
+
+        self.assertEqual(original(), denormalized())
+
+        report('patch list (%d checks per patch)' % CHECKS, [
+            ('prefetched checks', measure(original)),
+            ('stored check summary', measure(denormalized)),
+        ])
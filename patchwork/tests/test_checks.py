@@ -9,6 +9,7 @@ from datetime import timedelta
 from django.test import TransactionTestCase
 
 from patchwork.models import Check
+from patchwork.models import Patch
 from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_patches
 from patchwork.tests.utils import create_user
@@ -137,3 +138,76 @@ class PatchChecksTest(TransactionTestCase):
         self._create_check()
         self._create_check(context='new/test1')
         self.assertCheckEqual(self.patch, Check.STATE_SUCCESS)
+
+    def test_summary__stored(self):
+        self._create_check(date=(dt.utcnow() - timedelta(days=1)))
+        self._create_check(context='new/test1', state=Check.STATE_WARNING)
+        self._create_check(state=Check.STATE_FAIL)
+
+        # the summary is read from the patch, rather than from its checks
+        patch = Patch.objects.get(id=self.patch.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(patch.combined_check_state, 'fail')
+            self.assertEqual(patch.check_count[Check.STATE_FAIL], 1)
+            self.assertEqual(patch.check_count[Check.STATE_WARNING], 1)
+            self.assertEqual(patch.check_count[Check.STATE_SUCCESS], 0)
+
+    def test_summary__older_check(self):
+        check = self._create_check()
+        self._create_check(date=(dt.utcnow() - timedelta(days=1)),
+                           state=Check.STATE_FAIL)
+
+        patch = Patch.objects.get(id=self.patch.id)
+        self.assertEqual(patch.combined_check_state, 'success')
+        self.assertEqual(list(Check.objects.filter(is_latest=True)), [check])
+
+    def test_summary__delete(self):
+        check = self._create_check(date=(dt.utcnow() - timedelta(days=1)))
+        self._create_check(state=Check.STATE_FAIL).delete()
+
+        patch = Patch.objects.get(id=self.patch.id)
+        self.assertEqual(patch.combined_check_state, 'success')
+        self.assertChecksEqual(patch, [check])
+
+    def test_summary__refresh(self):
+        self._create_check(date=(dt.utcnow() - timedelta(days=1)))
+        check_a = self._create_check(state=Check.STATE_WARNING)
+        check_b = self._create_check(context='new/test1')
+        expected = (self.patch.check_state, self.patch.check_counts)
+
+        Check.objects.update(is_latest=True)
+        Patch.objects.update(check_state=Check.STATE_PENDING,
+                             check_counts='')
+
+        patch = Patch.objects.get(id=self.patch.id)
+        patch.refresh_check_summary()
+        self.assertEqual((patch.check_state, patch.check_counts), expected)
+        self.assertEqual(
+            sorted(Check.objects.filter(is_latest=True).values_list(
+                'id', flat=True)),
+            [check_a.id, check_b.id])
+
+    def test_create_checks(self):
+        old = self._create_check(context='old', state=Check.STATE_FAIL)
+        checks = Check.objects.create_checks([
+            Check(patch=self.patch, user=self.user, context='old',
+                  state=Check.STATE_SUCCESS),
+            Check(patch=self.patch, user=self.user, context='new',
+                  state=Check.STATE_WARNING),
+            Check(patch=self.patch, user=self.user, context='new',
+                  date=(dt.utcnow() - timedelta(days=1)),
+                  state=Check.STATE_FAIL),
+        ])
+
+        self.assertTrue(all(check.id for check in checks))
+        self.assertEqual([False, True, True, False],
+                         [check.is_latest for check in Check.objects.filter(
+                             id__in=[old.id] + [c.id for c in checks]
+                         ).order_by('id')])
+
+        # this should match the summary made by saving checks one by one
+        patch = Patch.objects.get(id=self.patch.id)
+        expected = (patch.check_state, patch.check_counts)
+        patch.refresh_check_summary()
+        self.assertEqual((patch.check_state, patch.check_counts), expected)
+        self.assertEqual(patch.combined_check_state, 'warning')
@@ -6,6 +6,7 @@
 from django.test import TestCase
 from django.urls import reverse
 
+from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_cover
 from patchwork.tests.utils import create_cover_comment
 from patchwork.tests.utils import create_patch
@@ -140,6 +141,21 @@ class PatchViewTest(TestCase):
         response = self.client.get(requested_url)
         self.assertNotIn('<b>TEST</b>'.encode('utf-8'), response.content)
 
+    def test_check_history(self):
+        """The history of checks is shown, not only the latest."""
+        patch = create_patch()
+        # two checks of the same context, only the second of which is latest
+        user = create_check(patch=patch, description='first-check').user
+        create_check(patch=patch, user=user, description='second-check')
+
+        requested_url = reverse('patch-detail',
+                                kwargs={'project_id': patch.project.linkname,
+                                        'msgid': patch.url_msgid})
+        response = self.client.get(requested_url)
+        self.assertContains(response, 'first-check')
+        self.assertContains(response, 'second-check')
+        self.assertEqual(2, len(response.context['checks']))
+
     def test_invalid_project_id(self):
         requested_url = reverse(
             'patch-detail',
@@ -3,9 +3,18 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import datetime
+
+from django.db import connection
+from django.db import transaction
+from django.db.models.signals import pre_save
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
+from patchwork.models import Check
+from patchwork.models import defer_events
 from patchwork.models import Event
+from patchwork.models import Patch
 from patchwork.tests import utils
 
 BASE_FIELDS = ['previous_state', 'current_state', 'previous_delegate',
@@ -172,6 +181,29 @@ class PatchChangedTest(_BaseTestCase):
                          Event.CATEGORY_PATCH_DELEGATED)
         self.assertEventFields(events[3], previous_delegate=delegate_b)
 
+    def test_patch_unchanged_queries(self):
+        """The original patch should only be loaded once."""
+        patch = utils.create_patch()
+
+        with self.assertNumQueries(1):
+            pre_save.send(sender=Patch, instance=patch, raw=False)
+
+    def test_patch_changed_queries(self):
+        """Only the events for the changes should need further queries."""
+        patch = utils.create_patch(series=None)
+        patch.state = utils.create_state()
+        patch.delegate = utils.create_user()
+
+        # one to load the original patch and one for each event
+        with self.assertNumQueries(3):
+            pre_save.send(sender=Patch, instance=patch, raw=False)
+
+        events = _get_events(patch=patch)
+        self.assertEqual(
+            [event.category for event in events],
+            [Event.CATEGORY_PATCH_CREATED, Event.CATEGORY_PATCH_STATE_CHANGED,
+             Event.CATEGORY_PATCH_DELEGATED])
+
 
 class CheckCreatedTest(_BaseTestCase):
 
@@ -230,3 +262,118 @@ class SeriesChangedTest(_BaseTestCase):
         events = _get_events(series=series)
         self.assertIn(Event.CATEGORY_SERIES_COMPLETED,
                       [x.category for x in events])
+
+
+class DeferEventsTest(_BaseTestCase):
+
+    def _count_event_inserts(self, queries):
+        return len([query for query in queries
+                    if query['sql'].startswith(
+                        'INSERT INTO "patchwork_event"')])
+
+    def test_defer_events(self):
+        """Events are created in bulk at the end of the block."""
+        patches = [utils.create_patch(series=None) for _ in range(3)]
+        states = [patch.state for patch in patches]
+        state = utils.create_state()
+        count = Event.objects.count()
+
+        with CaptureQueriesContext(connection) as queries:
+            with defer_events():
+                for patch in patches:
+                    patch.state = state
+                    patch.save()
+
+                # nothing is created until the end of the block
+                self.assertEqual(count, Event.objects.count())
+                date = datetime.datetime.utcnow()
+
+        self.assertEqual(1, self._count_event_inserts(queries))
+
+        # the events are created in the order they were recorded in, with
+        # the dates they were recorded at
+        events = Event.objects.filter(
+            category=Event.CATEGORY_PATCH_STATE_CHANGED).order_by('id')
+        self.assertEqual(patches, [event.patch for event in events])
+        self.assertEqual(
+            sorted(event.date for event in events),
+            [event.date for event in events])
+        self.assertLess(events[2].date, date)
+        for event, previous_state in zip(events, states):
+            self.assertEventFields(event, previous_state=previous_state,
+                                   current_state=state)
+
+    def test_defer_events_exception(self):
+        """Events are discarded, along with changes, on exceptions."""
+        patch = utils.create_patch(series=None)
+        state = patch.state
+        count = Event.objects.count()
+
+        with self.assertRaises(ValueError):
+            with defer_events():
+                patch.state = utils.create_state()
+                patch.save()
+                raise ValueError()
+
+        self.assertEqual(count, Event.objects.count())
+        patch.refresh_from_db()
+        self.assertEqual(state, patch.state)
+
+        # subsequent events are created as usual
+        patch.state = utils.create_state()
+        patch.save()
+        self.assertEqual(count + 1, Event.objects.count())
+
+    def test_defer_events_nested(self):
+        """Events of nested blocks are created at the end of the outermost."""
+        patch_a = utils.create_patch(series=None)
+        patch_b = utils.create_patch(series=None)
+        count = Event.objects.count()
+        last_id = Event.objects.order_by('-id')[0].id
+
+        with CaptureQueriesContext(connection) as queries:
+            with defer_events():
+                with defer_events():
+                    patch_a.state = utils.create_state()
+                    patch_a.save()
+
+                self.assertEqual(count, Event.objects.count())
+
+                try:
+                    with defer_events():
+                        patch_b.state = utils.create_state()
+                        patch_b.save()
+                        raise ValueError()
+                except ValueError:
+                    pass
+
+        self.assertEqual(1, self._count_event_inserts(queries))
+        events = _get_events(id__gt=last_id)
+        self.assertEqual([patch_a], [event.patch for event in events])
+
+    def test_defer_events_savepoint_rollback(self):
+        """Events recorded in rolled back savepoints are discarded."""
+        patch = utils.create_patch(series=None)
+        user = utils.create_user()
+        last_id = Event.objects.order_by('-id')[0].id
+
+        with defer_events():
+            patch.state = utils.create_state()
+            patch.save()
+
+            try:
+                with transaction.atomic():
+                    utils.create_check(patch=patch, user=user)
+                    raise ValueError()
+            except ValueError:
+                pass
+
+            utils.create_check(patch=patch, user=user, context='other')
+
+        self.assertEqual(1, Check.objects.filter(patch=patch).count())
+        events = _get_events(id__gt=last_id)
+        self.assertEqual(
+            [Event.CATEGORY_PATCH_STATE_CHANGED,
+             Event.CATEGORY_CHECK_CREATED],
+            [event.category for event in events])
+        self.assertEqual('other', events[1].created_check.context)
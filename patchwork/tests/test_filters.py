@@ -6,7 +6,9 @@
 from django.test import TestCase
 from django.urls import reverse
 
+from patchwork.tests.utils import create_patch
 from patchwork.tests.utils import create_project
+from patchwork.tests.utils import make_diff
 
 
 class FilterQueryStringTest(TestCase):
@@ -34,3 +36,21 @@ class FilterQueryStringTest(TestCase):
         response = self.client.get(url + '?submitter=%%E2%%98%%83')
 
         self.assertEqual(response.status_code, 200)
+
+
+class PathFilterTest(TestCase):
+
+    def test_path(self):
+        """Validate filtering of patches by the paths they change."""
+        project = create_project()
+        create_patch(project=project, name='netpatch',
+                     diff=make_diff('drivers/net/a.c'))
+        create_patch(project=project, name='fspatch',
+                     diff=make_diff('fs/b.c'))
+        url = reverse('patch-list', args=[project.linkname])
+
+        response = self.client.get(url + '?path=drivers/net/*')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'netpatch')
+        self.assertNotContains(response, 'fspatch')
@@ -27,6 +27,20 @@ class EmptyPatchListTest(TestCase):
         self.assertContains(response, 'No patches to display')
 
 
+class PatchListTest(TestCase):
+
+    def test_diffstat(self):
+        """Validates that the diffstat is shown for each patch."""
+        project = create_project()
+        create_patch(project=project)
+        url = reverse('patch-list', kwargs={'project_id': project.linkname})
+
+        response = self.client.get(url)
+
+        self.assertContains(
+            response, '1 file changed, 1 insertion(+), 0 deletions(-)')
+
+
 class PatchOrderTest(TestCase):
 
     patchmeta = [
@@ -3,14 +3,31 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import asyncio
+import datetime
+import email
+import gzip
+import json
 import os
+import shutil
+import smtplib
+import socket
+import subprocess
 import sys
+import tempfile
+import threading
 from io import StringIO
+from unittest import mock
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from django.test import TransactionTestCase
 
 from patchwork import models
+from patchwork.management.commands import lmtpserver
+from patchwork.management.commands import parsearchive
+from patchwork.management.commands import parsemaild
 from patchwork.tests import TEST_MAIL_DIR
 from patchwork.tests import utils
 
@@ -107,6 +124,194 @@ class ParsemailTest(TestCase):
         # self.assertEqual(count, 1)
 
 
+class ParsemaildTest(TransactionTestCase):
+
+    def setUp(self):
+        self.project = utils.create_project()
+        utils.create_state()
+        self.command = parsemaild.Command()
+
+    def _read_mail(self, name):
+        with open(os.path.join(TEST_MAIL_DIR, name), 'rb') as file_:
+            return file_.read()
+
+    def _send(self, data, list_id=''):
+        client, server = socket.socketpair()
+        with client:
+            client.sendall(list_id.encode() + b'\n' + data)
+            client.shutdown(socket.SHUT_WR)
+            self.command.handle_connection(server)
+            return client.recv(16)
+
+    def test_connection(self):
+        data = self._read_mail('0001-git-pull-request.mbox')
+
+        self.assertEqual(self._send(data, self.project.listid), b'0\n')
+        self.assertEqual(models.Patch.objects.count(), 1)
+
+        # duplicates are expected and aren't errors
+        self.assertEqual(self._send(data, self.project.listid), b'0\n')
+        self.assertEqual(models.Patch.objects.count(), 1)
+
+    def test_connection_error(self):
+        data = self._read_mail('0001-git-pull-request.mbox')
+        data = data.replace(b'Message-ID:', b'X-Message-ID:')
+
+        self.assertEqual(self._send(data, self.project.listid), b'1\n')
+        self.assertEqual(models.Patch.objects.count(), 0)
+
+    def test_maildir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for subdir in ('cur', 'new', 'tmp'):
+            os.mkdir(os.path.join(path, subdir))
+
+        data = self._read_mail('0001-git-pull-request.mbox')
+        with open(os.path.join(path, 'new', 'good'), 'wb') as file_:
+            file_.write(data)
+        with open(os.path.join(path, 'new', 'bad'), 'wb') as file_:
+            file_.write(data.replace(b'Message-ID:', b'X-Message-ID:'))
+
+        self.command.handle_maildir_message(path, 'good',
+                                            self.project.listid)
+        self.command.handle_maildir_message(path, 'bad', self.project.listid)
+
+        self.assertEqual(models.Patch.objects.count(), 1)
+        self.assertEqual(os.listdir(os.path.join(path, 'new')), [])
+        self.assertEqual(os.listdir(os.path.join(path, 'cur')),
+                         ['bad:2,FS'])
+
+
+class ParsemailClientTest(TestCase):
+
+    script = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          'bin', 'parsemail-client.py')
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.socket = os.path.join(path, 'parsemail.sock')
+
+    def _run(self, data):
+        return subprocess.run(
+            [sys.executable, self.script, '--socket', self.socket,
+             '--list-id', 'test.example.com'],
+            input=data, stderr=subprocess.DEVNULL)
+
+    def test_exit_code(self):
+        received = []
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        sock.bind(self.socket)
+        sock.listen(1)
+
+        def serve():
+            conn, _ = sock.accept()
+            with conn, conn.makefile('rb') as rfile:
+                received.append(rfile.read())
+                conn.sendall(b'1\n')
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+
+        result = self._run(b'Subject: test\n\ntest\n')
+        thread.join()
+
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(received,
+                         [b'test.example.com\nSubject: test\n\ntest\n'])
+
+    def test_no_daemon(self):
+        result = self._run(b'Subject: test\n\ntest\n')
+
+        # the mail server should try again later
+        self.assertEqual(result.returncode, 75)
+
+
+class LMTPServerTest(TransactionTestCase):
+
+    def setUp(self):
+        self.project = utils.create_project()
+        utils.create_state()
+
+        loop = asyncio.new_event_loop()
+        lmtp = lmtpserver.LMTPServer(self.project.listid, workers=1)
+        server = lmtp.start(loop, '127.0.0.1', 0)
+        self.port = server.sockets[0].getsockname()[1]
+
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+            lmtp.executor.shutdown()
+
+        self.addCleanup(stop)
+
+        self.lmtp = smtplib.LMTP('127.0.0.1', self.port)
+        self.addCleanup(self.lmtp.close)
+        self.lmtp.ehlo_or_helo_if_needed()
+
+    def _read_mail(self, name):
+        with open(os.path.join(TEST_MAIL_DIR, name), 'rb') as file_:
+            return file_.read()
+
+    def _send(self, data, recipients=('patchwork@example.com',)):
+        self.lmtp.mail('sender@example.com')
+        for recipient in recipients:
+            self.lmtp.rcpt(recipient)
+
+        # smtplib only reads the reply for the first recipient
+        replies = [self.lmtp.data(data)]
+        replies += [self.lmtp.getreply() for _ in recipients[1:]]
+
+        return [code for code, _ in replies]
+
+    def test_deliver(self):
+        data = self._read_mail('0001-git-pull-request.mbox')
+
+        self.assertEqual(self._send(data), [250])
+        self.assertEqual(models.Patch.objects.count(), 1)
+
+        # duplicates are expected and aren't errors
+        self.assertEqual(
+            self._send(data, ('a@example.com', 'b@example.com')), [250, 250])
+        self.assertEqual(models.Patch.objects.count(), 1)
+
+        patch = models.Patch.objects.get()
+        self.assertNotIn('\r', patch.content)
+
+    def test_deliver_invalid(self):
+        data = self._read_mail('0001-git-pull-request.mbox')
+        data = data.replace(b'Message-ID:', b'X-Message-ID:')
+
+        self.assertEqual(self._send(data), [554])
+        self.assertEqual(models.Patch.objects.count(), 0)
+
+    def test_deliver_error(self):
+        data = self._read_mail('0001-git-pull-request.mbox')
+
+        # unexpected errors are likely bugs, so the mail should be retried
+        # rather than rejected
+        with mock.patch.object(lmtpserver, 'parse_mail',
+                               side_effect=AttributeError('bug')):
+            with self.assertLogs(lmtpserver.logger, 'ERROR'):
+                self.assertEqual(self._send(data), [451])
+        self.assertEqual(models.Patch.objects.count(), 0)
+
+    def test_commands(self):
+        self.assertEqual(self.lmtp.rcpt('a@example.com')[0], 503)
+        self.assertEqual(self.lmtp.docmd('DATA')[0], 503)
+        self.assertEqual(self.lmtp.docmd('HELO', 'example.com')[0], 500)
+        self.assertEqual(self.lmtp.noop()[0], 250)
+        self.assertEqual(self.lmtp.rset()[0], 250)
+
+
 class ParsearchiveTest(TestCase):
     def test_invalid_path(self):
         out = StringIO()
@@ -124,3 +329,371 @@ class ParsearchiveTest(TestCase):
 
         self.assertIn('Processed 1 messages -->', out.getvalue())
         self.assertIn('  1 dropped', out.getvalue())
+
+    def test_parallel(self):
+        project = utils.create_project()
+        utils.create_state()
+
+        path = os.path.join(os.path.dirname(TEST_MAIL_DIR), 'series',
+                            'base-cover-letter.mbox')
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid, jobs=2,
+                     stdout=out)
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertIn('  1 cover letters', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+        self.assertIn('  0 errors', out.getvalue())
+
+        # the series should be threaded exactly as it is when parsing serially
+        self.assertEqual(models.Series.objects.count(), 1)
+        series = models.Series.objects.get()
+        self.assertIsNotNone(series.cover_letter)
+        self.assertEqual(series.patches.count(), 2)
+        self.assertTrue(series.received_all)
+
+    def test_parallel_invalid(self):
+        message_from_bytes = email.message_from_bytes
+
+        def parse(data):
+            if data == b'broken':
+                raise ValueError('broken')
+            return message_from_bytes(data)
+
+        # mails that can't be parsed at all are passed back from workers,
+        # rather than aborting the import
+        with mock.patch.object(parsearchive.email, 'message_from_bytes',
+                               side_effect=parse):
+            results = parsearchive._parse_shard(
+                [b'broken', b'Subject: test\n\nfoo\n'])
+
+        self.assertEqual((None, None), results[0][:2])
+        self.assertIsInstance(results[0][2], ValueError)
+        self.assertEqual('test', results[1][0]['Subject'])
+        self.assertIsNone(results[1][2])
+
+        command = parsearchive.Command()
+        command.errors = 0
+        with self.assertLogs(parsearchive.logger, 'WARNING'):
+            mails = list(command._unpack_shard(results))
+        self.assertEqual([results[1][:2]], mails)
+        self.assertEqual(1, command.errors)
+
+    def test_bulk(self):
+        project = utils.create_project()
+        utils.create_state()
+
+        path = os.path.join(os.path.dirname(TEST_MAIL_DIR), 'series',
+                            'base-cover-letter.mbox')
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid, bulk=True,
+                     stdout=out)
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertIn('  1 cover letters', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid, bulk=True,
+                     stdout=out)
+
+        self.assertIn('  3 duplicates', out.getvalue())
+        self.assertEqual(models.Series.objects.count(), 1)
+
+
+class RehashTest(TestCase):
+
+    def setUp(self):
+        self.patches = utils.create_patches(
+            2, diff=utils.make_diff('drivers/net/a.c'))
+        self.hash = self.patches[0].hash
+        models.Patch.objects.update(hash='0' * 40, files_changed=None,
+                                    insertions=None, deletions=None)
+        models.PatchFile.objects.all().delete()
+
+    def test_rehash(self):
+        events = models.Event.objects.count()
+
+        out = StringIO()
+        call_command('rehash', jobs=2, stdout=out)
+
+        self.assertIn('done: updated 2 patches', out.getvalue())
+        self.assertEqual(
+            list(models.Patch.objects.values_list(
+                'hash', 'files_changed', 'insertions', 'deletions')),
+            [(self.hash, 1, 1, 0)] * 2)
+        self.assertEqual(models.PatchFile.objects.count(), 2)
+        # no events should be generated for derived data
+        self.assertEqual(models.Event.objects.count(), events)
+
+    def test_rehash_patch_ids(self):
+        call_command('rehash', self.patches[1].id, stdout=StringIO())
+
+        self.assertEqual(
+            list(models.Patch.objects.values_list('hash', flat=True)),
+            ['0' * 40, self.hash])
+
+    def test_rehash_since(self):
+        call_command('rehash', since=self.patches[1].date.isoformat(' '),
+                     stdout=StringIO())
+
+        self.assertEqual(
+            list(models.Patch.objects.values_list('hash', flat=True)),
+            ['0' * 40, self.hash])
+
+    def test_rehash_checkpoint(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        checkpoint = os.path.join(tmpdir, 'rehash.checkpoint')
+        with open(checkpoint, 'w') as f:
+            f.write('%d\n' % self.patches[0].id)
+
+        out = StringIO()
+        call_command('rehash', checkpoint=checkpoint, batch_size=1,
+                     stdout=out)
+
+        self.assertIn('Resuming after patch %d' % self.patches[0].id,
+                      out.getvalue())
+        self.assertEqual(
+            list(models.Patch.objects.values_list('hash', flat=True)),
+            ['0' * 40, self.hash])
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class PruneeventsTest(TestCase):
+
+    def setUp(self):
+        # series-created, patch-created, patch-completed, series-completed,
+        # check-created
+        for _ in range(2):
+            series = utils.create_series()
+            patch = utils.create_patch(series=series, project=series.project)
+            utils.create_check(patch=patch)
+
+        # the events of the first series are old
+        self.old = models.Event.objects.filter(
+            series=series).order_by('id')[0].id
+        models.Event.objects.filter(id__lt=self.old).update(
+            date=datetime.datetime.utcnow() - datetime.timedelta(days=60))
+
+    def _events(self):
+        return list(models.Event.objects.order_by('id').values_list(
+            'id', 'category'))
+
+    def test_prune(self):
+        events = self._events()
+
+        out = StringIO()
+        call_command('pruneevents', '--days=30', '--batch-size=2', stdout=out)
+
+        self.assertIn('done: deleted 5 events', out.getvalue())
+        self.assertEqual(events[5:], self._events())
+
+    def test_prune_category(self):
+        events = self._events()
+
+        call_command('pruneevents', '--category-days=check-created=30',
+                     '--category-days=patch-created=30', stdout=StringIO())
+
+        self.assertEqual(
+            [x for x in events[:5]
+             if x[1] not in ('check-created', 'patch-created')] + events[5:],
+            self._events())
+
+    def test_prune_category_override(self):
+        events = self._events()
+
+        # check events are kept for longer than other events
+        call_command('pruneevents', '--days=30',
+                     '--category-days=check-created=90', stdout=StringIO())
+
+        self.assertEqual(
+            [x for x in events[:5] if x[1] == 'check-created'] + events[5:],
+            self._events())
+
+    def test_prune_archive(self):
+        events = self._events()
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        archive = os.path.join(tmpdir, 'events.jsonl.gz')
+
+        call_command('pruneevents', '--days=30', '--batch-size=2',
+                     '--archive=%s' % archive, stdout=StringIO())
+        # events are appended to existing archives
+        call_command('pruneevents', '--days=0', '--archive=%s' % archive,
+                     stdout=StringIO())
+
+        self.assertEqual([], self._events())
+        with gzip.open(archive, 'rt') as f:
+            archived = [json.loads(line) for line in f]
+        self.assertEqual(
+            events, [(x['id'], x['category']) for x in archived])
+        self.assertIn('project_id', archived[0])
+        self.assertIn('date', archived[0])
+
+    def test_prune_undelivered(self):
+        events = self._events()
+        project = models.Event.objects.get(id=events[0][0]).project
+
+        # the first two old events have been delivered, after a failure
+        webhook = utils.create_webhook(project=project)
+        models.Webhook.objects.filter(id=webhook.id).update(
+            last_event_id=events[1][0])
+        for success in (False, True):
+            models.WebhookDelivery.objects.create(
+                webhook=webhook, first_event_id=events[0][0],
+                last_event_id=events[1][0], event_count=2, success=success)
+        # ...but the rest are being retried
+        retrying = models.WebhookDelivery.objects.create(
+            webhook=webhook, first_event_id=events[2][0],
+            last_event_id=events[4][0], event_count=3, success=False)
+        # inactive webhooks don't keep events
+        utils.create_webhook(project=project, active=False)
+
+        call_command('pruneevents', '--days=30', stdout=StringIO())
+
+        self.assertEqual(events[2:], self._events())
+        self.assertEqual([retrying],
+                         list(models.WebhookDelivery.objects.all()))
+
+        # only events of the webhook's categories are kept
+        models.Webhook.objects.filter(id=webhook.id).update(
+            categories='check-created')
+
+        call_command('pruneevents', '--days=30', stdout=StringIO())
+
+        self.assertEqual(
+            [x for x in events[2:5] if x[1] == 'check-created'] + events[5:],
+            self._events())
+
+    def test_prune_dry_run(self):
+        events = self._events()
+
+        out = StringIO()
+        call_command('pruneevents', '--days=30', '--dry-run', stdout=out)
+
+        self.assertIn('Would delete 5 events', out.getvalue())
+        self.assertEqual(events, self._events())
+
+    def test_prune_no_retention(self):
+        with self.assertRaises(CommandError):
+            call_command('pruneevents', stdout=StringIO())
+
+    def test_prune_invalid_category(self):
+        with self.assertRaises(CommandError):
+            call_command('pruneevents', '--category-days=foo=1',
+                         stdout=StringIO())
+
+
+class RetagTest(TestCase):
+
+    fixtures = ['default_tags']
+
+    def setUp(self):
+        self.patches = []
+        for project in (utils.create_project(), utils.create_project()):
+            patch = utils.create_patch(
+                project=project,
+                content='Acked-by: Test User <test@example.com>\n')
+            utils.create_patch_comment(
+                patch=patch,
+                content='Tested-by: Test User <test@example.com>\n'
+                'Acked-by: Test User <test2@example.com>\n')
+            self.patches.append(patch)
+
+        # emulate tags added after patches were received
+        models.PatchTag.objects.all().delete()
+        models.Patch.objects.update(tag_counts='')
+
+    def assertTagCounts(self, patch, acks, tests):  # noqa
+        patch = models.Patch.objects.get(id=patch.id)
+        ack = models.Tag.objects.get(name='Acked-by')
+        test = models.Tag.objects.get(name='Tested-by')
+
+        self.assertEqual(
+            (patch.get_tag_count(ack), patch.get_tag_count(test)),
+            (acks, tests))
+        self.assertEqual(
+            dict(patch.patchtag_set.values_list('tag__name', 'count')),
+            {name: count for name, count in (
+                ('Acked-by', acks), ('Tested-by', tests)) if count})
+
+    def test_retag(self):
+        events = models.Event.objects.count()
+
+        out = StringIO()
+        call_command('retag', jobs=2, stdout=out)
+
+        self.assertIn('done: updated 2 patches', out.getvalue())
+        for patch in self.patches:
+            self.assertTagCounts(patch, 2, 1)
+        self.assertEqual(models.Event.objects.count(), events)
+
+        # rebuilding counts is idempotent
+        call_command('retag', stdout=StringIO())
+        self.assertTagCounts(self.patches[0], 2, 1)
+
+    def test_retag_project(self):
+        call_command('retag', project=self.patches[1].project.linkname,
+                     stdout=StringIO())
+
+        self.assertTagCounts(self.patches[0], 0, 0)
+        self.assertTagCounts(self.patches[1], 2, 1)
+
+    def test_retag_no_tags(self):
+        project = self.patches[0].project
+        project.use_tags = False
+        project.save()
+
+        call_command('retag', stdout=StringIO())
+
+        self.assertTagCounts(self.patches[0], 0, 0)
+        self.assertTagCounts(self.patches[1], 2, 1)
+
+
+class DiffstatTest(TestCase):
+
+    def test_diffstat(self):
+        patches = utils.create_patches(
+            2, diff=utils.make_diff('drivers/net/a.c'))
+        # emulate patches received before diffstats were stored
+        models.Patch.objects.update(files_changed=None, insertions=None,
+                                    deletions=None)
+        models.PatchFile.objects.all().delete()
+
+        call_command('diffstat', patches[0].id, stdout=StringIO())
+
+        self.assertEqual(
+            list(models.Patch.objects.touching('drivers/net')),
+            [patches[0]])
+
+        call_command('diffstat', stdout=StringIO())
+
+        self.assertEqual(
+            list(models.Patch.objects.touching('drivers/net')), patches)
+        self.assertEqual(
+            list(models.Patch.objects.values_list(
+                'files_changed', 'insertions', 'deletions')),
+            [(1, 1, 0), (1, 1, 0)])
+        self.assertEqual(models.PatchFile.objects.count(), 2)
+
+    def test_diffstat_all(self):
+        patches = utils.create_patches(
+            2, diff=utils.make_diff('drivers/net/a.c'))
+        # emulate a patch whose diffstat is out of date
+        models.Patch.objects.filter(id=patches[0].id).update(
+            files_changed=0, insertions=0, deletions=0)
+
+        call_command('diffstat', project=patches[0].project.linkname,
+                     stdout=StringIO())
+
+        self.assertEqual(
+            models.Patch.objects.get(id=patches[0].id).files_changed, 0)
+
+        call_command('diffstat', all=True, stdout=StringIO())
+
+        self.assertEqual(
+            list(models.Patch.objects.values_list(
+                'files_changed', 'insertions', 'deletions')),
+            [(1, 1, 0), (1, 1, 0)])
@@ -8,6 +8,8 @@ from email import message_from_string
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import make_msgid
+import json
+import mailbox
 import os
 import sys
 import unittest
@@ -16,19 +18,39 @@ from django.test import TestCase
 from django.test import TransactionTestCase
 from django.db.transaction import atomic
 from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from patchwork.models import Cover
+from patchwork.models import CoverComment
+from patchwork.models import DelegationRule
+from patchwork.models import Event
 from patchwork.models import Patch
 from patchwork.models import PatchComment
 from patchwork.models import Person
+from patchwork.models import Series
+from patchwork.models import SeriesReference
 from patchwork.models import State
+from patchwork.models import Tag
+from patchwork.hasher import analyse_diff
+from patchwork.hasher import commit_requests
+from patchwork.hasher import DiffHasher
+from patchwork.hasher import hash_commits
+from patchwork.hasher import hash_diff
+from patchwork.hasher import split_commits
 from patchwork.parser import clean_subject
 from patchwork.parser import get_or_create_author
+from patchwork.parser import invalidate_delegation_matcher
+from patchwork.parser import invalidate_project_routes
 from patchwork.parser import find_patch_content as find_content
 from patchwork.parser import find_comment_content
+from patchwork.parser import find_delegate_by_filename
+from patchwork.parser import find_filenames
 from patchwork.parser import find_project
 from patchwork.parser import find_series
+from patchwork.parser import FilenameFinder
 from patchwork.parser import parse_mail as _parse_mail
+from patchwork.parser import parse_mails
+from patchwork.parser import parse_patch
 from patchwork.parser import parse_pull_request
 from patchwork.parser import parse_series_marker
 from patchwork.parser import parse_version
@@ -729,6 +751,192 @@ class PatchParseTest(PatchTest):
         self.assertFalse('<div' in message)
 
 
+class StreamPatchTest(TestCase):
+    """Test parsing of patches provided as lines."""
+
+    def setUp(self):
+        self.content = ('test comment\n\n' +
+                        read_patch('0001-add-line.patch') +
+                        '-- \n2.7.4\n')
+
+    def test_lines(self):
+        diff, message = parse_patch(self.content)
+
+        self.assertTrue(diff.startswith('diff --git a/meep.text'))
+        self.assertEqual(message, 'test comment\n\n-- \n2.7.4\n\n')
+
+        # lines from e.g. a file object include their trailing newline, but
+        # there's no empty line following the final newline
+        lines = self.content.splitlines(keepends=True)
+        self.assertEqual(parse_patch(iter(lines)), (diff, message[:-1]))
+
+    def test_consumers(self):
+        hasher = DiffHasher()
+        finder = FilenameFinder()
+
+        diff, _ = parse_patch(self.content, [hasher, finder])
+
+        self.assertEqual(hasher.hexdigest(), hash_diff(diff))
+        self.assertEqual(finder.filenames, find_filenames(diff))
+        self.assertEqual(finder.filenames, ['meep.text'])
+
+    def test_hash_whitespace(self):
+        """Validate that streamed lines are normalised like a diff."""
+        diff = ('\n  diff --git a/x b/x\n--- a/x\n+++ b/x\n'
+                '@@ -1,2 +1,2 @@\n-a\n+b\n \n \n\t\n')
+
+        hasher = DiffHasher()
+        # feed the lines in chunks of varying size
+        lines = diff.splitlines(keepends=True)
+        for i in range(0, len(lines), 3):
+            hasher.update(lines[i:i + 3])
+
+        self.assertEqual(hasher.hexdigest(), hash_diff(diff))
+        self.assertEqual(hash_diff(diff), hash_diff(diff.strip()))
+
+
+class HashCommitsTest(TestCase):
+    """Test hashing of commits from 'git log -p' output."""
+
+    diff_a = ('diff --git a/x b/x\nindex 1234567..89abcde 100644\n'
+              '--- a/x\n+++ b/x\n@@ -1,3 +1,3 @@\n a\n-b\n+c\n \n')
+    # removed/added lines that look like headers or a signature
+    diff_b = ('diff --git a/y b/y\n--- a/y\n+++ b/y\n@@ -1,2 +1,2 @@\n'
+              '--- a\n-- \n+++ b\n+-- \n')
+
+    def _commit(self, char):
+        return char * 40
+
+    def test_log(self):
+        log = ('commit %s\nAuthor: A U Thor <author@example.com>\n\n'
+               '    Change b to c\n\n    -a\n    +b\n\n%s'
+               'commit %s\nMerge: 1111111 2222222\n\n    Merge\n\n'
+               'commit %s\nAuthor: A U Thor <author@example.com>\n\n'
+               '    Mess with y\n\n%s') % (
+                   self._commit('a'), self.diff_a, self._commit('b'),
+                   self._commit('c'), self.diff_b)
+        lines = log.splitlines(keepends=True)
+
+        self.assertEqual(
+            [(commit, diff[0]) for commit, diff in split_commits(lines)],
+            [(self._commit('a'), '--- a/x\n'),
+             (self._commit('c'), '--- a/y\n')])
+        self.assertEqual(
+            list(hash_commits(lines)),
+            [(self._commit('a'), hash_diff(self.diff_a)),
+             (self._commit('c'), hash_diff(self.diff_b))])
+
+    def test_format_patch(self):
+        mbox = ''.join(
+            ('From %s Mon Sep 17 00:00:00 2001\nFrom: A U Thor '
+             '<author@example.com>\nSubject: [PATCH] Change\n\nChange\n'
+             '---\n x | 2 +-\n 1 file changed, 1 insertion(+), 1 '
+             'deletion(-)\n\n%s-- \n2.7.4\n\n') % (self._commit(c), diff)
+            for c, diff in (('a', self.diff_a), ('b', self.diff_b)))
+
+        self.assertEqual(
+            list(hash_commits(mbox.splitlines(keepends=True))),
+            [(self._commit('a'), hash_diff(self.diff_a)),
+             (self._commit('b'), hash_diff(self.diff_b))])
+
+    def test_jobs(self):
+        log = ''.join('commit %s\n\n    Change\n\n%s' % (
+            '%040x' % i, self.diff_a if i % 2 else self.diff_b)
+            for i in range(100))
+        lines = log.splitlines(keepends=True)
+
+        self.assertEqual(list(hash_commits(lines, jobs=2)),
+                         list(hash_commits(lines)))
+
+    def test_commit_requests(self):
+        commits = [(self._commit(c), hash_diff(self.diff_a)) for c in 'abc']
+
+        requests = [json.loads(body) for body in commit_requests(
+            commits, batch_size=2, state='under-"review"')]
+
+        self.assertEqual(
+            [[(commit['commit'], commit['hash'])
+              for commit in request['commits']] for request in requests],
+            [commits[:2], commits[2:]])
+        self.assertEqual([request['state'] for request in requests],
+                         ['under-"review"'] * 2)
+
+        # the state is only given if set
+        self.assertNotIn('state', json.loads(next(commit_requests(commits))))
+
+
+class AnalyseDiffTest(TestCase):
+    """Test analysis of diffs."""
+
+    def test_analyse(self):
+        diff = read_patch('0001-add-line.patch')
+
+        analyser = analyse_diff(diff)
+
+        self.assertEqual(analyser.hexdigest(), hash_diff(diff))
+        self.assertEqual(analyser.filenames, find_filenames(diff))
+        self.assertEqual(dict(analyser.files), {'meep.text': [1, 0]})
+        self.assertEqual(analyser.insertions, 1)
+        self.assertEqual(analyser.deletions, 0)
+
+    def test_header_like_lines(self):
+        """Validate that removed lines like '-- a' aren't headers."""
+        diff = ('--- a/x\n+++ b/x\n@@ -1,3 +1,2 @@\n a\n--- a\n-b\n'
+                '+++ b\n--- a/y\n+++ b/y\n@@ -1 +1 @@\n-c\n+d\n')
+
+        analyser = analyse_diff(diff)
+
+        self.assertEqual(analyser.hexdigest(), hash_diff(diff))
+        self.assertEqual(dict(analyser.files), {'x': [1, 2], 'y': [1, 1]})
+
+    def test_no_content_changes(self):
+        diff, _ = find_content(read_mail('0022-git-mode-change.mbox'))
+
+        analyser = analyse_diff(diff)
+
+        self.assertEqual(dict(analyser.files),
+                         {'scripts/kconfig/nconf-cfg.sh': [0, 0]})
+
+    def test_parse_mail(self):
+        project = create_project(listid='test.example.com')
+        email = create_email('test\n' + read_patch('0001-add-line.patch'),
+                             listid=project.listid)
+
+        patch = parse_mail(email)
+
+        patch = Patch.objects.get(id=patch.id)
+        self.assertEqual(patch.hash, hash_diff(patch.diff))
+        self.assertEqual(
+            (patch.files_changed, patch.insertions, patch.deletions),
+            (1, 1, 0))
+        self.assertEqual(
+            list(patch.files.values_list('path', 'insertions', 'deletions')),
+            [('meep.text', 1, 0)])
+
+    def test_save_existing(self):
+        """Validate that saving a patch lacking a diffstat doesn't add one."""
+        project = create_project(listid='test.example.com')
+        email = create_email('test\n' + read_patch('0001-add-line.patch'),
+                             listid=project.listid)
+        patch = parse_mail(email)
+        Patch.objects.filter(id=patch.id).update(
+            files_changed=None, insertions=None, deletions=None)
+
+        patch = Patch.objects.defer('diff').get(id=patch.id)
+        patch.state = create_state()
+        with CaptureQueriesContext(connection) as queries:
+            patch.save()
+
+        # neither the diff nor the files are loaded or changed
+        for query in queries:
+            self.assertNotIn('"diff"', query['sql'])
+            self.assertNotIn('patchwork_patchfile', query['sql'])
+
+        patch = Patch.objects.get(id=patch.id)
+        self.assertIsNone(patch.insertions)
+        self.assertEqual(1, patch.files.count())
+
+
 class EncodingParseTest(TestCase):
     """Test parsing of patches with different encoding issues."""
 
@@ -816,6 +1024,80 @@ class DelegateRequestTest(TestCase):
         self.assertDelegate(None)
 
 
+class DelegationRuleTest(TestCase):
+
+    def setUp(self):
+        self.project = create_project()
+        self.users = [create_user() for _ in range(3)]
+        # the rules are removed by rolling back the test's transaction,
+        # which doesn't invalidate the cache
+        self.addCleanup(invalidate_delegation_matcher, self.project.id)
+
+    def _create_rule(self, path, user, priority=0):
+        return DelegationRule.objects.create(
+            project=self.project, path=path, user=self.users[user],
+            priority=priority)
+
+    def _find_delegate(self, *filenames):
+        return find_delegate_by_filename(self.project, list(filenames))
+
+    def test_priority(self):
+        self._create_rule('drivers/*', 0)
+        self._create_rule('drivers/net/*', 1, priority=1)
+        self._create_rule('drivers/net/*.h', 2, priority=2)
+        self._create_rule('drivers/net/core.c', 0, priority=3)
+
+        self.assertEqual(self._find_delegate('drivers/a.c'), self.users[0])
+        self.assertEqual(self._find_delegate('drivers/net/a.c'),
+                         self.users[1])
+        self.assertEqual(self._find_delegate('drivers/net/a.h'),
+                         self.users[2])
+        self.assertEqual(self._find_delegate('drivers/net/core.c'),
+                         self.users[0])
+        self.assertIsNone(self._find_delegate('fs/a.c'))
+
+    def test_patterns(self):
+        # on some versions of Python, 'fnmatch' adds groups to the regexes
+        # of patterns with multiple wildcards, which mustn't affect the
+        # rules found for patterns after these
+        self._create_rule('*/net/*.c', 1, priority=2)
+        self._create_rule('*.h', 2, priority=1)
+        self._create_rule('drivers/*.[ch]', 0)
+
+        self.assertEqual(self._find_delegate('drivers/net/a.c'),
+                         self.users[1])
+        self.assertEqual(self._find_delegate('drivers/net/a.h'),
+                         self.users[2])
+        self.assertEqual(self._find_delegate('drivers/a.c'), self.users[0])
+        self.assertIsNone(self._find_delegate('fs/a.o'))
+
+    def test_multiple_files(self):
+        self._create_rule('drivers/*', 0)
+        self._create_rule('drivers/net/*', 1, priority=1)
+
+        self.assertEqual(self._find_delegate('drivers/a.c', 'drivers/b.c'),
+                         self.users[0])
+        # the files must all be delegated to the same user
+        self.assertIsNone(self._find_delegate('drivers/a.c',
+                                              'drivers/net/a.c'))
+        self.assertIsNone(self._find_delegate('drivers/a.c', 'fs/a.c'))
+
+    def test_cache(self):
+        rule = self._create_rule('drivers/*', 0)
+
+        self.assertEqual(self._find_delegate('drivers/a.c'), self.users[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(self._find_delegate('drivers/a.c'),
+                             self.users[0])
+
+        rule.user = self.users[1]
+        rule.save()
+        self.assertEqual(self._find_delegate('drivers/a.c'), self.users[1])
+
+        rule.delete()
+        self.assertIsNone(self._find_delegate('drivers/a.c'))
+
+
 class InitialPatchStateTest(TestCase):
 
     patch_filename = '0001-add-line.patch'
@@ -1057,6 +1339,38 @@ class SubjectMatchTest(TestCase):
                                self.keyword_project.listid)
         self.assertEqual(project, self.keyword_project)
 
+    def test_cached(self):
+        """Validate that projects are only loaded once."""
+        self.addCleanup(invalidate_project_routes)
+
+        self.email['Subject'] = '[PATCH keyword] subsystem'
+        find_project(self.email)
+
+        with self.assertNumQueries(0):
+            project = find_project(self.email)
+            self.assertEqual(project, self.keyword_project)
+
+            project = find_project(self.email_no_project)
+            self.assertIsNone(project)
+
+    def test_cache_invalidated(self):
+        """Validate that changes to projects are seen immediately."""
+        self.addCleanup(invalidate_project_routes)
+
+        project = find_project(self.email_no_project)
+        self.assertIsNone(project)
+
+        self.keyword_project.listid = 'nonexistent-project.test.org'
+        self.keyword_project.save()
+
+        project = find_project(self.email_no_project)
+        self.assertEqual(project, self.keyword_project)
+
+        self.keyword_project.delete()
+
+        project = find_project(self.email_no_project)
+        self.assertIsNone(project)
+
 
 class WeirdMailTest(TransactionTestCase):
     """Test fuzzed or otherwise weird patches."""
@@ -1167,3 +1481,206 @@ class DuplicateMailTest(TestCase):
         self._test_duplicate_mail(m)
 
         self.assertEqual(Cover.objects.count(), 1)
+
+
+class ParseMailsTest(TestCase):
+
+    fixtures = ['default_tags']
+
+    def setUp(self):
+        self.project = create_project(listid='test.example.com')
+        create_state()
+
+    def _read_mbox(self, name):
+        mbox = mailbox.mbox(os.path.join(
+            os.path.dirname(TEST_MAIL_DIR), 'series', name), create=False)
+        mails = list(mbox)
+        mbox.close()
+
+        return mails
+
+    def _parse_mails(self, mails, **kwargs):
+        return list(parse_mails(((mail, None) for mail in mails),
+                                self.project.listid, **kwargs))
+
+    def test_series(self):
+        results = self._parse_mails(self._read_mbox('base-cover-letter.mbox'))
+
+        self.assertEqual([type(obj) for obj, _ in results],
+                         [Cover, Patch, Patch])
+        self.assertEqual([exc for _, exc in results], [None, None, None])
+
+        for patch in Patch.objects.all():
+            self.assertEqual(patch.hash, hash_diff(patch.diff))
+            self.assertIsNotNone(patch.insertions)
+            self.assertEqual(patch.files.count(), patch.files_changed)
+
+        series = Series.objects.get()
+        self.assertEqual(series.name, 'A sample series')
+        self.assertEqual(series.cover_letter, results[0][0])
+        self.assertEqual(
+            list(series.patches.order_by('number').values_list('number')),
+            [(1,), (2,)])
+        self.assertTrue(series.received_all)
+
+        self.assertEqual(
+            Event.objects.filter(category=Event.CATEGORY_PATCH_COMPLETED,
+                                 series=series).count(), 2)
+        self.assertEqual(
+            Event.objects.filter(category=Event.CATEGORY_SERIES_COMPLETED,
+                                 series=series).count(), 1)
+
+    def test_series_across_batches(self):
+        mails = self._read_mbox('base-out-of-order.mbox')
+
+        self._parse_mails(mails, batch_size=1)
+
+        series = Series.objects.get()
+        self.assertIsNotNone(series.cover_letter)
+        self.assertEqual(series.patches.count(), 2)
+
+    def test_duplicates(self):
+        mails = self._read_mbox('base-cover-letter.mbox')
+
+        self._parse_mails(mails)
+        results = self._parse_mails(mails)
+
+        self.assertEqual([obj for obj, _ in results], [None, None, None])
+        for _, exc in results:
+            self.assertIsInstance(exc, DuplicateMailError)
+
+        self.assertEqual(Series.objects.count(), 1)
+        self.assertEqual(Patch.objects.count(), 2)
+
+    def test_comment_tags(self):
+        diff = read_patch('0001-add-line.patch')
+        email = create_email('Acked-by: Test User <test@example.com>\n' +
+                             diff, listid=self.project.listid)
+        email2 = create_email('Acked-by: Test User <test@example.com>\n',
+                              in_reply_to=email['Message-Id'])
+        email3 = create_email('Tested-by: Test User <test@example.com>\n',
+                              in_reply_to=email2['Message-Id'])
+
+        results = self._parse_mails([email, email2], batch_size=2)
+        results += self._parse_mails([email3])
+
+        patch = Patch.objects.get()
+        self.assertEqual([obj.patch for obj, _ in results[1:]],
+                         [patch, patch])
+        self.assertEqual(patch.patchtag_set.get(tag__name='Acked-by').count,
+                         2)
+        self.assertEqual(patch.patchtag_set.get(tag__name='Tested-by').count,
+                         1)
+        self.assertEqual(
+            patch.get_tag_count(Tag.objects.get(name='Acked-by')), 2)
+        self.assertEqual(
+            patch.get_tag_count(Tag.objects.get(name='Tested-by')), 1)
+
+    def test_invalid_mail(self):
+        email = create_email('test')
+        del email['From']
+
+        results = self._parse_mails([email])
+
+        self.assertIsNone(results[0][0])
+        self.assertIsInstance(results[0][1], ValueError)
+
+    def _get_rows(self):
+        """Return the rows and events created, using message IDs as keys."""
+        series_ids = {pk: i for i, pk in enumerate(
+            Series.objects.order_by('id').values_list('id', flat=True))}
+
+        def series(pk):
+            return series_ids.get(pk)
+
+        rows = {
+            'persons': sorted(Person.objects.values_list('name', 'email')),
+            'series': [
+                (obj.name, obj.version, obj.total, obj.submitter.email,
+                 obj.cover_letter.msgid if obj.cover_letter else None)
+                for obj in Series.objects.order_by('id')],
+            'references': sorted(
+                (msgid, series(pk)) for msgid, pk in
+                SeriesReference.objects.values_list('msgid', 'series')),
+            'covers': sorted(Cover.objects.values_list(
+                'msgid', 'name', 'submitter__email', 'content')),
+            'cover_comments': sorted(CoverComment.objects.values_list(
+                'msgid', 'cover__msgid', 'submitter__email', 'content')),
+            'patches': sorted(
+                (msgid, series(pk), *values) for msgid, pk, *values in
+                Patch.objects.values_list(
+                    'msgid', 'series', 'number', 'name', 'submitter__email',
+                    'state__name', 'hash', 'content', 'tag_counts')),
+            'patch_comments': sorted(PatchComment.objects.values_list(
+                'msgid', 'patch__msgid', 'submitter__email', 'content')),
+        }
+        events = [
+            (event.category,
+             event.patch.msgid if event.patch else None,
+             event.cover.msgid if event.cover else None,
+             series(event.series_id))
+            for event in Event.objects.order_by('id')]
+
+        return rows, events
+
+    def test_serial(self):
+        mails = []
+        for name in ('base-cover-letter.mbox', 'base-out-of-order.mbox',
+                     'revision-threaded-to-cover.mbox',
+                     'bugs-multiple-references.mbox'):
+            mails += self._read_mbox(name)
+
+        mails.append(create_email('Acked-by: Test User <test@example.com>\n',
+                                  in_reply_to=mails[1]['Message-Id']))
+        mails.append(create_email('A comment\n',
+                                  in_reply_to=mails[0]['Message-Id']))
+        mails += mails[:2]  # duplicates
+
+        errors = []
+        for mail in mails:
+            try:
+                _parse_mail(mail, self.project.listid)
+            except Exception as exc:
+                errors.append(type(exc))
+            else:
+                errors.append(None)
+
+        serial_rows, serial_events = self._get_rows()
+
+        Event.objects.all().delete()
+        Series.objects.all().delete()
+        Cover.objects.all().delete()
+        Patch.objects.all().delete()
+        Person.objects.all().delete()
+
+        results = self._parse_mails(mails)
+
+        bulk_rows, bulk_events = self._get_rows()
+
+        self.assertEqual([type(exc) if exc else None for _, exc in results],
+                         errors)
+        self.assertEqual(bulk_rows, serial_rows)
+        self.assertEqual(bulk_events, serial_events)
+        self.assertEqual(serial_events[:4], [
+            (Event.CATEGORY_SERIES_CREATED, None, None, 0),
+            (Event.CATEGORY_COVER_CREATED, None, mails[0]['Message-Id'], None),
+            (Event.CATEGORY_PATCH_CREATED, mails[1]['Message-Id'], None,
+             None),
+            (Event.CATEGORY_PATCH_COMPLETED, mails[1]['Message-Id'], None, 0),
+        ])
+
+    def test_queries(self):
+        mails = self._read_mbox('base-cover-letter.mbox')
+
+        with CaptureQueriesContext(connection) as bulk_queries:
+            self._parse_mails(mails)
+
+        Series.objects.all().delete()
+        Cover.objects.all().delete()
+        Patch.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as serial_queries:
+            for mail in mails:
+                _parse_mail(mail, self.project.listid)
+
+        self.assertLess(len(bulk_queries) * 2, len(serial_queries))
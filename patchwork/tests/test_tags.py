@@ -3,14 +3,19 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from django.db import connection
 from django.test import TestCase
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
+from patchwork import models
+from patchwork.models import get_tag_extractor
 from patchwork.models import Patch
 from patchwork.models import PatchTag
 from patchwork.models import Tag
 from patchwork.tests.utils import create_patch
 from patchwork.tests.utils import create_patch_comment
+from patchwork.tests.utils import create_person
 
 
 class ExtractTagsTest(TestCase):
@@ -65,6 +70,48 @@ class ExtractTagsTest(TestCase):
     def test_ack_in_reply(self):
         self.assertTagsEqual('> Acked-by: %s\n' % self.name_email, 0, 0, 0)
 
+    def test_pattern(self):
+        """Validate tags that aren't simple prefixes."""
+        nack = Tag.objects.create(name='Nacked-by', abbrev='N',
+                                  pattern=r'^(Nacked|NAK)-by:')
+        content = 'Nacked-by: %s\nNAK-by: %s\nAcked-by: %s\n' % (
+            (self.name_email,) * 3)
+
+        counts = Patch.extract_tags(content, Tag.objects.all())
+
+        self.assertEqual(counts[nack], 2)
+        self.assertEqual(counts[Tag.objects.get(name='Acked-by')], 1)
+
+    def test_overlapping_prefixes(self):
+        """Validate tags whose prefixes are the start of others."""
+        ack = Tag.objects.create(name='Acked', abbrev='a',
+                                 pattern='^Acked')
+        content = 'Acked-by: %s\nAcked\n' % self.name_email
+
+        counts = Patch.extract_tags(content, Tag.objects.all())
+
+        self.assertEqual(counts[ack], 2)
+        self.assertEqual(counts[Tag.objects.get(name='Acked-by')], 1)
+
+    def test_extractor_cached(self):
+        tags = list(Tag.objects.all())
+
+        self.assertIs(get_tag_extractor(tags), get_tag_extractor(tags))
+
+    def test_extractor_invalidated(self):
+        tag = Tag.objects.get(name='Acked-by')
+        content = 'Acked-by: %s\nAcked-off-by: %s\n' % (
+            (self.name_email,) * 2)
+        self.assertEqual(Patch.extract_tags(content, [tag])[tag], 1)
+
+        tag.pattern = '^Acked-'
+        tag.save()
+
+        self.assertEqual(
+            Patch.extract_tags(content, list(Tag.objects.all()))[tag], 2)
+        # there's no need to keep extractors for tags that have changed
+        self.assertEqual(len(models._tag_extractors), 1)
+
 
 class PatchTagsTest(TransactionTestCase):
 
@@ -140,6 +187,37 @@ class PatchTagsTest(TransactionTestCase):
         self.create_tag_comment(self.patch, self.ACK)
         self.assertTagsEqual(self.patch, 2, 0, 0)
 
+    def test_comment_add_incremental(self):
+        """Validate that a new comment's tags are added to the counts."""
+        # a count that a rescan of the patch and comments wouldn't produce
+        PatchTag.objects.create(patch=self.patch, count=5,
+                                tag=Tag.objects.get(name='Acked-by'))
+
+        self.create_tag_comment(self.patch, self.ACK)
+        self.assertTagsEqual(self.patch, 6, 0, 0)
+
+    def test_comment_add_no_rescan(self):
+        submitter = create_person()
+        for _ in range(10):
+            self.create_tag_comment(self.patch, self.ACK)
+
+        def queries(content):
+            with CaptureQueriesContext(connection) as context:
+                create_patch_comment(patch=self.patch, submitter=submitter,
+                                     content=content)
+            return [query['sql'] for query in context.captured_queries]
+
+        # the existing comments aren't rescanned
+        self.assertFalse([query for query in queries(self.create_tag(self.ACK))
+                          if query.startswith('SELECT') and
+                          'patchwork_patchcomment' in query])
+
+        # and nothing is updated if there are no tags
+        self.assertFalse([query for query in queries('No tags')
+                          if 'patchwork_patchtag' in query])
+
+        self.assertTagsEqual(self.patch, 11, 0, 0)
+
     def test_comment_update(self):
         comment = self.create_tag_comment(self.patch, self.ACK)
         self.assertTagsEqual(self.patch, 1, 0, 0)
@@ -170,9 +248,7 @@ class PatchTagsTest(TransactionTestCase):
 class PatchTagManagerTest(PatchTagsTest):
 
     def assertTagsEqual(self, patch, acks, reviews, tests):  # noqa
-        tagattrs = {}
-        for tag in Tag.objects.all():
-            tagattrs[tag.name] = tag.attr_name
+        tags = {tag.name: tag for tag in Tag.objects.all()}
 
         # force project.tags to be queried outside of the assertNumQueries
         patch.project.tags
@@ -185,9 +261,9 @@ class PatchTagManagerTest(PatchTagsTest):
                 .get(pk=patch.pk)
 
             counts = (
-                getattr(patch, tagattrs['Acked-by']),
-                getattr(patch, tagattrs['Reviewed-by']),
-                getattr(patch, tagattrs['Tested-by']),
+                patch.get_tag_count(tags['Acked-by']),
+                patch.get_tag_count(tags['Reviewed-by']),
+                patch.get_tag_count(tags['Tested-by']),
             )
 
         self.assertEqual(counts, (acks, reviews, tests))
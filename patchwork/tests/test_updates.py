@@ -3,9 +3,13 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from unittest import mock
+
 from django.test import TestCase
 from django.urls import reverse
 
+from patchwork.forms import MultiplePatchForm
+from patchwork.models import Event
 from patchwork.models import Patch
 from patchwork.models import State
 from patchwork.tests.utils import create_patches
@@ -69,6 +73,31 @@ class MultipleUpdateTest(TestCase):
         for patch in [Patch.objects.get(pk=p.pk) for p in self.patches]:
             self.assertFalse(patch.archived)
 
+    def test_state_change_error(self):
+        """Patches updated before an error are still saved."""
+        state = create_state()
+        data = self.base_data.copy()
+        data.update({'state': str(state.id)})
+        self._select_all_patches(data)
+        save = MultiplePatchForm.save
+
+        def _save(form, patch):
+            if patch == self.patches[-1]:
+                raise ValueError()
+            return save(form, patch)
+
+        with mock.patch.object(MultiplePatchForm, 'save', autospec=True,
+                               side_effect=_save):
+            with self.assertRaises(ValueError):
+                self.client.post(self.url, data)
+
+        updated = Patch.objects.filter(state=state)
+        self.assertEqual(self.patches[:-1], list(updated.order_by('id')))
+        events = Event.objects.filter(
+            category=Event.CATEGORY_PATCH_STATE_CHANGED)
+        self.assertEqual(self.patches[:-1],
+                         [event.patch for event in events.order_by('id')])
+
     def _test_state_change(self, state):
         data = self.base_data.copy()
         data.update({'state': str(state)})
@@ -0,0 +1,268 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import datetime
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import json
+import threading
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+
+from patchwork.models import Event
+from patchwork.models import Webhook
+from patchwork import webhooks
+from patchwork.tests.utils import create_check
+from patchwork.tests.utils import create_patch
+from patchwork.tests.utils import create_project
+from patchwork.tests.utils import create_series
+from patchwork.tests.utils import create_webhook
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, self.headers, body))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+# events are only delivered once settled, so we settle them immediately
+@override_settings(EVENT_VISIBILITY_LAG=0)
+class WebhookTest(TestCase):
+
+    def setUp(self):
+        # a local stand-in for the endpoints webhooks are delivered to
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.requests = []
+        self.server.status = 200
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.project = create_project()
+
+    def _create_webhook(self, path='/webhook', **kwargs):
+        return create_webhook(
+            project=self.project,
+            url='http://127.0.0.1:%d%s' % (self.server.server_port, path),
+            **kwargs)
+
+    def _create_events(self, project=None):
+        # series-created, patch-created, patch-completed, series-completed,
+        # check-created
+        series = create_series(project=project or self.project)
+        patch = create_patch(series=series, project=series.project)
+        create_check(patch=patch)
+
+    def _get_events(self, request):
+        return [event['id'] for event in json.loads(request[2])]
+
+    def test_deliver(self):
+        """Deliver events created after the webhook."""
+        self._create_events()
+        webhook = self._create_webhook()
+        self._create_events()
+        self._create_events(project=create_project())
+
+        self.assertEqual(1, webhooks.deliver_webhooks())
+
+        events = Event.objects.filter(
+            project=self.project, id__gt=Event.objects.filter(
+                category='check-created').order_by('id')[0].id)
+        self.assertEqual(1, len(self.server.requests))
+        path, headers, _ = self.server.requests[0]
+        self.assertEqual('/webhook', path)
+        self.assertEqual('application/json', headers['Content-Type'])
+        self.assertNotIn('X-Patchwork-Signature', headers)
+        self.assertEqual(
+            sorted(events.values_list('id', flat=True)),
+            self._get_events(self.server.requests[0]))
+
+        webhook.refresh_from_db()
+        self.assertEqual(events.order_by('-id')[0].id, webhook.last_event_id)
+        delivery = webhook.deliveries.get()
+        self.assertTrue(delivery.success)
+        self.assertEqual(200, delivery.status)
+        self.assertEqual(5, delivery.event_count)
+
+        # events are only delivered once
+        self.assertEqual(0, webhooks.deliver_webhooks())
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_deliver_representation(self):
+        """Deliver events as represented by the REST API."""
+        self._create_webhook()
+        self._create_events()
+
+        webhooks.deliver_webhooks()
+
+        event = json.loads(self.server.requests[0][2])[0]
+        self.assertEqual('series-created', event['category'])
+        self.assertEqual(
+            'http://example.com/api/1.3/projects/%d/' % self.project.id,
+            event['project']['url'])
+
+    @override_settings(EVENT_VISIBILITY_LAG=60)
+    def test_deliver_unsettled(self):
+        """Deliver events only once they're settled."""
+        self._create_webhook()
+        self._create_events()
+
+        # the events are too recent to be sure that no events with lower
+        # IDs are yet to become visible
+        self.assertEqual(0, webhooks.deliver_webhooks())
+
+        Event.objects.update(date=datetime.datetime.utcnow() -
+                             datetime.timedelta(minutes=2))
+
+        self.assertEqual(1, webhooks.deliver_webhooks())
+        self.assertEqual(
+            list(Event.objects.order_by('id').values_list('id', flat=True)),
+            self._get_events(self.server.requests[0]))
+
+    def test_deliver_categories(self):
+        """Deliver events of the given categories."""
+        self._create_webhook(categories='patch-created, check-created')
+        self._create_events()
+
+        webhooks.deliver_webhooks()
+
+        self.assertEqual(
+            list(Event.objects.filter(
+                category__in=['patch-created', 'check-created']).order_by(
+                    'id').values_list('id', flat=True)),
+            self._get_events(self.server.requests[0]))
+
+    def test_deliver_batches(self):
+        """Deliver events in batches."""
+        self._create_webhook()
+        for _ in range(3):
+            self._create_events()
+
+        batch_size = webhooks.BATCH_SIZE
+        webhooks.BATCH_SIZE = 6
+        try:
+            self.assertEqual(3, webhooks.deliver_webhooks())
+        finally:
+            webhooks.BATCH_SIZE = batch_size
+
+        self.assertEqual(
+            [6, 6, 3],
+            [len(self._get_events(x)) for x in self.server.requests])
+        self.assertEqual(
+            list(Event.objects.order_by('id').values_list('id', flat=True)),
+            sum([self._get_events(x) for x in self.server.requests], []))
+
+    def test_deliver_signature(self):
+        """Sign deliveries if a secret is given."""
+        self._create_webhook(secret='secret')
+        self._create_events()
+
+        webhooks.deliver_webhooks()
+
+        _, headers, body = self.server.requests[0]
+        self.assertEqual(
+            'sha256=%s' % hmac.new(
+                b'secret', body, hashlib.sha256).hexdigest(),
+            headers['X-Patchwork-Signature'])
+
+    def test_deliver_failure(self):
+        """Retry failed deliveries with backoff."""
+        webhook = self._create_webhook()
+        self._create_events()
+        self.server.status = 500
+
+        with self.assertLogs('patchwork.webhooks', 'WARNING'):
+            self.assertEqual(1, webhooks.deliver_webhooks())
+
+        webhook.refresh_from_db()
+        self.assertEqual(0, webhook.last_event_id)
+        self.assertEqual(1, webhook.failures)
+        delivery = webhook.deliveries.get()
+        self.assertFalse(delivery.success)
+        self.assertEqual(500, delivery.status)
+        self.assertEqual(
+            delivery.date + datetime.timedelta(seconds=webhooks.RETRY_DELAY),
+            webhook.next_attempt)
+
+        # we don't retry until the delay has passed...
+        self.assertEqual(0, webhooks.deliver_webhooks())
+
+        # ...and the delay doubles with each failure
+        webhook.next_attempt = datetime.datetime.utcnow()
+        webhook.save()
+        with self.assertLogs('patchwork.webhooks', 'WARNING'):
+            self.assertEqual(1, webhooks.deliver_webhooks())
+
+        webhook.refresh_from_db()
+        self.assertEqual(2, webhook.failures)
+        delivery = webhook.deliveries.order_by('-id')[0]
+        self.assertEqual(
+            delivery.date + datetime.timedelta(
+                seconds=webhooks.RETRY_DELAY * 2),
+            webhook.next_attempt)
+
+        # the same events are delivered once the endpoint recovers
+        self.server.status = 204
+        webhook.next_attempt = datetime.datetime.utcnow()
+        webhook.save()
+        self.assertEqual(1, webhooks.deliver_webhooks())
+
+        webhook.refresh_from_db()
+        self.assertEqual(0, webhook.failures)
+        self.assertIsNone(webhook.next_attempt)
+        self.assertEqual(
+            self._get_events(self.server.requests[0]),
+            self._get_events(self.server.requests[2]))
+
+    def test_deliver_unreachable(self):
+        """Retry deliveries to unreachable endpoints."""
+        webhook = create_webhook(
+            project=self.project, url='http://127.0.0.1:1/webhook')
+        self._create_events()
+
+        with self.assertLogs('patchwork.webhooks', 'WARNING'):
+            self.assertEqual(1, webhooks.deliver_webhooks())
+
+        webhook.refresh_from_db()
+        self.assertEqual(1, webhook.failures)
+        delivery = webhook.deliveries.get()
+        self.assertFalse(delivery.success)
+        self.assertIsNone(delivery.status)
+        self.assertTrue(delivery.error)
+
+    def test_deliver_inactive(self):
+        """Don't deliver events to inactive webhooks."""
+        self._create_webhook(active=False)
+        self._create_events()
+
+        self.assertEqual(0, webhooks.deliver_webhooks())
+        self.assertEqual([], self.server.requests)
+
+    def test_invalid_categories(self):
+        webhook = Webhook(project=self.project, url='http://example.com/',
+                          categories='patch-created,foo')
+        with self.assertRaises(ValidationError):
+            webhook.full_clean()
+
+    def test_worker(self):
+        self._create_webhook()
+        self._create_events()
+
+        call_command('webhookworker', '--once')
+
+        self.assertEqual(1, len(self.server.requests))
@@ -36,7 +36,7 @@ class XMLRPCGenericTest(XMLRPCTest):
 
     def test_pw_rpc_version(self):
         # If you update the RPC version, update the tests!
-        self.assertEqual(self.rpc.pw_rpc_version(), [1, 3, 0])
+        self.assertEqual(self.rpc.pw_rpc_version(), [1, 5, 0])
 
     def test_get_redirect(self):
         response = self.client.patch(self.url)
@@ -80,6 +80,28 @@ class XMLRPCAuthenticatedTest(LiveServerTestCase):
         result = self.rpc.patch_get(patch.id)
         self.assertTrue(result['archived'])
 
+    def test_patch_set_commits(self):
+        state = utils.create_state(name='Accepted', slug='accepted')
+        patch_a = utils.create_patch(project=self.project,
+                                     diff=utils.make_diff('a.c'))
+        patch_b = utils.create_patch(diff=utils.make_diff('b.c'))
+
+        result = self.rpc.patch_set_commits(self.project.id, [
+            ['abc123', patch_a.hash],
+            ['def456', patch_b.hash],
+        ])
+
+        self.assertEqual(result, [
+            {'commit': 'abc123', 'hash': patch_a.hash,
+             'patches': [patch_a.id]},
+            # patches in other projects are ignored
+            {'commit': 'def456', 'hash': patch_b.hash, 'patches': []},
+        ])
+
+        result = self.rpc.patch_get(patch_a.id)
+        self.assertEqual(result['commit_ref'], 'abc123')
+        self.assertEqual(result['state_id'], state.id)
+
 
 class XMLRPCModelTestMixin(object):
 
@@ -189,6 +211,17 @@ class XMLRPCPatchTest(XMLRPCTest, XMLRPCFilterModelTestMixin):
         result = self.rpc.patch_get_by_hash(patch.hash)
         self.assertEqual(result['id'], patch.id)
 
+    def test_patch_list_path(self):
+        patch = self.create_single(diff=utils.make_diff('net/core.c'))
+        self.create_single(diff=utils.make_diff('net.c'))
+
+        result = self.list_endpoint({'path': 'net/'})
+        self.assertEqual([x['id'] for x in result], [patch.id])
+
+        # lookup types aren't supported
+        result = self.list_endpoint({'path__icontains': 'net'})
+        self.assertEqual(result, [])
+
 
 class XMLRPCPersonTest(XMLRPCTest, XMLRPCModelTestMixin):
 
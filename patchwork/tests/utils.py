@@ -23,6 +23,7 @@ from patchwork.models import Project
 from patchwork.models import Series
 from patchwork.models import SeriesReference
 from patchwork.models import State
+from patchwork.models import Webhook
 from patchwork.tests import TEST_PATCH_DIR
 
 SAMPLE_DIFF = """--- /dev/null\t2011-01-01 00:00:00.000000000 +0800
@@ -33,6 +34,12 @@ SAMPLE_DIFF = """--- /dev/null\t2011-01-01 00:00:00.000000000 +0800
 SAMPLE_CONTENT = 'Hello, world.'
 
 
+def make_diff(path):
+    """Make a diff adding a line to the given file."""
+    return ('diff --git a/{0} b/{0}\n--- a/{0}\n+++ b/{0}\n'
+            '@@ -1 +1,2 @@\n a\n+b\n').format(path)
+
+
 def read_patch(filename, encoding=None):
     """Read a diff from a file."""
     file_path = os.path.join(TEST_PATCH_DIR, filename)
@@ -293,6 +300,17 @@ def create_series(**kwargs):
     return Series.objects.create(**values)
 
 
+def create_webhook(**kwargs):
+    """Create 'Webhook' object."""
+    values = {
+        'project': create_project() if 'project' not in kwargs else None,
+        'url': 'http://example.com/webhook',
+    }
+    values.update(**kwargs)
+
+    return Webhook.objects.create(**values)
+
+
 def create_series_reference(**kwargs):
     """Create 'SeriesReference' object."""
     project = kwargs.pop('project', create_project())
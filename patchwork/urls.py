@@ -256,9 +256,28 @@ if settings.ENABLE_REST_API:
             name='api-cover-comment-list'),
     ]
 
+    api_1_3_patterns = [
+        url(r'^checks/$',
+            api_check_views.CheckBulkCreate.as_view(),
+            name='api-check-bulk-create'),
+        url(r'^events/stream/$',
+            api_event_views.EventStream.as_view(),
+            name='api-event-stream'),
+        url(r'^projects/(?P<pk>[^/]+)/commits/$',
+            api_project_views.ProjectCommits.as_view(),
+            name='api-project-commits'),
+        url(r'^series/(?P<pk>[^/]+)/checks/$',
+            api_series_views.SeriesChecks.as_view(),
+            name='api-series-checks'),
+    ]
+
     urlpatterns += [
-        url(r'^api/(?:(?P<version>(1.0|1.1|1.2))/)?', include(api_patterns)),
-        url(r'^api/(?:(?P<version>(1.1|1.2))/)?', include(api_1_1_patterns)),
+        url(r'^api/(?:(?P<version>(1.0|1.1|1.2|1.3))/)?',
+            include(api_patterns)),
+        url(r'^api/(?:(?P<version>(1.1|1.2|1.3))/)?',
+            include(api_1_1_patterns)),
+        url(r'^api/(?:(?P<version>(1.3))/)?',
+            include(api_1_3_patterns)),
 
         # token change
         url(r'^user/generate-token/$', user_views.generate_token,
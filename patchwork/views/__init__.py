@@ -4,16 +4,16 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
 
 from patchwork.filters import Filters
 from patchwork.forms import MultiplePatchForm
 from patchwork.models import Bundle
 from patchwork.models import BundlePatch
+from patchwork.models import defer_events
 from patchwork.models import Patch
 from patchwork.models import Project
-from patchwork.models import Check
 from patchwork.paginator import Paginator
 
 
@@ -276,12 +276,9 @@ def generic_list(request, project, view, view_args=None, filter_settings=None,
                                      'series')
 
     patches = patches.only('state', 'submitter', 'delegate', 'project',
-                           'series__name', 'name', 'date', 'msgid')
-
-    # we also need checks and series
-    patches = patches.prefetch_related(
-        Prefetch('check_set', queryset=Check.objects.only(
-            'context', 'user_id', 'patch_id', 'state', 'date')))
+                           'series__name', 'name', 'date', 'msgid',
+                           'files_changed', 'insertions', 'deletions',
+                           'tag_counts', 'check_counts')
 
     paginator = Paginator(request, patches)
 
@@ -306,14 +303,27 @@ def process_multiplepatch_form(request, form, action, patches, context):
         return errors
 
     changed_patches = 0
-    for patch in patches:
-        if not patch.is_editable(request.user):
-            errors.append("You don't have permissions to edit patch '%s'"
-                          % patch.name)
-            continue
+    error = None
+    with defer_events():
+        for patch in patches:
+            if not patch.is_editable(request.user):
+                errors.append("You don't have permissions to edit patch '%s'"
+                              % patch.name)
+                continue
+
+            # save each patch in its own savepoint so that, if one fails, the
+            # patches already updated are still saved, along with their events
+            try:
+                with transaction.atomic():
+                    form.save(patch)
+            except Exception as exc:
+                error = exc
+                break
+
+            changed_patches += 1
 
-        changed_patches += 1
-        form.save(patch)
+    if error is not None:
+        raise error
 
     if changed_patches == 1:
         messages.success(request, '1 patch updated')
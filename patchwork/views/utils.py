@@ -63,11 +63,13 @@ def _submission_to_mbox(submission):
 
     # TODO(stephenfin): Make this use the tags infrastructure
     if is_patch:
-        for comment in PatchComment.objects.filter(patch=submission):
-            body += comment.patch_responses
+        comments = PatchComment.objects.filter(patch=submission)
     else:
-        for comment in CoverComment.objects.filter(cover=submission):
-            body += comment.patch_responses
+        comments = CoverComment.objects.filter(cover=submission)
+
+    # only the content is needed to find responses
+    for comment in comments.only('content'):
+        body += comment.patch_responses
 
     if postscript:
         body += '---\n' + postscript + '\n'
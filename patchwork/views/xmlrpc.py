@@ -309,10 +309,11 @@ def check_to_dict(obj):
 
 def patch_check_to_dict(obj):
     """Return a combined patch check."""
+    checks = obj.checks
     return {
         'state': obj.combined_check_state,
-        'total': len(obj.checks),
-        'checks': [check_to_dict(check) for check in obj.checks]
+        'total': len(checks),
+        'checks': [check_to_dict(check) for check in checks]
     }
 
 
@@ -346,11 +347,13 @@ def pw_rpc_version():
         1.1.0: ???
         1.2.0: ???
         1.3.0: Add support for negative indexing of Checks
+        1.4.0: Add support for filtering patches by path
+        1.5.0: Add 'patch_set_commits'
 
     Returns:
         Version of the API.
     """
-    return (1, 3, 0)
+    return (1, 5, 0)
 
 
 @xmlrpc_method()
@@ -462,6 +465,12 @@ def patch_list(filt=None):
      * hash
      * msgid
 
+    It is also possible to filter patches by the files they change via
+    a ``path`` filter. This takes a file or directory path, optionally
+    with a trailing ``*``, and does not support lookup types.
+
+     * path
+
     It is also possible to specify the number of patches returned via
     a ``max_count`` filter.
 
@@ -527,11 +536,13 @@ def patch_list(filt=None):
         'commit_ref',
         'hash',
         'msgid',
+        'path',
         'max_count',
     ]
 
     dfilter = {}
     max_count = 0
+    path = None
 
     for key in filt:
         parts = key.split('__')
@@ -553,6 +564,11 @@ def patch_list(filt=None):
                 dfilter['state'] = State.objects.get(id=filt[key])
             elif parts[0] == 'max_count':
                 max_count = filt[key]
+            elif parts[0] == 'path':
+                if len(parts) > 1:
+                    # Lookup types aren't supported for paths
+                    return []
+                path = filt[key]
             else:
                 dfilter[key] = filt[key]
         except (Project.DoesNotExist, Person.DoesNotExist, State.DoesNotExist):
@@ -560,6 +576,8 @@ def patch_list(filt=None):
             return []
 
     patches = Patch.objects.filter(**dfilter)
+    if path is not None:
+        patches = patches.touching(path)
 
     # Only extract the relevant fields. This saves a big db load as we
     # no longer fetch content/headers/etc for potentially every patch
@@ -728,6 +746,52 @@ def patch_set(user, patch_id, params):
     return True
 
 
+@xmlrpc_method(login_required=True)
+def patch_set_commits(user, project_id, commits, state_id=None):
+    """Mark the patches matching a list of commits as committed.
+
+    Patches are matched using the hash of each commit's diff, as
+    generated by ``hasher.py``. Matching patches have their commit
+    reference and state set, all in a single transaction.
+
+    **NOTE:** Authentication is required for this method.
+
+    Args:
+        user (User): The user making the request. This will be
+            populated from HTTP Basic Auth.
+        project_id (int): The ID of the project the patches belong to.
+        commits (list): A list of ``[commit, hash]`` pairs.
+        state_id (int): The ID of the state to set on matching patches.
+            If not supplied, the 'Accepted' state is used.
+
+    Returns:
+        A list of dicts, one for each commit in the order given, with
+        the commit, the hash and the IDs of the patches it matched.
+
+    Raises:
+        Exception: User did not have necessary permissions to edit this
+            project
+        Project.DoesNotExist: The project did not exist.
+        State.DoesNotExist: The state did not exist.
+    """
+    project = Project.objects.get(id=project_id)
+
+    if not project.is_editable(user):
+        raise Exception('No permissions to edit this project')
+
+    if state_id is None:
+        state = State.objects.get(slug='accepted')
+    else:
+        state = State.objects.get(id=state_id)
+
+    results = project.patch_set.set_commits(
+        [(commit, hash) for commit, hash in commits], state, user)
+
+    return [{'commit': commit, 'hash': hash,
+             'patches': [patch.id for patch in patches]}
+            for commit, hash, patches in results]
+
+
 @xmlrpc_method()
 def state_list(search_str=None, max_count=0):
     """List states matching a given name filter.
@@ -0,0 +1,169 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2026 Patchwork Developers
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import datetime
+import hashlib
+import hmac
+import logging
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.db.models import Q
+from django.http import HttpRequest
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.versioning import URLPathVersioning
+
+from patchwork.api.event import EventSerializer
+from patchwork.api.event import load_events
+from patchwork.models import Event
+from patchwork.models import Webhook
+from patchwork.models import WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+# The version of the REST API used to represent events
+API_VERSION = '1.3'
+
+# The maximum number of events delivered at once
+BATCH_SIZE = 100
+
+# How many seconds to wait for a response?
+TIMEOUT = 10
+
+# How many seconds to wait before retrying a failed delivery? This doubles
+# with each consecutive failure, up to the maximum.
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 6 * 60 * 60
+
+
+class _SiteRequest(HttpRequest):
+    """A request of the current site, used to build absolute URLs."""
+
+    def __init__(self, site):
+        super(_SiteRequest, self).__init__()
+        self.site = site
+
+    def get_host(self):
+        return self.site.domain
+
+    def _get_scheme(self):
+        return 'https' if settings.FORCE_HTTPS_LINKS else 'http'
+
+
+def _get_serializer_context():
+    request = Request(_SiteRequest(Site.objects.get_current()))
+    request.version = API_VERSION
+    request.versioning_scheme = URLPathVersioning()
+    return {'request': request}
+
+
+def _get_retry_delay(failures):
+    delay = RETRY_DELAY * 2 ** min(failures - 1, 16)
+    return datetime.timedelta(seconds=min(delay, MAX_RETRY_DELAY))
+
+
+def _post(webhook, events, context):
+    """Post events to a webhook.
+
+    Returns the HTTP status of the response, if any, and an error message,
+    if the delivery failed.
+    """
+    data = JSONRenderer().render(
+        EventSerializer(events, many=True, context=context).data)
+
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'Patchwork',
+    }
+    if webhook.secret:
+        signature = hmac.new(
+            webhook.secret.encode('utf-8'), data, hashlib.sha256)
+        headers['X-Patchwork-Signature'] = 'sha256=%s' % (
+            signature.hexdigest())
+
+    request = urllib.request.Request(
+        webhook.url, data=data, headers=headers, method='POST')
+
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            return response.status, ''
+    except urllib.error.HTTPError as exc:
+        return exc.code, str(exc)
+    except (urllib.error.URLError, OSError) as exc:
+        return None, str(exc)
+
+
+def deliver_webhook(webhook, context=None):
+    """Deliver the next batch of events to a webhook.
+
+    Returns the delivery, or None if there are no events to deliver.
+    """
+    if context is None:
+        context = _get_serializer_context()
+
+    # only settled events are delivered, so no event becomes visible with a
+    # lower ID than the last delivered once it has been delivered. Refer to
+    # 'EventQuerySet.settled'
+    events = Event.objects.settled().filter(
+        project=webhook.project_id, id__gt=webhook.last_event_id)
+    if webhook.get_categories():
+        events = events.filter(category__in=webhook.get_categories())
+
+    events = load_events(events.order_by('id')[:BATCH_SIZE])
+    if not events:
+        return None
+
+    status, error = _post(webhook, events, context)
+
+    delivery = WebhookDelivery.objects.create(
+        webhook=webhook, first_event_id=events[0].id,
+        last_event_id=events[-1].id, event_count=len(events),
+        success=not error, status=status, error=error)
+
+    if delivery.success:
+        webhook.last_event_id = delivery.last_event_id
+        webhook.failures = 0
+        webhook.next_attempt = None
+    else:
+        logger.warning('Failed to deliver events to webhook %d (%s): %s',
+                       webhook.id, webhook.url, error)
+        webhook.failures += 1
+        webhook.next_attempt = delivery.date + _get_retry_delay(
+            webhook.failures)
+
+    webhook.save(update_fields=['last_event_id', 'failures', 'next_attempt'])
+
+    return delivery
+
+
+def deliver_webhooks():
+    """Deliver new events to all webhooks that are due.
+
+    Events are delivered in batches until every webhook has received all
+    events or has failed, in which case it is retried later.
+
+    Returns the number of deliveries made.
+    """
+    now = datetime.datetime.utcnow()
+    webhooks = Webhook.objects.filter(active=True).filter(
+        Q(next_attempt__isnull=True) | Q(next_attempt__lte=now))
+
+    context = _get_serializer_context()
+    count = 0
+
+    for webhook in webhooks:
+        while True:
+            delivery = deliver_webhook(webhook, context)
+            if delivery is None:
+                break
+
+            count += 1
+            if not delivery.success:
+                break
+
+    return count